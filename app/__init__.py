@@ -1,11 +1,9 @@
-from flask import Flask
+# O app Flask (app/web.py) só é montado quando alguém pede `from app import app` (run.py, asgi.py).
+# Comandos como python -m app.schema e python -m app.worker importam só os módulos que usam.
 
-app=Flask(__name__)
 
-#Importa as rotas para registrar no app
-from app import routes
-
-from web_routes import register_web_routes  # ← LINHA NOVA
-
-# Registrar rotas da interface web
-register_web_routes(app)  # ← LINHA NOVA
\ No newline at end of file
+def __getattr__(nome):
+    if nome == "app":
+        from app.web import app
+        return app
+    raise AttributeError(f"module 'app' has no attribute {nome!r}")
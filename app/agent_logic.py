@@ -1,14 +1,28 @@
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import (HISTORICO_ORCAMENTO_TOKENS, RESPOSTA_CACHE_ATIVO, RESPOSTA_CACHE_TTL,
+                    RESPOSTA_CACHE_MAX_ITENS, RESPOSTA_CACHE_MAX_BYTES, RESPOSTA_CACHE_MAX_MENSAGENS)
+from app.utils.tokens import estimar_tokens_texto, recortar_por_orcamento
+from app.utils.resposta_cache import RespostaCache
+from app.utils.midia_pendente import trocar_urls_pendentes
+from app.utils.descricoes import (trocar_imagens_por_descricoes, fotos_a_descrever, instrucao_descricoes,
+                                  SeparadorDescricoes)
+from app.utils.clientes_http import openai_client, openai_client_async
 import sys
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = openai_client
+async_client = openai_client_async
 
-def gerar_resposta(historico):
-    if not historico:
-        historico = []
-    try:
-        mensagens = [{"role": "system", "content": """
+# Cache opcional de respostas para perguntas de abertura repetidas (só texto, sem histórico anterior)
+resposta_cache = RespostaCache(
+    max_itens=RESPOSTA_CACHE_MAX_ITENS,
+    ttl=RESPOSTA_CACHE_TTL,
+    max_bytes=RESPOSTA_CACHE_MAX_BYTES,
+    max_mensagens=RESPOSTA_CACHE_MAX_MENSAGENS,
+) if RESPOSTA_CACHE_ATIVO else None
+
+MODELO = "gpt-4o-mini"
+MENSAGEM_ERRO = "Desculpe, estou com dificuldades técnicas. Tente novamente em alguns minutos."
+
+SYSTEM_PROMPT = """
                                        Você é um chef de cozinha virtual especializado em receitas internacionais. 
                                        Seu papel é ajudar os usuários a criarem receitas incríveis com o que têm em casa, sugerir substituições de ingredientes, explicar técnicas culinárias e dar dicas de preparo. 
                                        Você deve ser simpático, encorajador e prático, falando como um chef experiente que quer que todos se sintam confiantes na cozinha.
@@ -25,18 +39,194 @@ def gerar_resposta(historico):
                                        - Se a resposta for longa, divida-a naturalmente usando quebras de linha duplas (\n\n) entre os parágrafos.
                                        - Use listas e tópicos sempre que possível para facilitar a leitura.
                                        - Evite blocos de texto muito densos.
-                                               """}] + historico
+                                               """
+
+
+def _mensagens_de_sistema(resumo=None):
+    mensagens = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if resumo:
+        # Resumo das mensagens antigas que já saíram da janela de histórico
+        mensagens.append({"role": "system", "content": f"Resumo da conversa até aqui:\n{resumo.texto}"})
+    return mensagens
+
+
+def janela_do_prompt(historico, resumo=None):
+    """
+    Retorna as mensagens do histórico que vão para o prompt: as posteriores ao trecho já resumido,
+    com as fotos antigas trocadas por descrição e recortadas para caber no orçamento de tokens.
+    """
+    historico = historico or []
+    if resumo:
+        # O que já está no resumo não se repete no prompt
+        historico = [m for m in historico if m.get("id", 0) > resumo.ultimo_id]
+    # Fotos de turnos anteriores vão como descrição em texto, se já houver uma
+    historico = trocar_imagens_por_descricoes(historico)
+    # Corta as mensagens mais antigas para o prompt caber no orçamento de tokens
+    orcamento = HISTORICO_ORCAMENTO_TOKENS - sum(estimar_tokens_texto(m["content"]) for m in _mensagens_de_sistema(resumo))
+    janela = recortar_por_orcamento(historico, orcamento)
+    if len(janela) < len(historico):
+        print(f"Histórico recortado para o orçamento de tokens: {len(janela)} de {len(historico)} mensagens", file=sys.stderr)
+    return janela
+
+
+def _montar_mensagens(historico, resumo=None):
+    """
+    resumo é o Resumo de app.utils.resumo (texto e id da última mensagem resumida) ou None.
+    Retorna (mensagens, fotos): fotos são as URLs das imagens do turno atual, que a resposta também descreve.
+    """
+    janela = janela_do_prompt(historico, resumo)
+    # Imagens ainda subindo para o Storage vão como data URL; o id das mensagens não vai para a OpenAI
+    mensagens = _mensagens_de_sistema(resumo) + [{"role": m["role"], "content": m["content"]}
+                                                 for m in trocar_urls_pendentes(janela)]
+    fotos = fotos_a_descrever(janela)
+    if fotos:
+        # A descrição das fotos para os próximos turnos vem nesta mesma chamada, depois da resposta
+        mensagens.append({"role": "system", "content": instrucao_descricoes(fotos)})
+    return mensagens, fotos
+
+
+def _chave_cache(historico, mensagens):
+    # A elegibilidade olha o histórico inteiro, não a janela já recortada pelo orçamento
+    return resposta_cache.chave(MODELO, mensagens, len(historico or [])) if resposta_cache else None
+
+
+def estatisticas_cache_respostas():
+    return resposta_cache.estatisticas() if resposta_cache else {}
+
+
+def gerar_resposta(historico, resumo=None, relancar=False):
+    """Com relancar=True, uma falha da OpenAI é relançada em vez de virar MENSAGEM_ERRO."""
+    try:
+        mensagens, fotos = _montar_mensagens(historico, resumo)
+        chave = _chave_cache(historico, mensagens)
+        if chave:
+            em_cache = resposta_cache.obter(chave)
+            if em_cache is not None:
+                return em_cache
         resposta = client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=MODELO,
             messages=mensagens
         )
-        return resposta.choices[0].message.content
+        separador = SeparadorDescricoes(fotos)
+        conteudo = resposta.choices[0].message.content
+        if conteudo:
+            conteudo = separador.filtrar(conteudo) + separador.concluir()
+        if chave and conteudo:
+            resposta_cache.definir(chave, conteudo)
+        return conteudo
     except Exception as e:
         print(f"ERRO ao gerar resposta do agente: {e}", file=sys.stderr)
-        return f"Desculpe, estou com dificuldades técnicas. Tente novamente em alguns minutos."
+        if relancar:
+            raise
+        return MENSAGEM_ERRO
 
 
+def gerar_resposta_stream(historico, resumo=None, relancar=False):
+    """
+    Versão em streaming de gerar_resposta: gera os pedaços de texto à medida que a OpenAI os devolve.
+    Em caso de erro antes do primeiro pedaço, gera a mesma mensagem de erro de gerar_resposta;
+    com relancar=True, o erro é relançado (o worker da fila decide entre nova tentativa e dead-letter).
+    """
+    enviou_algo = False
+    stream = None
+    try:
+        mensagens, fotos = _montar_mensagens(historico, resumo)
+        chave = _chave_cache(historico, mensagens)
+        if chave:
+            em_cache = resposta_cache.obter(chave)
+            if em_cache is not None:
+                yield em_cache
+                return
+        stream = client.chat.completions.create(
+            model=MODELO,
+            messages=mensagens,
+            stream=True
+        )
+        partes = []
+        separador = SeparadorDescricoes(fotos)
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content and separador.filtrar(chunk.choices[0].delta.content)
+            if delta:
+                enviou_algo = True
+                partes.append(delta)
+                yield delta
+        resto = separador.concluir()
+        if resto:
+            partes.append(resto)
+            yield resto
+        if chave and partes:
+            resposta_cache.definir(chave, ''.join(partes))
+    except Exception as e:
+        print(f"ERRO ao gerar resposta do agente (stream): {e}", file=sys.stderr)
+        if relancar:
+            raise
+        if not enviou_algo:
+            yield MENSAGEM_ERRO
+    finally:
+        if stream is not None:
+            stream.close()  # Libera a conexão se quem consome o gerador desistiu no meio
 
 
+async def gerar_resposta_async(historico, resumo=None):
+    """Versão assíncrona de gerar_resposta (AsyncOpenAI), usada pelo modo ASGI."""
+    try:
+        mensagens, fotos = _montar_mensagens(historico, resumo)
+        chave = _chave_cache(historico, mensagens)
+        if chave:
+            em_cache = resposta_cache.obter(chave)
+            if em_cache is not None:
+                return em_cache
+        resposta = await async_client.chat.completions.create(
+            model=MODELO,
+            messages=mensagens
+        )
+        separador = SeparadorDescricoes(fotos)
+        conteudo = resposta.choices[0].message.content
+        if conteudo:
+            conteudo = separador.filtrar(conteudo) + separador.concluir()
+        if chave and conteudo:
+            resposta_cache.definir(chave, conteudo)
+        return conteudo
+    except Exception as e:
+        print(f"ERRO ao gerar resposta do agente (async): {e}", file=sys.stderr)
+        return MENSAGEM_ERRO
 
 
+async def gerar_resposta_stream_async(historico, resumo=None):
+    """Versão assíncrona de gerar_resposta_stream, usada pelo modo ASGI."""
+    enviou_algo = False
+    try:
+        mensagens, fotos = _montar_mensagens(historico, resumo)
+        chave = _chave_cache(historico, mensagens)
+        if chave:
+            em_cache = resposta_cache.obter(chave)
+            if em_cache is not None:
+                yield em_cache
+                return
+        stream = await async_client.chat.completions.create(
+            model=MODELO,
+            messages=mensagens,
+            stream=True
+        )
+        partes = []
+        separador = SeparadorDescricoes(fotos)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content and separador.filtrar(chunk.choices[0].delta.content)
+            if delta:
+                enviou_algo = True
+                partes.append(delta)
+                yield delta
+        resto = separador.concluir()
+        if resto:
+            partes.append(resto)
+            yield resto
+        if chave and partes:
+            resposta_cache.definir(chave, ''.join(partes))
+    except Exception as e:
+        print(f"ERRO ao gerar resposta do agente (stream async): {e}", file=sys.stderr)
+        if not enviou_algo:
+            yield MENSAGEM_ERRO
@@ -0,0 +1,184 @@
+import json
+import logging
+import sys
+import traceback
+from datetime import datetime
+
+from app.agent_logic import gerar_resposta_async, gerar_resposta_stream_async, MENSAGEM_ERRO
+from app.utils.helpers_async import registrar_e_buscar_historico_async, registrar_resposta_async
+from app.utils.idempotencia import (chave_idempotencia, executar_idempotente_async, reservar_idempotente,
+                                    liberar_idempotente, EM_ANDAMENTO)
+from web_routes import (formatar_evento_sse, repetir_resposta_sse, resposta_guardavel, RESPOSTA_VAZIA,
+                        RESPOSTA_EM_ANDAMENTO)
+
+# Rotas de conversa servidas nativamente em asyncio pelo modo ASGI (asgi.py).
+# Mesmo contrato de /responder (app/routes.py) e de /api/chat e /api/chat/stream (web_routes.py),
+# mas sem prender uma thread enquanto esperam a OpenAI e o banco.
+
+
+async def _ler_corpo(receive):
+    corpo = b''
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'http.request':
+            corpo += mensagem.get('body', b'')
+            if not mensagem.get('more_body'):
+                return corpo
+        elif mensagem['type'] == 'http.disconnect':
+            return corpo
+
+
+def _cabecalho(scope, nome):
+    nome = nome.lower().encode('latin-1')
+    for chave, valor in scope.get('headers', []):
+        if chave == nome:
+            return valor.decode('latin-1')
+    return None
+
+
+async def _ler_json(scope, receive):
+    """Retorna (é_json, dados): é_json indica se o Content-Type é application/json."""
+    corpo = await _ler_corpo(receive)
+    tipo = (_cabecalho(scope, 'content-type') or '').split(';')[0].strip()
+    if tipo != 'application/json':
+        return False, None
+    try:
+        return True, json.loads(corpo or b'null')
+    except ValueError:
+        return True, None
+
+
+async def _enviar_json(send, dados, status=200):
+    corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(corpo)).encode())]})
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+async def responder_async(scope, receive, send):
+    _, data = await _ler_json(scope, receive)
+    data = data or {}
+    mensagem = data.get("mensagem")
+    user_id = data.get("user_id")
+
+    if not user_id or not mensagem:
+        return await _enviar_json(send, {"erro": "Campos 'user_id' e 'mensagem' são obrigatórios"}, 400)
+
+    async def executar():
+        historico = await registrar_e_buscar_historico_async(user_id, "user", mensagem)
+        resposta = await gerar_resposta_async(historico)
+        await registrar_resposta_async(user_id, resposta)
+        return resposta
+
+    chave = chave_idempotencia('responder', user_id, _cabecalho(scope, 'idempotency-key'))
+    try:
+        resposta = await executar_idempotente_async(chave, executar, guardar=lambda resposta: resposta != MENSAGEM_ERRO)
+        return await _enviar_json(send, {"resposta": resposta})
+    except Exception as erro:
+        print(f"ERRO em /responder (async): {erro}", file=sys.stderr)
+        return await _enviar_json(send, {"erro": str(erro)}, 500)
+
+
+async def _validar_chat(scope, receive, send):
+    """Valida o corpo de /api/chat e /api/chat/stream. Retorna (session_id, mensagem) ou None após responder o erro."""
+    e_json, data = await _ler_json(scope, receive)
+    if not e_json:
+        await _enviar_json(send, {'error': 'Content-Type deve ser application/json'}, 400)
+        return None
+    if not data:
+        await _enviar_json(send, {'error': 'Dados JSON inválidos'}, 400)
+        return None
+    user_message = (data.get('message') or '').strip()
+    session_id = data.get('session_id')
+    if not session_id:
+        await _enviar_json(send, {'error': 'session_id é obrigatório'}, 400)
+        return None
+    if not user_message:
+        await _enviar_json(send, {'error': 'Mensagem não pode estar vazia'}, 400)
+        return None
+    return session_id, user_message
+
+
+async def web_chat_async(scope, receive, send):
+    validado = await _validar_chat(scope, receive, send)
+    if not validado:
+        return
+    session_id, user_message = validado
+    logging.info(f"WEB_CHAT (async): Mensagem recebida na sessão {session_id}: {user_message[:100]}...")
+
+    async def executar():
+        historico_para_agente = await registrar_e_buscar_historico_async(session_id, "user", user_message)
+        bot_response = await gerar_resposta_async(historico_para_agente)
+        if not bot_response:
+            bot_response = RESPOSTA_VAZIA
+        await registrar_resposta_async(session_id, bot_response)
+        return {
+            'response': bot_response,
+            'timestamp': datetime.now().isoformat(),
+            'status': 'success'
+        }
+
+    chave = chave_idempotencia('api_chat', session_id, _cabecalho(scope, 'idempotency-key'))
+    try:
+        return await _enviar_json(send, await executar_idempotente_async(chave, executar, guardar=resposta_guardavel))
+    except Exception as e:
+        logging.error(f"WEB_CHAT (async): Erro interno no chat web: {str(e)}\nTraceback: {traceback.format_exc()}")
+        return await _enviar_json(send, {'error': f'Erro interno do servidor: {str(e)}', 'status': 'error'}, 500)
+
+
+async def web_chat_stream_async(scope, receive, send):
+    validado = await _validar_chat(scope, receive, send)
+    if not validado:
+        return
+    session_id, user_message = validado
+    cabecalhos_sse = [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                      (b'x-accel-buffering', b'no')]
+
+    chave = chave_idempotencia('api_chat_stream', session_id, _cabecalho(scope, 'idempotency-key'))
+    anterior = reservar_idempotente(chave)
+    if anterior is EM_ANDAMENTO:
+        return await _enviar_json(send, RESPOSTA_EM_ANDAMENTO, 409)
+    if anterior is not None:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': cabecalhos_sse})
+        return await send({'type': 'http.response.body', 'body': repetir_resposta_sse(anterior).encode('utf-8')})
+
+    guardado = None
+    try:
+        try:
+            historico_para_agente = await registrar_e_buscar_historico_async(session_id, "user", user_message)
+        except Exception as e:
+            logging.error(f"WEB_CHAT (async): Erro interno no chat web (stream): {str(e)}\nTraceback: {traceback.format_exc()}")
+            return await _enviar_json(send, {'error': f'Erro interno do servidor: {str(e)}', 'status': 'error'}, 500)
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': cabecalhos_sse})
+        partes = []
+        conectado = True
+        # Se o cliente desconectar, o stream continua até o fim para que a resposta completa seja salva.
+        async for delta in gerar_resposta_stream_async(historico_para_agente):
+            partes.append(delta)
+            if conectado:
+                try:
+                    await send({'type': 'http.response.body', 'body': formatar_evento_sse({'delta': delta}).encode('utf-8'),
+                                'more_body': True})
+                except Exception:
+                    conectado = False
+        bot_response = ''.join(partes) or RESPOSTA_VAZIA
+        try:
+            await registrar_resposta_async(session_id, bot_response)
+            final = {'status': 'success', 'timestamp': datetime.now().isoformat()}
+            if resposta_guardavel({'response': bot_response}):
+                guardado = {'response': bot_response, **final}
+        except Exception as e:
+            logging.error(f"WEB_CHAT (async): Erro ao salvar resposta (stream) da sessão {session_id}: {str(e)}")
+            final = {'status': 'error', 'error': 'Resposta gerada, mas não foi possível salvá-la.'}
+        if conectado:
+            await send({'type': 'http.response.body', 'body': formatar_evento_sse(final, evento='done').encode('utf-8')})
+    finally:
+        liberar_idempotente(chave, guardado)
+
+
+ROTAS_ASYNC = {
+    ('POST', '/responder'): responder_async,
+    ('POST', '/api/chat'): web_chat_async,
+    ('POST', '/api/chat/stream'): web_chat_stream_async,
+}
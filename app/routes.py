@@ -1,172 +1,54 @@
 from flask import request, jsonify
 import sys
-from app import app
+from app.web import app
 import os
-import string
-from app.utils.supabase_client import upload_file_to_supabase, SUPABASE_LIBRARY_URL
-from app.agent_logic import gerar_resposta
-from app.utils.helpers import inserir_mensagem, get_file_url_telegram, download_file,enviar_mensagem_telegram, buscar_historico, deletar_historico, transcrever_audio, split_long_message
+from app.agent_logic import gerar_resposta, MENSAGEM_ERRO
+from config import FILA_BACKEND, FILA_MAX_TENTATIVAS, HISTORICO_LIMITE, ALBUM_JANELA_SEGUNDOS
+from app.telegram_handlers import processar_update, tipo_do_update
+from app.utils.dispatcher import despachante, FilaCheia
+from app.utils.job_queue import enfileirar_job, enfileirar_foto_de_album
+from app.utils.helpers import (registrar_e_buscar_historico, registrar_resposta, deletar_historico,
+                               buscar_pagina_historico, etag_historico)
+from app.utils.idempotencia import updates_vistos, chave_idempotencia, executar_idempotente
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-SUPABASE_BUCKET_NAME = "chat-media"
 
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
     data = request.get_json()
 
-    if "message" in data:
+    # Responde ao Telegram na hora; o processamento (download, transcrição, OpenAI, envio)
+    # roda no despachante (ou nos workers da fila no Postgres), um job por vez para cada chat_id.
+    if data and "message" in data:
         chat_id = data['message']['chat']['id']
-        if "text" in data["message"]:
-            mensagem = data['message'].get('text', '')
-            print(f"Chat ID: {chat_id}, Texto: {mensagem}", file=sys.stderr)
-            try:
-                inserir_mensagem(str(chat_id), "user", mensagem)
-                historico = buscar_historico(str(chat_id))
-                print(f"Histórico enviado para OpenAI: {historico}", file=sys.stderr)
-                resposta = gerar_resposta(historico)
-                inserir_mensagem(str(chat_id), "assistant", resposta)
-                print("Resposta gerada:", resposta, file=sys.stderr)
-                mensagens_formatadas= split_long_message(resposta)
-                for msg in mensagens_formatadas:
-                    enviar_mensagem_telegram(chat_id, msg)
-
-            except Exception as e:
-                print("Erro no processamento:", e, file=sys.stderr)
-
-        elif "photo" in data["message"]:
-            photo = data['message']['photo'][-1]
-            file_id = photo['file_id']
-            caption = data['message'].get('caption', '')
-            print(f"Chat ID: {chat_id}, Foto File ID: {file_id}, Legenda: '{caption}'", file=sys.stderr)
-
-            temp_file_path = None  # Inicializa para garantir que exista
-            try:
-                # Obter URL do TELEGRAM
-                image_url_telegram = get_file_url_telegram(file_id)
-                if image_url_telegram:
-                    # 2. Baixar o arquivo
-                    temp_file_path = f"/tmp/{file_id}.jpg"
-                    download_file(image_url_telegram, temp_file_path)
-
-                    # 3. Upload para Supabase
-                    supabase_file_name = f"telegram_photos/{file_id}.jpg"
-                    # Chama a função de upload que agora retorna True/False
-                    upload_success = upload_file_to_supabase(temp_file_path, SUPABASE_BUCKET_NAME, supabase_file_name)
-
-                    if upload_success:
-                        # CONSTRÓI A URL PÚBLICA MANUALMENTE AQUI
-                        # Substitua 'SUPABASE_URL' pela sua variável que contém 'https://ohwzezjffhjhetzsnjdd.supabase.co'
-                        supabase_public_url = f"{SUPABASE_LIBRARY_URL}/storage/v1/object/public/{SUPABASE_BUCKET_NAME}/{supabase_file_name}"
-
-                        content = []
-                        if caption:
-                            content.append({"type": "text", "text": caption})
-                        content.append(
-                            {"type": "image_url", "image_url": {"url": supabase_public_url}})  # Usa a URL construída
-
-                        # 5. Inserir mensagem com conteúdo multimodal
-                        inserir_mensagem(str(chat_id), "user", content)
-
-                        # 6. Buscar histórico e gerar resposta
-                        historico = buscar_historico(str(chat_id))
-                        print(f"Histórico enviado para OpenAI: {historico}", file=sys.stderr)
-                        resposta = gerar_resposta(historico)
-                        inserir_mensagem(str(chat_id), "assistant", resposta)
-
-                        mensagens_formatadas = split_long_message(resposta)
-                        for msg in mensagens_formatadas:
-                            enviar_mensagem_telegram(chat_id, msg)
+        update_id = data.get('update_id')
+        # O Telegram reenvia o update se a resposta demorar ou falhar; o reenvio de um já aceito é só confirmado.
+        if update_id is not None and not updates_vistos.marcar(update_id):
+            print(f"Update {update_id} do chat {chat_id} repetido; ignorado.", file=sys.stderr)
+            return jsonify({"status": "ok"}), 200
+        if FILA_BACKEND == 'postgres':
+            tipo = tipo_do_update(data)
+            if tipo:
+                try:
+                    if tipo == 'photo' and data['message'].get('media_group_id'):
+                        # Fotos de um álbum viram um job só, seja qual for o processo que recebeu cada uma
+                        enfileirar_foto_de_album(chat_id, data['message'], ALBUM_JANELA_SEGUNDOS,
+                                                 max_tentativas=FILA_MAX_TENTATIVAS)
                     else:
-                        enviar_mensagem_telegram(chat_id, "Desculpe, não consegui armazenar a imagem.")
-                else:
-                    enviar_mensagem_telegram(chat_id, "Desculpe, não consegui obter a imagem do Telegram.")
-            except Exception as e:
-                print(f"Erro no processamento de foto: {e}", file=sys.stderr)
-                enviar_mensagem_telegram(chat_id, "Desculpe, ocorreu um erro ao processar a foto.")
-            finally:
-                # 8. Limpar arquivo temporário, garantindo que seja removido
-                if temp_file_path and os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-
-        elif "audio" in data["message"]:
-            audio = data['message']['audio']
-            file_id = audio['file_id']
-            print(f"Chat ID: {chat_id}, Audio: {file_id}", file=sys.stderr)
-            temp_file_path = None  # Inicializa a variável para garantir que exista
-            try:
-                # 1. Obter a URL do Telegram
-                audio_url_telegram = get_file_url_telegram(file_id)
-                if audio_url_telegram:
-                    # 2. Baixar o arquivo (vamos usar .ogg, que é comum para voz)
-                    print ("Url de áudio temporário do telegram foi pega")
-                    temp_file_path = f"/tmp/{file_id}.ogg"
-                    download_file(audio_url_telegram, temp_file_path)
-                    print("Url de áudio temporário do telegram foi baixada")
-                    # 3. Transcrever o áudio
-                    transcribed_text = transcrever_audio(temp_file_path)
-                    print("Url de áudio temporário do telegram foi trancrita")
-                    # 4. Inserir a mensagem transcrita no histórico (como texto)
-                    inserir_mensagem(str(chat_id), "user", transcribed_text)
-                    print("Transcrição foi inserida no histórico")
-                    # 5. Gerar a resposta do agente
-                    historico = buscar_historico(str(chat_id))
-                    print(f"Histórico enviado para OpenAI: {historico}", file=sys.stderr)
-                    resposta = gerar_resposta(historico)
-                    # 6. Inserir a resposta do assistente e enviar
-                    inserir_mensagem(str(chat_id), "assistant", resposta)
-                    mensagens_formatadas = split_long_message(resposta)
-                    for msg in mensagens_formatadas:
-                        enviar_mensagem_telegram(chat_id, msg)
-                else:
-                    enviar_mensagem_telegram(chat_id, "Desculpe, não consegui obter seu áudio do Telegram.")
-            except Exception as e:
-                print(f"Erro no processamento de áudio: {e}", file=sys.stderr)
-                enviar_mensagem_telegram(chat_id, "Desculpe, ocorreu um erro ao processar seu áudio.")
-            finally:
-                # 7. Limpar arquivo temporário, garantindo que seja removido mesmo em caso de erro
-                if temp_file_path and os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-
-        elif "voice" in data["message"]: # <<< NOVO BLOCO PARA MENSAGENS DE VOZ
-            voice = data['message']['voice']
-            file_id = voice['file_id']
-            print(f"Chat ID: {chat_id}, Voice File ID: {file_id}", file=sys.stderr)
-            temp_file_path = None
-            try:
-                voice_url_telegram = get_file_url_telegram(file_id)
-                if voice_url_telegram:
-                    temp_file_path = f"/tmp/{file_id}.ogg" # Mensagens de voz geralmente são .ogg
-                    download_file(voice_url_telegram, temp_file_path)
-                    transcribed_text = transcrever_audio(temp_file_path)
-                    print(f"Texto transcrito da VOZ: {transcribed_text}", file=sys.stderr) # Debug print
-                    inserir_mensagem(str(chat_id), "user", transcribed_text)
-                    historico = buscar_historico(str(chat_id))
-                    print(f'Histórico enviado para OpenAI: {historico}', file=sys.stderr)
-                    resposta = gerar_resposta(historico)
-                    inserir_mensagem(str(chat_id), "assistant", resposta)
-                    mensagens_formatadas = split_long_message(resposta)
-                    for msg in mensagens_formatadas:
-                        enviar_mensagem_telegram(chat_id, msg)
-                else:
-                    enviar_mensagem_telegram(chat_id, "Desculpe, não consegui obter sua mensagem de voz.")
-            except Exception as e:
-                print(f"ERRO no processamento da mensagem de voz: {e}", file=sys.stderr)
-                enviar_mensagem_telegram(chat_id, "Desculpe, ocorreu um erro ao processar sua mensagem de voz.")
-            finally:
-                if temp_file_path and os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-
-        elif "video" in data["message"]:
-            video_file_id = data['message']['video']['file_id']
-            caption = data['message'].get('caption', '')
-            print(
-                f"Chat ID: {chat_id}, Vídeo File ID: {video_file_id}, Legenda: '{caption}' (sem suporte para processamento)",
-                file=sys.stderr)
-
-            # Envia uma mensagem amigável de volta ao usuário
-            enviar_mensagem_telegram(chat_id,
-                                     "Desculpe, ainda não consigo processar vídeos. Por favor, envie uma foto, um áudio ou um texto.")
+                        enfileirar_job(tipo, chat_id, data, max_tentativas=FILA_MAX_TENTATIVAS, update_id=update_id)
+                except Exception as e:
+                    print(f"ERRO: Falha ao enfileirar update do chat {chat_id}. Erro: {e}", file=sys.stderr)
+                    updates_vistos.esquecer(update_id)
+                    return jsonify({"status": "error"}), 503
+            return jsonify({"status": "ok"}), 200
+        try:
+            despachante.submeter(chat_id, processar_update, data)
+        except FilaCheia as e:
+            # Sem capacidade agora: o Telegram reenviará o update mais tarde.
+            print(f"AVISO: Update recusado para chat {chat_id}. {e}", file=sys.stderr)
+            updates_vistos.esquecer(update_id)
+            return jsonify({"status": "busy"}), 503
 
     return jsonify({"status": "ok"}), 200
 
@@ -182,13 +64,17 @@ def responder():
     if not user_id or not mensagem:
         return jsonify({"erro": "Campos 'user_id' e 'mensagem' são obrigatórios"}), 400
 
-    try:
-        inserir_mensagem(user_id, "user",  mensagem)
-        historico=buscar_historico(user_id)
+    def executar():
+        historico = registrar_e_buscar_historico(user_id, "user", mensagem)
         resposta = gerar_resposta(historico)
+        registrar_resposta(user_id, resposta)
+        return resposta
 
-
-        inserir_mensagem(user_id, "assistant", resposta)
+    # Com Idempotency-Key, a repetição da requisição (ex.: retry do cliente) devolve a mesma resposta
+    # sem gravar a mensagem nem chamar a OpenAI de novo. O pedido de desculpas de uma falha não fica guardado.
+    chave = chave_idempotencia('responder', user_id, request.headers.get('Idempotency-Key'))
+    try:
+        resposta = executar_idempotente(chave, executar, guardar=lambda resposta: resposta != MENSAGEM_ERRO)
         return jsonify({"resposta": resposta})
     except Exception as erro:
         return jsonify({"erro": str(erro)}), 500
@@ -196,14 +82,33 @@ def responder():
 
 @app.route('/historico', methods=['GET'])
 def historico():
+    # Paginação por id: before_id (anteriores), since_id (só as novas) e limit.
+    # O ETag é a versão do histórico (não depende de since_id): If-None-Match igual a ela responde 304.
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify("user_id obrigatório"), 400
+    before_id = request.args.get('before_id', type=int)
+    since_id = request.args.get('since_id', type=int)
+    limit = request.args.get('limit', HISTORICO_LIMITE, type=int)
     try:
-        historico = buscar_historico(user_id)
-        if not historico:
-            return jsonify("Sem histórico"), 400
-        return jsonify({"historico": historico})
+        etag, ultimo_id, quantidade = etag_historico(user_id, before_id, limit)
+        if request.if_none_match.contains_weak(etag):
+            resposta = app.response_class(status=304)
+        else:
+            # A página sai da mesma versão do ETag, mesmo com a janela em cache de outro processo atrasada
+            registros, ha_mais = buscar_pagina_historico(user_id, before_id, since_id, limit, ate=ultimo_id)
+            if not registros and before_id is None and since_id is None:
+                return jsonify("Sem histórico"), 400
+            resposta = jsonify({
+                "historico": [{"id": mensagem_id, "role": role, "content": content}
+                              for mensagem_id, role, content in registros],
+                "ha_mais": ha_mais,
+                "ultimo_id": ultimo_id,
+                "quantidade": quantidade,  # Mensagens do usuário nesta versão, inclusive as fora da página
+            })
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'private, no-cache'
+        return resposta
     except Exception as erro:
         return jsonify({'erro': str(erro)}), 500
 
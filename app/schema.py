@@ -0,0 +1,285 @@
+"""
+Estrutura do banco: tabela de mensagens, índices, preenchimento de criado_em e limpeza de sessões web antigas.
+
+Uso:
+    python -m app.schema            # cria/ajusta tabelas e índices (pode rodar a cada deploy)
+    python -m app.schema limpar     # apaga (ou arquiva) sessões web paradas há RETENCAO_SESSOES_DIAS dias
+
+Os índices grandes são criados com CONCURRENTLY, sem travar as gravações, e a limpeza e o preenchimento
+de criado_em andam em lotes pequenos, cada um na sua transação, para nunca segurar locks por muito tempo.
+
+Instalações novas podem particionar a tabela por hash de user_id (HISTORICO_PARTICOES): toda leitura de
+histórico filtra por user_id e vai a uma partição só. As partições são criadas junto com a tabela e não
+precisam de manutenção.
+"""
+import sys
+import time
+
+from config import (HISTORICO_PARTICOES, HISTORICO_CRIADO_EM_LEGADO, RETENCAO_SESSOES_DIAS, RETENCAO_LOTE,
+                    RETENCAO_PAUSA_SEGUNDOS, RETENCAO_ARQUIVAR)
+from app.utils.helpers import db_connection
+from app.utils.job_queue import garantir_tabela_jobs
+from app.utils.midia_cache import garantir_tabela_midias
+from app.utils.resumo import garantir_tabela_resumos, invalidar_resumo
+
+# Instalação nova: a tabela de mensagens não existe ainda
+DDL_MENSAGENS = """
+CREATE TABLE IF NOT EXISTS tabelademensagens (
+    id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    messages JSONB NOT NULL,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Variante particionada por hash de user_id. A chave primária precisa incluir a coluna de partição.
+DDL_MENSAGENS_PARTICIONADA = """
+CREATE TABLE IF NOT EXISTS tabelademensagens (
+    id BIGSERIAL,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    messages JSONB NOT NULL,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, user_id)
+) PARTITION BY HASH (user_id);
+"""
+
+# Tabelas antigas não tinham criado_em. A coluna entra sem valor (sem reescrever a tabela) e o default vale só
+# para as mensagens novas: as antigas ficam NULL até o preenchimento explícito de preencher_criado_em()
+DDL_CRIADO_EM = """
+ALTER TABLE tabelademensagens ADD COLUMN IF NOT EXISTS criado_em TIMESTAMPTZ;
+ALTER TABLE tabelademensagens ALTER COLUMN criado_em SET DEFAULT now();
+"""
+
+DDL_ARQUIVO = """
+CREATE TABLE IF NOT EXISTS tabelademensagens_arquivo (
+    id BIGINT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    messages JSONB NOT NULL,
+    criado_em TIMESTAMPTZ NOT NULL,
+    arquivado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Todas as leituras de histórico filtram por user_id e ordenam por id DESC. O INCLUDE (role, criado_em)
+# deixa a versão do histórico (ETag), os cursores por id e a checagem de atividade da limpeza só no índice,
+# sem ler o jsonb. O BRIN em criado_em é minúsculo e basta para achar as linhas antigas numa tabela só de inserção.
+INDICES = [
+    ("idx_mensagens_user_id_desc", "tabelademensagens (user_id, id DESC) INCLUDE (role, criado_em)"),
+    ("idx_mensagens_criado_em_brin", "tabelademensagens USING brin (criado_em)"),
+]
+
+# Sessões da interface web usam um UUID v4 gerado no navegador; chats do Telegram são números e não expiram
+SESSAO_WEB = r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$"
+
+# A tabela é percorrida em faixas de FAIXA_IDS ids (pela chave primária), juntando as sessões web com
+# mensagens anteriores ao corte; a varredura termina na primeira faixa que já é toda recente.
+FAIXA_IDS = 10000
+SQL_FAIXA = """
+SELECT max(id), min(criado_em) >= now() - make_interval(days => %(dias)s),
+       array_agg(DISTINCT user_id) FILTER (WHERE user_id ~ %(sessao_web)s
+                                            AND criado_em < now() - make_interval(days => %(dias)s))
+  FROM (SELECT id, user_id, criado_em FROM tabelademensagens WHERE id > %(depois_de)s ORDER BY id LIMIT %(faixa)s) faixa
+"""
+
+# A sessão está parada se a mensagem mais recente é anterior ao corte (só o índice (user_id, id DESC) é lido)
+SQL_SESSAO_PARADA = """
+SELECT criado_em < now() - make_interval(days => %s) FROM tabelademensagens WHERE user_id = %s ORDER BY id DESC LIMIT 1
+"""
+
+# Um lote de mensagens da sessão; a condição é conferida de novo para não apagar uma sessão que voltou a ser usada
+SQL_LOTE_SESSAO = """
+SELECT id FROM tabelademensagens
+ WHERE user_id = %(user_id)s
+   AND NOT EXISTS (SELECT 1 FROM tabelademensagens n
+                    WHERE n.user_id = %(user_id)s AND n.criado_em >= now() - make_interval(days => %(dias)s))
+ ORDER BY id LIMIT %(lote)s
+"""
+
+
+def _executar_autocommit(sql, params=()):
+    """Executa fora de transação (exigido por CREATE/DROP INDEX CONCURRENTLY)."""
+    with db_connection() as conn:
+        conn.rollback()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+        finally:
+            conn.autocommit = False
+
+
+def _consultar(sql, params=()):
+    """Executa e confirma; retorna as linhas, ou None para comandos sem resultado."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        linhas = cur.fetchall() if cur.description else None
+        conn.commit()
+    return linhas
+
+
+def tabela_particionada():
+    linhas = _consultar("SELECT relkind FROM pg_class WHERE oid = to_regclass('tabelademensagens')")
+    return bool(linhas) and linhas[0][0] == 'p'
+
+
+def garantir_tabela_mensagens():
+    """Cria a tabela (particionada se HISTORICO_PARTICOES e ela ainda não existir) e a coluna criado_em."""
+    existe = _consultar("SELECT to_regclass('tabelademensagens') IS NOT NULL")[0][0]
+    if not existe:
+        _criar_tabela_mensagens(HISTORICO_PARTICOES)
+    elif HISTORICO_PARTICOES and not tabela_particionada():
+        # Converter uma tabela existente exige copiar os dados; fica para uma migração manual
+        print("AVISO: tabelademensagens já existe sem partições; HISTORICO_PARTICOES só vale para tabelas novas.",
+              file=sys.stderr)
+    _consultar(DDL_CRIADO_EM)
+    preencher_criado_em()
+
+
+def _criar_tabela_mensagens(particoes):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(DDL_MENSAGENS_PARTICIONADA if particoes else DDL_MENSAGENS)
+        for resto in range(particoes):
+            cur.execute(f"""CREATE TABLE tabelademensagens_p{resto} PARTITION OF tabelademensagens
+                            FOR VALUES WITH (MODULUS {particoes}, REMAINDER {resto})""")
+        conn.commit()
+    print(f"Tabela tabelademensagens criada{f' ({particoes} partições por user_id)' if particoes else ''}",
+          file=sys.stderr)
+
+
+def preencher_criado_em(data_legado=HISTORICO_CRIADO_EM_LEGADO, pausa=RETENCAO_PAUSA_SEGUNDOS):
+    """
+    Grava data_legado em criado_em das mensagens anteriores à coluna, em faixas de FAIXA_IDS ids, e depois
+    marca a coluna NOT NULL. Um preenchimento interrompido continua no próximo deploy; com a coluna já
+    NOT NULL (tabela nova ou preenchimento concluído), não faz nada. Retorna quantas mensagens preencheu.
+    """
+    if _consultar("""SELECT attnotnull FROM pg_attribute
+                      WHERE attrelid = 'tabelademensagens'::regclass AND attname = 'criado_em'""")[0][0]:
+        return 0
+    # Com o default já valendo, as linhas sem criado_em são só as antigas: todas até este id
+    ultimo_id = _consultar("SELECT max(id) FROM tabelademensagens WHERE criado_em IS NULL")[0][0]
+    total = 0
+    depois_de = 0
+    while ultimo_id is not None and depois_de < ultimo_id:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""UPDATE tabelademensagens SET criado_em = %s
+                            WHERE id > %s AND id <= %s AND criado_em IS NULL""",
+                        (data_legado, depois_de, depois_de + FAIXA_IDS))
+            total += cur.rowcount
+            conn.commit()
+        depois_de += FAIXA_IDS
+        time.sleep(pausa)
+    _consultar("ALTER TABLE tabelademensagens ALTER COLUMN criado_em SET NOT NULL")
+    if total:
+        print(f"criado_em preenchido com {data_legado} em {total} mensagens antigas", file=sys.stderr)
+    return total
+
+
+def garantir_indices():
+    """Cria os índices que faltam. Um índice inválido (CONCURRENTLY interrompido) é recriado."""
+    particionada = tabela_particionada()
+    for nome, definicao in INDICES:
+        linhas = _consultar("""SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                                WHERE c.relname = %s""", (nome,))
+        if linhas and linhas[0][0]:
+            continue
+        if linhas:
+            print(f"AVISO: Índice {nome} inválido, recriando.", file=sys.stderr)
+            _executar_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+        # Em tabela particionada o índice vai para cada partição e CONCURRENTLY não é aceito
+        concorrente = "" if particionada else "CONCURRENTLY "
+        inicio = time.monotonic()
+        _executar_autocommit(f"CREATE INDEX {concorrente}IF NOT EXISTS {nome} ON {definicao}")
+        print(f"Índice {nome} criado em {time.monotonic() - inicio:.1f}s", file=sys.stderr)
+
+
+def garantir_schema():
+    """Tudo o que o app espera encontrar no banco; pode rodar a cada deploy."""
+    garantir_tabela_mensagens()
+    garantir_indices()
+    if RETENCAO_ARQUIVAR:
+        _consultar(DDL_ARQUIVO)
+    garantir_tabela_jobs()
+    garantir_tabela_resumos()
+    garantir_tabela_midias()
+
+
+def _apagar_lote(user_id, dias, lote, arquivar):
+    params = {"user_id": user_id, "dias": dias, "lote": lote}
+    if arquivar:
+        sql = f"""WITH apagadas AS (
+                     DELETE FROM tabelademensagens WHERE id IN ({SQL_LOTE_SESSAO})
+                     RETURNING id, user_id, role, messages, criado_em)
+                  INSERT INTO tabelademensagens_arquivo (id, user_id, role, messages, criado_em)
+                  SELECT id, user_id, role, messages, criado_em FROM apagadas ON CONFLICT (id) DO NOTHING"""
+    else:
+        sql = f"DELETE FROM tabelademensagens WHERE id IN ({SQL_LOTE_SESSAO})"
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        apagadas = cur.rowcount
+        conn.commit()
+    return apagadas
+
+
+def limpar_sessoes_paradas(dias=RETENCAO_SESSOES_DIAS, lote=RETENCAO_LOTE, pausa=RETENCAO_PAUSA_SEGUNDOS,
+                           arquivar=RETENCAO_ARQUIVAR):
+    """
+    Apaga (ou move para tabelademensagens_arquivo) as sessões web sem mensagens há `dias` dias, em lotes de
+    `lote` linhas com `pausa` segundos entre eles. Retorna (sessões, mensagens) removidas.
+    """
+    if arquivar:
+        _consultar(DDL_ARQUIVO)
+    verificadas = set()
+    total_sessoes = total_mensagens = 0
+    depois_de = 0
+    while True:
+        ultimo_id, faixa_recente, candidatas = _consultar(SQL_FAIXA, {
+            "dias": dias, "sessao_web": SESSAO_WEB, "depois_de": depois_de, "faixa": FAIXA_IDS})[0]
+        if ultimo_id is None:
+            break
+        for user_id in candidatas or []:
+            if user_id in verificadas:
+                continue
+            verificadas.add(user_id)
+            parada = _consultar(SQL_SESSAO_PARADA, (dias, user_id))
+            if not parada or not parada[0][0]:
+                continue
+            while True:
+                apagadas = _apagar_lote(user_id, dias, lote, arquivar)
+                total_mensagens += apagadas
+                if apagadas < lote:
+                    break
+                time.sleep(pausa)
+            # Apaga o resumo guardado no banco. Os caches em memória (janela de histórico, resumo) são de cada
+            # processo e este comando roda à parte: nos processos web eles expiram pelo TTL, e a janela em
+            # cache é conferida no banco antes de ser usada (HISTORICO_CACHE_VALIDAR)
+            invalidar_resumo(user_id)
+            total_sessoes += 1
+        if faixa_recente:
+            break
+        depois_de = ultimo_id
+        if candidatas:
+            print(f"Limpeza: {total_sessoes} sessões e {total_mensagens} mensagens removidas até o id {ultimo_id}",
+                  file=sys.stderr)
+        time.sleep(pausa)
+    return total_sessoes, total_mensagens
+
+
+def main():
+    comando = sys.argv[1] if len(sys.argv) > 1 else "garantir"
+    if comando == "garantir":
+        garantir_schema()
+        print("Schema verificado.", file=sys.stderr)
+    elif comando == "limpar":
+        sessoes, mensagens = limpar_sessoes_paradas()
+        print(f"Limpeza concluída: {sessoes} sessões e {mensagens} mensagens "
+              f"{'arquivadas' if RETENCAO_ARQUIVAR else 'apagadas'}.", file=sys.stderr)
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
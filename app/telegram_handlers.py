@@ -0,0 +1,537 @@
+import hashlib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (MIDIA_UPLOAD_ADIADO, DESPACHANTE_WORKERS, DESPACHANTE_MAX_PENDENTES, FILA_BACKEND, FILA_MAX_TENTATIVAS,
+                    FILA_CONFERIR_MENSAGEM_NOVA, COALESCER_JANELA_SEGUNDOS, ALBUM_JANELA_SEGUNDOS, ALBUM_PARALELISMO,
+                    IMAGEM_LADO_ALVO, IMAGEM_DETALHE, IMAGEM_REDIMENSIONAR, IMAGEM_QUALIDADE_JPEG)
+from app.utils.supabase_client import upload_bytes_to_supabase, SUPABASE_LIBRARY_URL
+from app.agent_logic import gerar_resposta_stream, janela_do_prompt
+from app.utils.resumo import buscar_resumo, registrar_turno
+from app.utils.helpers import registrar_e_buscar_historico, registrar_mensagens, registrar_resposta, buscar_historico, get_file_url_telegram, baixar_arquivo, substituir_imagem_no_historico
+from app.utils.paragrafos import iterar_paragrafos
+from app.utils.dispatcher import DespachantePorChat, despachante
+from app.utils.coalescedor import Coalescedor
+from app.utils.desligamento import registrar_etapa
+from app.utils.envio_telegram import agendar_mensagem_telegram
+from app.utils.job_queue import agendar_resposta, enfileirar_foto_de_album, resposta_agendada, marcar_resposta_seguinte
+from app.utils.midia_cache import buscar_midia, registrar_midia, sha256_do_buffer
+from app.utils.midia_pendente import marcar_pendente, concluir_pendente
+from app.utils.descricoes import obter_descricao
+from app.utils.transcricao import transcrever, verificar_tamanho, AudioGrandeDemais
+from app.utils.imagens import escolher_tamanho_foto, reduzir_imagem, tokens_visao, registrar_economia
+
+SUPABASE_BUCKET_NAME = "chat-media"
+IMAGEM_INDISPONIVEL = "[O usuário enviou uma imagem que não pôde ser armazenada.]"
+
+# Mensagens seguidas do mesmo chat viram uma resposta só. As respostas rodam num despachante próprio
+# (uma por chat de cada vez), para que as mensagens novas continuem sendo gravadas enquanto uma resposta
+# é gerada e possam interrompê-la. Com a fila no Postgres, o agrupamento é feito pelo job 'responder'
+# (job_queue.agendar_resposta), que sobrevive ao processo e é refeito se falhar.
+despachante_respostas = DespachantePorChat(max_workers=DESPACHANTE_WORKERS, max_pendentes=DESPACHANTE_MAX_PENDENTES,
+                                           nome="despachante-respostas")
+coalescedor = Coalescedor(COALESCER_JANELA_SEGUNDOS, lambda chat_id, geracao: despachante_respostas.submeter(
+    chat_id, responder_agrupado, chat_id, geracao), nome="coalescedor-telegram")
+
+# Fotos de um álbum (mesmo media_group_id) chegam em updates separados: são juntadas por
+# ALBUM_JANELA_SEGUNDOS e baixadas/armazenadas em paralelo. Em memória, como o despachante, o álbum só
+# fica inteiro com um processo recebendo o webhook; com a fila no Postgres ele é montado na tabela de jobs
+# (job_queue.enfileirar_foto_de_album) e processado por um worker só.
+_albuns = {}  # media_group_id -> (chat_id, [mensagens])
+_albuns_lock = threading.Lock()
+_executor_fotos = ThreadPoolExecutor(max_workers=ALBUM_PARALELISMO, thread_name_prefix="fotos-album")
+coalescedor_albuns = Coalescedor(ALBUM_JANELA_SEGUNDOS, lambda media_group_id, geracao: _disparar_album(
+    media_group_id, geracao), nome="coalescedor-albuns")
+
+# Uploads adiados de fotos, um por objeto, fora do caminho da resposta
+despachante_uploads = DespachantePorChat(max_workers=2, max_pendentes=200, nome="despachante-uploads")
+
+
+# Desligamento na ordem em que o trabalho flui: álbuns incompletos e updates em andamento (despachante,
+# etapa 20) gravam mensagens e abrem janelas, as janelas abertas viram respostas, e as respostas agendam
+# envios (etapa 60) e liberam os uploads das fotos.
+registrar_etapa(10, "albuns", lambda timeout: coalescedor_albuns.disparar_pendentes())
+registrar_etapa(30, "coalescedor-telegram", lambda timeout: coalescedor.disparar_pendentes())
+registrar_etapa(40, despachante_respostas.nome, despachante_respostas.desligar)
+registrar_etapa(50, despachante_uploads.nome, despachante_uploads.desligar)
+
+
+TIPOS_SUPORTADOS = ("text", "photo", "audio", "voice", "video")
+
+# Aviso ao usuário quando o processamento de um update falha de vez
+MENSAGENS_FALHA = {
+    "text": "Desculpe, ocorreu um erro ao processar sua mensagem.",
+    "photo": "Desculpe, ocorreu um erro ao processar a foto.",
+    "audio": "Desculpe, ocorreu um erro ao processar seu áudio.",
+    "voice": "Desculpe, ocorreu um erro ao processar sua mensagem de voz.",
+    "album": "Desculpe, ocorreu um erro ao processar as fotos.",
+}
+
+
+def tipo_do_update(data):
+    """Retorna o tipo da mensagem do update ('text', 'photo', 'audio', 'voice', 'video') ou None."""
+    message = data.get("message") or {}
+    for tipo in TIPOS_SUPORTADOS:
+        if tipo in message:
+            return tipo
+    return None
+
+
+def avisar_falha(chat_id, tipo):
+    agendar_mensagem_telegram(chat_id, MENSAGENS_FALHA.get(tipo, MENSAGENS_FALHA["text"]))
+
+
+def processar_update(data, relancar=False):
+    """
+    Processa um update do Telegram (texto, foto, áudio, voz ou vídeo). Roda fora da requisição do webhook.
+    Com relancar=True (worker da fila), erros sobem para quem chamou em vez de virarem um pedido de
+    desculpas, para que o job seja tentado de novo ou vá para o dead-letter.
+    """
+    if "message" not in data:
+        return
+    message = data["message"]
+    chat_id = message['chat']['id']
+    if "text" in message:
+        processar_texto(chat_id, message, relancar)
+    elif "photo" in message:
+        processar_foto(chat_id, message, relancar)
+    elif "audio" in message:
+        processar_audio(chat_id, message, relancar)
+    elif "voice" in message:
+        processar_voz(chat_id, message, relancar)
+    elif "video" in message:
+        processar_video(chat_id, message)
+
+
+def responder_em_paragrafos(chat_id, historico, ainda_atual=None, relancar=False):
+    """
+    Gera a resposta em streaming e agenda cada parágrafo na fila de saída do Telegram assim que ele
+    fica completo. A resposta inteira é salva no histórico no final, mesmo se o agendamento falhar no meio.
+    Se ainda_atual() passar a retornar False (o usuário mandou mensagem nova), a geração é abandonada
+    e só os parágrafos já enviados ficam no histórico. Com relancar=True (job da fila), a função só retorna
+    depois que o Telegram recebeu os parágrafos, e uma falha da OpenAI ou do envio é relançada sem salvar
+    nada: a nova tentativa do job gera e envia a resposta inteira, em vez de achar uma resposta cortada
+    no histórico e dar o job por concluído.
+    """
+    partes = []
+    enviados = []
+    futuros = []
+    superada = False
+    concluida = False
+    resumo = buscar_resumo(str(chat_id))
+    janela = janela_do_prompt(historico, resumo)  # O que vai no prompt, para a fronteira do próximo resumo
+    stream = gerar_resposta_stream(historico, resumo=resumo, relancar=relancar)
+
+    def pedacos():
+        nonlocal superada
+        for delta in stream:
+            if ainda_atual and not ainda_atual():
+                superada = True
+                return
+            partes.append(delta)
+            yield delta
+
+    try:
+        for paragrafo in iterar_paragrafos(pedacos()):
+            if ainda_atual and not ainda_atual():
+                superada = True
+                break
+            futuros.append(agendar_mensagem_telegram(chat_id, paragrafo))
+            enviados.append(paragrafo)
+        if relancar:
+            for futuro in futuros:
+                futuro.result()  # Relança o erro do envio
+        concluida = True
+    finally:
+        if relancar and not concluida:
+            stream.close()  # Nada é salvo: a nova tentativa do job gera e envia a resposta de novo
+        elif superada:
+            stream.close()  # Interrompe a chamada à OpenAI
+            resposta = '\n\n'.join(enviados)
+            if resposta:
+                registrar_resposta(str(chat_id), resposta)
+        else:
+            partes.extend(stream)  # Termina de consumir o stream caso um agendamento tenha falhado
+            resposta = ''.join(partes)
+            if resposta:
+                registrar_resposta(str(chat_id), resposta)
+    if superada:
+        print(f"Resposta para o chat {chat_id} abandonada: chegou mensagem nova", file=sys.stderr)
+        return resposta
+    registrar_turno(str(chat_id), historico, janela)
+    return resposta
+
+
+def estatisticas_respostas_agrupadas():
+    return {"coalescedor": coalescedor.estatisticas(), "respostas": despachante_respostas.estatisticas()}
+
+
+def registrar_mensagem_usuario(chat_id, content):
+    """
+    Grava a mensagem do usuário. Sem janela de agrupamento, devolve o histórico para responder na hora;
+    com ela, só grava (a resposta sai depois que a rajada de mensagens do chat acabar) e devolve None.
+    Com a fila no Postgres, a resposta é sempre um job 'responder' à parte e também devolve None.
+    """
+    if FILA_BACKEND == 'postgres':
+        # Agendada antes de gravar: o job de resposta espera este job do update terminar, e se a gravação
+        # falhar o update é refeito sem deixar mensagem gravada e sem resposta
+        agendar_resposta(chat_id, COALESCER_JANELA_SEGUNDOS, max_tentativas=FILA_MAX_TENTATIVAS)
+        registrar_mensagens(str(chat_id), [("user", content)])
+        return None
+    if COALESCER_JANELA_SEGUNDOS:
+        registrar_mensagens(str(chat_id), [("user", content)])
+        return None
+    return registrar_e_buscar_historico(str(chat_id), "user", content)
+
+
+def responder(chat_id, historico, relancar=False):
+    if historico is None:
+        if FILA_BACKEND != 'postgres':  # Na fila, a resposta já foi agendada junto com a mensagem
+            coalescedor.sinalizar(chat_id)
+        return None
+    print(f"Histórico enviado para OpenAI: {historico}", file=sys.stderr)
+    return responder_em_paragrafos(chat_id, historico, relancar=relancar)
+
+
+def responder_agrupado(chat_id, geracao):
+    """Uma resposta para todas as mensagens da rajada; desiste se outra rajada já começou."""
+    if not coalescedor.atual(chat_id, geracao):
+        return
+    try:
+        historico = buscar_historico(str(chat_id))
+        print(f"Histórico enviado para OpenAI: {historico}", file=sys.stderr)
+        resposta = responder_em_paragrafos(chat_id, historico, ainda_atual=lambda: coalescedor.atual(chat_id, geracao))
+        print("Resposta gerada:", resposta, file=sys.stderr)
+    finally:
+        coalescedor.concluir(chat_id, geracao)
+
+
+def responder_da_fila(chat_id, respondida_ate=None):
+    """
+    Job 'responder' da fila no Postgres: uma resposta para as mensagens gravadas desde a última.
+    Se chegar mensagem nova no meio (há outro job 'responder' pendente), a resposta para e fica só com o que já
+    foi enviado; a pendente responde o resto. respondida_ate é o id da última mensagem quando a resposta
+    anterior foi salva (marcar_resposta_seguinte): um histórico que termina nela ainda tem mensagem sem resposta.
+    """
+    historico = buscar_historico(str(chat_id))
+    if not historico:
+        return
+    ultima = historico[-1]
+    if ultima["role"] == "assistant" and (respondida_ate is None or ultima["id"] > respondida_ate):
+        # Nada novo: a resposta já foi gravada (ex.: o job caiu depois de responder e voltou pela visibilidade)
+        marcar_resposta_seguinte(chat_id)
+        return
+    print(f"Histórico enviado para OpenAI: {historico}", file=sys.stderr)
+    resposta = responder_em_paragrafos(chat_id, historico, ainda_atual=_sem_resposta_agendada(chat_id), relancar=True)
+    marcar_resposta_seguinte(chat_id)
+    print("Resposta gerada:", resposta, file=sys.stderr)
+
+
+def _sem_resposta_agendada(chat_id):
+    """ainda_atual de responder_da_fila: vai ao banco no máximo a cada FILA_CONFERIR_MENSAGEM_NOVA segundos."""
+    ultima_conferencia = None
+    atual = True
+
+    def ainda_atual():
+        nonlocal ultima_conferencia, atual
+        agora = time.monotonic()
+        if atual and (ultima_conferencia is None or agora - ultima_conferencia >= FILA_CONFERIR_MENSAGEM_NOVA):
+            ultima_conferencia = agora
+            atual = not resposta_agendada(chat_id)
+        return atual
+
+    return ainda_atual
+
+
+def processar_texto(chat_id, message, relancar=False):
+    mensagem = message.get('text', '')
+    print(f"Chat ID: {chat_id}, Texto: {mensagem}", file=sys.stderr)
+    try:
+        historico = registrar_mensagem_usuario(chat_id, mensagem)
+        resposta = responder(chat_id, historico, relancar)
+        if resposta is not None:
+            print("Resposta gerada:", resposta, file=sys.stderr)
+
+    except Exception as e:
+        if relancar:
+            raise
+        print("Erro no processamento:", e, file=sys.stderr)
+
+
+class FotoIndisponivel(Exception):
+    """A foto não pôde ser obtida ou armazenada; a mensagem é a que vai para o usuário."""
+
+
+def processar_foto(chat_id, message, relancar=False):
+    if message.get('media_group_id'):
+        # Foto de um álbum: junta com as demais do grupo e responde uma vez só
+        if FILA_BACKEND == 'postgres':
+            # Normalmente o webhook já faz isso; aqui só chegam fotos enfileiradas como 'photo'
+            enfileirar_foto_de_album(chat_id, message, ALBUM_JANELA_SEGUNDOS, max_tentativas=FILA_MAX_TENTATIVAS)
+        else:
+            agrupar_album(chat_id, message)
+        return
+    caption = message.get('caption', '')
+    print(f"Chat ID: {chat_id}, Foto File ID: {message['photo'][-1]['file_id']}, Legenda: '{caption}'", file=sys.stderr)
+
+    try:
+        foto = armazenar_foto(message)
+        content = []
+        if caption:
+            content.append({"type": "text", "text": caption})
+        content.append(parte_imagem(foto[0]))
+        registrar_e_responder_fotos(chat_id, content, [foto], relancar)
+    except FotoIndisponivel as e:
+        if relancar:
+            raise
+        agendar_mensagem_telegram(chat_id, str(e))
+    except Exception as e:
+        if relancar:
+            raise
+        print(f"Erro no processamento de foto: {e}", file=sys.stderr)
+        avisar_falha(chat_id, "photo")
+
+
+def parte_imagem(url):
+    return {"type": "image_url", "image_url": {"url": url, "detail": IMAGEM_DETALHE}}  # Usa a URL construída
+
+
+def armazenar_foto(message):
+    """
+    Obtém a foto da mensagem e garante que ela tenha uma URL pública no Storage.
+    Retorna (url_publica, upload_adiado), onde upload_adiado é None ou os argumentos do upload
+    em segundo plano (modo MIDIA_UPLOAD_ADIADO), a submeter depois que a mensagem for gravada.
+    """
+    # Menor tamanho do Telegram que atende à resolução alvo, em vez de sempre o maior (photo[-1])
+    photo = escolher_tamanho_foto(message['photo'], IMAGEM_LADO_ALVO)
+    maior = max(message['photo'], key=lambda t: t.get('width', 0) * t.get('height', 0))
+    file_id = photo['file_id']
+    file_unique_id = photo.get('file_unique_id')
+
+    # 1. Foto já vista (ex.: encaminhada de novo): reaproveita a URL sem baixar nem subir
+    registro = buscar_midia(file_unique_id=file_unique_id)
+    if registro and registro['url_publica']:
+        print(f"Foto {file_unique_id} já armazenada em {registro['objeto']}", file=sys.stderr)
+        return registro['url_publica'], None
+
+    # Obter URL do TELEGRAM
+    image_url_telegram = get_file_url_telegram(file_id)
+    if not image_url_telegram:
+        raise FotoIndisponivel("Desculpe, não consegui obter a imagem do Telegram.")
+    # 2. Baixar o arquivo para um buffer (memória, ou disco só se for grande)
+    with baixar_arquivo(image_url_telegram) as buffer:
+        dados = buffer.read()
+    dados = preparar_foto(dados, photo, maior)
+    sha256 = hashlib.sha256(dados).hexdigest()
+    registro = buscar_midia(sha256=sha256)
+    if registro and registro['url_publica']:
+        # Mesmo conteúdo com outro file_unique_id: o objeto já está no Storage
+        supabase_file_name = registro['objeto']
+        supabase_public_url = registro['url_publica']
+    else:
+        # 3. Upload para Supabase dos mesmos bytes, com nome pelo conteúdo
+        supabase_file_name = f"telegram_photos/{sha256}.jpg"
+        # CONSTRÓI A URL PÚBLICA MANUALMENTE AQUI (ela já é conhecida antes do upload)
+        supabase_public_url = f"{SUPABASE_LIBRARY_URL}/storage/v1/object/public/{SUPABASE_BUCKET_NAME}/{supabase_file_name}"
+        if MIDIA_UPLOAD_ADIADO:
+            # O upload sai do caminho da resposta: a OpenAI recebe a imagem em base64
+            marcar_pendente(supabase_public_url, dados, "image/jpeg")
+            return supabase_public_url, (dados, supabase_file_name, supabase_public_url, file_unique_id, sha256)
+        if not upload_bytes_to_supabase(dados, SUPABASE_BUCKET_NAME, supabase_file_name,
+                                        content_type="image/jpeg", upsert=True):
+            raise FotoIndisponivel("Desculpe, não consegui armazenar a imagem.")
+    if file_unique_id:
+        registrar_midia(file_unique_id, sha256, objeto=supabase_file_name, url_publica=supabase_public_url)
+    return supabase_public_url, None
+
+
+def registrar_e_responder_fotos(chat_id, content, fotos, relancar=False):
+    """Grava a mensagem multimodal, dispara os uploads adiados das fotos e responde."""
+    # 5. Inserir mensagem com conteúdo multimodal e buscar o histórico (uma ida ao banco)
+    historico = registrar_mensagem_usuario(chat_id, content)
+    for supabase_public_url, upload_adiado in fotos:
+        if upload_adiado:
+            # Só depois de gravada a mensagem, para que uma falha no upload consiga reescrevê-la
+            try:
+                despachante_uploads.submeter(upload_adiado[1], armazenar_foto_adiada, str(chat_id), *upload_adiado)
+            except Exception as e:
+                print(f"AVISO: Upload adiado recusado ({e}); subindo a foto agora.", file=sys.stderr)
+                armazenar_foto_adiada(str(chat_id), *upload_adiado)
+    # 6. Gerar resposta
+    responder(chat_id, historico, relancar)
+
+
+def agrupar_album(chat_id, message):
+    media_group_id = message['media_group_id']
+    with _albuns_lock:
+        _albuns.setdefault(media_group_id, (chat_id, []))[1].append(message)
+    coalescedor_albuns.sinalizar(media_group_id)
+
+
+def _disparar_album(media_group_id, geracao):
+    with _albuns_lock:
+        chat_id, mensagens = _albuns.pop(media_group_id)
+    coalescedor_albuns.concluir(media_group_id, geracao)
+    # Volta para a fila do chat, na ordem das demais mensagens dele
+    despachante.submeter(chat_id, processar_album, chat_id, mensagens)
+
+
+def processar_album(chat_id, mensagens, relancar=False):
+    """
+    Baixa e armazena as fotos do álbum em paralelo e as grava como uma única mensagem, com uma resposta.
+    Com relancar=True (job 'album' da fila), erros sobem para o worker como em processar_update.
+    """
+    mensagens = sorted(mensagens, key=lambda m: m.get('message_id', 0))
+    print(f"Chat ID: {chat_id}, Álbum com {len(mensagens)} fotos", file=sys.stderr)
+    try:
+        futuros = [_executor_fotos.submit(armazenar_foto, m) for m in mensagens]
+        fotos = []
+        for futuro in futuros:
+            try:
+                fotos.append(futuro.result())
+            except Exception as e:
+                print(f"Erro ao obter foto do álbum: {e}", file=sys.stderr)
+        if not fotos:
+            raise FotoIndisponivel("Desculpe, não consegui obter as imagens do álbum.")
+        content = [{"type": "text", "text": m['caption']} for m in mensagens if m.get('caption')]
+        if len(fotos) < len(mensagens):
+            content.append({"type": "text", "text": f"[{len(mensagens) - len(fotos)} foto(s) do álbum não puderam ser carregadas.]"})
+        content.extend(parte_imagem(url) for url, _ in fotos)
+        registrar_e_responder_fotos(chat_id, content, fotos, relancar)
+    except FotoIndisponivel as e:
+        if relancar:
+            raise
+        agendar_mensagem_telegram(chat_id, str(e))
+    except Exception as e:
+        if relancar:
+            raise
+        print(f"Erro no processamento do álbum: {e}", file=sys.stderr)
+        avisar_falha(chat_id, "album")
+
+
+def preparar_foto(dados, photo, maior):
+    """
+    Reduz a foto baixada para IMAGEM_LADO_ALVO (se IMAGEM_REDIMENSIONAR e houver Pillow) e registra
+    quantos bytes e tokens de visão foram economizados em relação ao maior tamanho em detalhe alto.
+    """
+    baixados = len(dados)
+    largura, altura = photo.get('width'), photo.get('height')
+    if IMAGEM_REDIMENSIONAR:
+        dados, largura_final, altura_final = reduzir_imagem(dados, IMAGEM_LADO_ALVO, IMAGEM_QUALIDADE_JPEG)
+        largura, altura = largura_final or largura, altura_final or altura
+    registrar_economia(
+        bytes_originais=maior.get('file_size') or baixados,
+        bytes_enviados=len(dados),
+        tokens_originais=tokens_visao(maior.get('width'), maior.get('height'), "high"),
+        tokens_enviados=tokens_visao(largura, altura, IMAGEM_DETALHE),
+        redimensionada=len(dados) != baixados,
+    )
+    return dados
+
+
+def armazenar_foto_adiada(user_id, dados, supabase_file_name, supabase_public_url, file_unique_id, sha256):
+    """
+    Sobe a foto para o Storage em segundo plano (modo MIDIA_UPLOAD_ADIADO). Se falhar, a imagem é
+    trocada por um aviso nas mensagens do histórico que apontam para a URL.
+    """
+    try:
+        if upload_bytes_to_supabase(dados, SUPABASE_BUCKET_NAME, supabase_file_name,
+                                    content_type="image/jpeg", upsert=True):
+            if file_unique_id:
+                # A resposta pode ter descrito a foto antes de o upload terminar
+                registrar_midia(file_unique_id, sha256, objeto=supabase_file_name, url_publica=supabase_public_url,
+                                descricao=obter_descricao(supabase_public_url))
+            return
+        alteradas = substituir_imagem_no_historico(user_id, supabase_public_url, IMAGEM_INDISPONIVEL)
+        print(f"AVISO: Upload de {supabase_file_name} falhou; {alteradas} mensagem(ns) de {user_id} reescrita(s).",
+              file=sys.stderr)
+    finally:
+        concluir_pendente(supabase_public_url)
+
+
+def transcrever_midia(midia):
+    """
+    Retorna a transcrição de um áudio/voz do Telegram, ou None se não deu para obter o arquivo.
+    Áudios já vistos (mesmo file_unique_id ou mesmo conteúdo) reaproveitam a transcrição guardada.
+    """
+    file_id = midia['file_id']
+    file_unique_id = midia.get('file_unique_id')
+    registro = buscar_midia(file_unique_id=file_unique_id)
+    if registro and registro['transcricao']:
+        print(f"Transcrição de {file_unique_id} reaproveitada do cache", file=sys.stderr)
+        return registro['transcricao']
+
+    verificar_tamanho(midia.get('file_size'))  # Sem ffmpeg, áudio grande demais nem é baixado
+    url_telegram = get_file_url_telegram(file_id)
+    if not url_telegram:
+        return None
+    print("Url de áudio temporário do telegram foi pega")
+    with baixar_arquivo(url_telegram) as buffer:
+        print("Url de áudio temporário do telegram foi baixada")
+        sha256 = sha256_do_buffer(buffer)
+        registro = buscar_midia(sha256=sha256)
+        if registro and registro['transcricao']:
+            transcricao = registro['transcricao']
+        else:
+            # Transcrever o áudio direto do buffer (vamos usar .ogg, que é comum para voz)
+            transcricao = transcrever(buffer, f"{file_id}.ogg", sha256=sha256)
+            print("Url de áudio temporário do telegram foi trancrita")
+    if file_unique_id:
+        registrar_midia(file_unique_id, sha256, transcricao=transcricao)
+    return transcricao
+
+
+def processar_audio(chat_id, message, relancar=False):
+    audio = message['audio']
+    print(f"Chat ID: {chat_id}, Audio: {audio['file_id']}", file=sys.stderr)
+    try:
+        # 1-3. Obter, baixar e transcrever o áudio (ou reaproveitar a transcrição)
+        transcribed_text = transcrever_midia(audio)
+        if transcribed_text is not None:
+            # 4. Inserir a mensagem transcrita no histórico (como texto) e buscar o histórico
+            historico = registrar_mensagem_usuario(chat_id, transcribed_text)
+            print("Transcrição foi inserida no histórico")
+            # 5-6. Gerar a resposta do agente, enviá-la parágrafo a parágrafo e salvá-la no histórico
+            responder(chat_id, historico, relancar)
+        else:
+            agendar_mensagem_telegram(chat_id, "Desculpe, não consegui obter seu áudio do Telegram.")
+    except AudioGrandeDemais as e:
+        agendar_mensagem_telegram(chat_id, str(e))  # Tentar de novo não adianta, nem no worker da fila
+    except Exception as e:
+        if relancar:
+            raise
+        print(f"Erro no processamento de áudio: {e}", file=sys.stderr)
+        avisar_falha(chat_id, "audio")
+
+
+def processar_voz(chat_id, message, relancar=False):
+    voice = message['voice']
+    print(f"Chat ID: {chat_id}, Voice File ID: {voice['file_id']}", file=sys.stderr)
+    try:
+        transcribed_text = transcrever_midia(voice)
+        if transcribed_text is not None:
+            print(f"Texto transcrito da VOZ: {transcribed_text}", file=sys.stderr) # Debug print
+            historico = registrar_mensagem_usuario(chat_id, transcribed_text)
+            responder(chat_id, historico, relancar)
+        else:
+            agendar_mensagem_telegram(chat_id, "Desculpe, não consegui obter sua mensagem de voz.")
+    except AudioGrandeDemais as e:
+        agendar_mensagem_telegram(chat_id, str(e))
+    except Exception as e:
+        if relancar:
+            raise
+        print(f"ERRO no processamento da mensagem de voz: {e}", file=sys.stderr)
+        avisar_falha(chat_id, "voice")
+
+
+def processar_video(chat_id, message):
+    video_file_id = message['video']['file_id']
+    caption = message.get('caption', '')
+    print(
+        f"Chat ID: {chat_id}, Vídeo File ID: {video_file_id}, Legenda: '{caption}' (sem suporte para processamento)",
+        file=sys.stderr)
+
+    # Envia uma mensagem amigável de volta ao usuário
+    agendar_mensagem_telegram(chat_id,
+                              "Desculpe, ainda não consigo processar vídeos. Por favor, envie uma foto, um áudio ou um texto.")
@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import os
+import sys
+
+# Arquivos da interface web (app/web_assets) preparados uma vez, na subida do processo:
+# CSS e JS ganham no nome um hash do conteúdo (podem ficar em cache no navegador para sempre, pois
+# qualquer mudança gera outro nome), a página passa a apontar para esses nomes, e cada arquivo
+# já fica comprimido em gzip e, com o pacote brotli instalado, em brotli.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIRETORIO_ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_assets')
+
+TIPOS = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+
+# Ordem de preferência entre as codificações aceitas pelo navegador
+CODIFICACOES = ('br', 'gzip')
+
+
+class AssetWeb:
+    """Arquivo pronto para servir: tipo, hash do conteúdo e as variantes (identity, gzip, br) menores que o original."""
+
+    def __init__(self, nome, conteudo):
+        self.nome = nome
+        self.tipo = TIPOS.get(os.path.splitext(nome)[1], 'application/octet-stream')
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:16]
+        self.variantes = {'identity': conteudo}
+        comprimidos = {'gzip': gzip.compress(conteudo, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            comprimidos['br'] = brotli.compress(conteudo, quality=11)
+        for codificacao, dados in comprimidos.items():
+            if len(dados) < len(conteudo):
+                self.variantes[codificacao] = dados
+
+    def escolher(self, aceita):
+        """
+        Retorna (codificação, corpo, etag) para o navegador; aceita(codificacao) diz se ele aceita a codificação.
+        Cada variante tem seu próprio ETag, já que os bytes são diferentes.
+        """
+        for codificacao in CODIFICACOES:
+            if codificacao in self.variantes and aceita(codificacao):
+                return codificacao, self.variantes[codificacao], f"{self.hash}-{codificacao}"
+        return 'identity', self.variantes['identity'], self.hash
+
+
+def construir_assets(diretorio=DIRETORIO_ASSETS, pagina='chat.html'):
+    """
+    Lê os arquivos do diretório e retorna (página, {nome com hash: AssetWeb}).
+    Na página, cada referência /assets/<nome> é trocada por /assets/<nome com hash>.
+    """
+    assets = {}
+    html = None
+    for nome in sorted(os.listdir(diretorio)):
+        with open(os.path.join(diretorio, nome), 'rb') as arquivo:
+            conteudo = arquivo.read()
+        if nome == pagina:
+            html = conteudo.decode('utf-8')
+            continue
+        base, extensao = os.path.splitext(nome)
+        asset = AssetWeb(nome, conteudo)
+        assets[f"{base}.{asset.hash[:10]}{extensao}"] = asset
+    if html is None:
+        raise FileNotFoundError(f"{pagina} não encontrado em {diretorio}")
+    for nome_publico, asset in assets.items():
+        html = html.replace(f'"/assets/{asset.nome}"', f'"/assets/{nome_publico}"')
+    pagina_asset = AssetWeb(pagina, html.encode('utf-8'))
+    print(f"Assets web: {len(assets)} arquivos com hash, compressão {'/'.join(pagina_asset.variantes)}",
+          file=sys.stderr)
+    return pagina_asset, assets
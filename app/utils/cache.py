@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """
+    Cache em memória, thread-safe, com expiração por TTL e despejo LRU.
+    Limita o número de itens e, opcionalmente, o total de bytes estimado por tamanho_fn(valor).
+    Mantém contadores de hits, misses e despejos.
+    """
+
+    def __init__(self, max_itens=1000, ttl=300, max_bytes=None, tamanho_fn=None):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._tamanho_fn = tamanho_fn or (lambda valor: 0)
+        self._itens = OrderedDict()  # chave -> (valor, expira_em, tamanho)
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.despejos = 0
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.misses += 1
+                return padrao
+            valor, expira_em, _ = item
+            if expira_em is not None and expira_em <= time.monotonic():
+                self._remover(chave)
+                self.misses += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def definir(self, chave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        tamanho = self._tamanho_fn(valor)
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            if self.max_bytes is not None and tamanho > self.max_bytes:
+                return  # Valor maior que o cache inteiro: não vale a pena guardar
+            expira_em = time.monotonic() + ttl if ttl else None
+            self._itens[chave] = (valor, expira_em, tamanho)
+            self._bytes += tamanho
+            self._despejar()
+
+    def atualizar(self, chave, funcao):
+        """
+        Substitui o valor atual por funcao(valor) se a chave estiver no cache (sem renovar o TTL).
+        Retorna True se atualizou. Não conta como hit nem miss.
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return False
+            valor, expira_em, tamanho = item
+            if expira_em is not None and expira_em <= time.monotonic():
+                self._remover(chave)
+                return False
+            novo = funcao(valor)
+            novo_tamanho = self._tamanho_fn(novo)
+            self._itens[chave] = (novo, expira_em, novo_tamanho)
+            self._bytes += novo_tamanho - tamanho
+            self._itens.move_to_end(chave)
+            self._despejar()
+            return True
+
+    def invalidar(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def __contains__(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            return item is not None and (item[1] is None or item[1] > time.monotonic())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._itens)
+
+    def _remover(self, chave):
+        _, _, tamanho = self._itens.pop(chave)
+        self._bytes -= tamanho
+
+    def _despejar(self):
+        while self._itens and (len(self._itens) > self.max_itens or
+                               (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            chave, (_, _, tamanho) = self._itens.popitem(last=False)
+            self._bytes -= tamanho
+            self.despejos += 1
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "itens": len(self._itens),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_acerto": round(self.hits / consultas, 3) if consultas else 0.0,
+                "despejos": self.despejos,
+            }
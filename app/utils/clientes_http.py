@@ -0,0 +1,23 @@
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from config import OPENAI_API_KEY, HTTP_MAX_CONEXOES, HTTP_MAX_KEEPALIVE, HTTP_TIMEOUT
+
+# Clientes HTTP compartilhados pelo processo inteiro: reaproveitam conexões TLS (keep-alive)
+# com a OpenAI em vez de abrir uma por chamada. O cliente assíncrono é usado pelo modo ASGI (asgi.py).
+
+_limites = httpx.Limits(
+    max_connections=HTTP_MAX_CONEXOES,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=30,
+)
+_timeout = httpx.Timeout(HTTP_TIMEOUT, connect=5.0)
+
+http_client = httpx.Client(limits=_limites, timeout=_timeout)
+http_client_async = httpx.AsyncClient(limits=_limites, timeout=_timeout)
+
+openai_client = OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+openai_client_async = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client_async)
+
+
+async def fechar_clientes_async():
+    await http_client_async.aclose()
@@ -0,0 +1,93 @@
+import itertools
+import sys
+import threading
+import time
+
+
+class Coalescedor:
+    """
+    Agrupa rajadas de eventos por chave (ex.: chat_id): cada sinalizar() reinicia a janela da chave e,
+    quando ela passa `janela` segundos sem eventos novos, chama executar(chave, geracao) uma única vez.
+    A geração identifica a rajada: um trabalho já disparado pode consultar atual(chave, geracao) e
+    desistir assim que chegar um evento novo para a mesma chave.
+    """
+
+    def __init__(self, janela, executar, nome="coalescedor"):
+        self.janela = janela
+        self.executar = executar
+        self.nome = nome
+        self._cond = threading.Condition()
+        self._contador = itertools.count(1)  # Gerações nunca se repetem, nem entre chaves
+        self._geracoes = {}   # chave -> geração mais recente
+        self._prazos = {}     # chave -> instante em que a janela da chave fecha
+        self._thread = None
+        self._disparos = 0
+        self._agrupados = 0
+
+    def sinalizar(self, chave):
+        """Registra um evento da chave e (re)abre a janela. Retorna a nova geração."""
+        with self._cond:
+            if self._thread is None:
+                # Sobe no primeiro evento, depois do fork dos workers do gunicorn
+                self._thread = threading.Thread(target=self._loop, name=self.nome, daemon=True)
+                self._thread.start()
+            if chave in self._prazos:
+                self._agrupados += 1
+            geracao = next(self._contador)
+            self._geracoes[chave] = geracao
+            self._prazos[chave] = time.monotonic() + self.janela
+            self._cond.notify()
+            return geracao
+
+    def atual(self, chave, geracao):
+        """True enquanto nenhum evento mais novo chegou para a chave."""
+        with self._cond:
+            return self._geracoes.get(chave) == geracao
+
+    def concluir(self, chave, geracao):
+        """Esquece a chave se a geração ainda for a mais recente (o trabalho dela terminou)."""
+        with self._cond:
+            if self._geracoes.get(chave) == geracao and chave not in self._prazos:
+                del self._geracoes[chave]
+
+    def disparar_pendentes(self):
+        """Dispara agora todas as janelas abertas (usado no desligamento)."""
+        with self._cond:
+            disparos = [(chave, self._geracoes[chave]) for chave in self._prazos]
+            self._prazos.clear()
+            self._disparos += len(disparos)
+        self._executar_todos(disparos)
+
+    def _executar_todos(self, disparos):
+        for chave, geracao in disparos:
+            try:
+                self.executar(chave, geracao)
+            except Exception as e:
+                print(f"ERRO: {self.nome} não conseguiu disparar a chave {chave}. Erro: {e}", file=sys.stderr)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    agora = time.monotonic()
+                    vencidas = [chave for chave, prazo in self._prazos.items() if prazo <= agora]
+                    if vencidas:
+                        break
+                    proximo = min(self._prazos.values(), default=None)
+                    self._cond.wait(None if proximo is None else proximo - agora)
+                disparos = []
+                for chave in vencidas:
+                    del self._prazos[chave]
+                    disparos.append((chave, self._geracoes[chave]))
+                self._disparos += len(disparos)
+            self._executar_todos(disparos)
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "janela_segundos": self.janela,
+                "aguardando": len(self._prazos),
+                "chaves": len(self._geracoes),
+                "disparos": self._disparos,
+                "mensagens_agrupadas": self._agrupados,
+            }
@@ -0,0 +1,172 @@
+import sys
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolEsgotado(Exception):
+    """Levantada quando nenhuma conexão fica livre dentro do timeout de checkout."""
+
+
+class PoolDeConexoes:
+    """
+    Pool de conexões psycopg2 thread-safe.
+
+    - obter() bloqueia até timeout segundos quando todas as conexões estão em uso;
+    - conexões mais velhas que idade_maxima são recicladas;
+    - conexões ociosas há mais de ping_apos_ocioso segundos são testadas com SELECT 1 antes de sair do pool
+      (o pooler do Supabase derruba sockets ociosos);
+    - estatisticas() expõe conexões em uso/ociosas e tempo de espera.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10, idade_maxima=1800, ping_apos_ocioso=30, **kwargs_conexao):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idade_maxima = idade_maxima
+        self.ping_apos_ocioso = ping_apos_ocioso
+        self._kwargs_conexao = kwargs_conexao
+        self._cond = threading.Condition()
+        self._ociosas = deque()  # (conn, criada_em, devolvida_em)
+        self._criada_em = {}     # id(conn) -> criada_em, para conexões em uso
+        self._total = 0          # ociosas + em uso + sendo criadas
+        self._checkouts = 0
+        self._esperas = 0
+        self._tempo_espera_total = 0.0
+        self._tempo_espera_max = 0.0
+        self._timeouts = 0
+        self._recicladas = 0
+        self._pings_falhos = 0
+
+        for _ in range(minconn):
+            conn = self._conectar()
+            self._total += 1
+            self._ociosas.append((conn, time.monotonic(), time.monotonic()))
+
+    def _conectar(self):
+        return psycopg2.connect(self.dsn, **self._kwargs_conexao)
+
+    def obter(self, timeout=None):
+        """Retira uma conexão saudável do pool, esperando até timeout segundos por uma livre."""
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        esperou = False
+        while True:
+            criar = False
+            with self._cond:
+                while not self._ociosas and self._total >= self.maxconn:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise PoolEsgotado(f"Nenhuma conexão livre após {timeout}s ({self.maxconn} em uso).")
+                    esperou = True
+                    self._cond.wait(restante)
+                if self._ociosas:
+                    conn, criada_em, devolvida_em = self._ociosas.pop()  # LIFO: a mais "quente" primeiro
+                else:
+                    self._total += 1  # Reserva a vaga antes de conectar fora do lock
+                    criar = True
+
+            if criar:
+                try:
+                    conn = self._conectar()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+                criada_em = time.monotonic()
+            elif not self._saudavel(conn, criada_em, devolvida_em):
+                self._descartar(conn)
+                continue
+
+            espera = time.monotonic() - inicio
+            with self._cond:
+                self._criada_em[id(conn)] = criada_em
+                self._checkouts += 1
+                if esperou:
+                    self._esperas += 1
+                self._tempo_espera_total += espera
+                self._tempo_espera_max = max(self._tempo_espera_max, espera)
+            return conn
+
+    def _saudavel(self, conn, criada_em, devolvida_em):
+        if conn.closed:
+            return False
+        agora = time.monotonic()
+        if self.idade_maxima and agora - criada_em > self.idade_maxima:
+            with self._cond:
+                self._recicladas += 1
+            return False
+        if self.ping_apos_ocioso is not None and agora - devolvida_em > self.ping_apos_ocioso:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except Exception as e:
+                print(f"AVISO: Conexão ociosa do pool estava morta, descartando. Erro: {e}", file=sys.stderr)
+                with self._cond:
+                    self._pings_falhos += 1
+                return False
+        return True
+
+    def devolver(self, conn, descartar=False):
+        """Devolve a conexão ao pool; conexões fechadas ou marcadas para descarte são fechadas."""
+        with self._cond:
+            criada_em = self._criada_em.pop(id(conn), None)
+        if criada_em is None:
+            print("AVISO: Conexão devolvida não pertence ao pool.", file=sys.stderr)
+            return
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()  # Não deixa transação aberta vazar para o próximo uso
+            except Exception:
+                descartar = True
+        if descartar or conn.closed:
+            self._descartar(conn)
+            return
+        with self._cond:
+            self._ociosas.append((conn, criada_em, time.monotonic()))
+            self._cond.notify()
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def fechar(self):
+        with self._cond:
+            ociosas = list(self._ociosas)
+            self._ociosas.clear()
+            self._total -= len(ociosas)
+        for conn, _, _ in ociosas:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "em_uso": len(self._criada_em),
+                "ociosas": len(self._ociosas),
+                "total": self._total,
+                "max": self.maxconn,
+                "checkouts": self._checkouts,
+                "esperas": self._esperas,
+                "tempo_espera_medio_ms": round(1000 * self._tempo_espera_total / self._checkouts, 2) if self._checkouts else 0.0,
+                "tempo_espera_max_ms": round(1000 * self._tempo_espera_max, 2),
+                "timeouts": self._timeouts,
+                "recicladas": self._recicladas,
+                "pings_falhos": self._pings_falhos,
+            }
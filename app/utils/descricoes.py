@@ -0,0 +1,176 @@
+import re
+import sys
+from config import DESCRICAO_IMAGEM_ATIVA, DESCRICAO_IMAGEM_TTL, DESCRICAO_IMAGEM_MAX_ITENS
+from app.utils.cache import CacheLRU
+from app.utils.midia_cache import buscar_descricoes, registrar_descricoes
+
+# Descrições curtas das fotos enviadas pelo usuário. Depois do turno em que a foto chegou, o histórico
+# passa a levar a descrição no lugar da imagem, e a OpenAI não precisa baixar e processar a foto de novo
+# a cada turno. Se o usuário voltar a falar da foto, a imagem original continua indo.
+# A descrição sai da mesma chamada que responde à foto: o modelo a escreve depois da resposta, após
+# MARCADOR_DESCRICOES, e essa parte é separada do texto antes de chegar ao usuário. Ela fica gravada em
+# midias_telegram, junto da URL da foto; o CacheLRU evita ir ao banco para as fotos recentes.
+
+MARCADOR_DESCRICOES = "[[DESCRICOES]]"
+
+INSTRUCAO_DESCRICOES = f"""Depois da resposta, numa linha própria, escreva {MARCADOR_DESCRICOES} e, em seguida,
+uma linha para cada uma das {{quantidade}} foto(s) da última mensagem do usuário, na ordem em que aparecem:
+o número da foto, dois-pontos e uma descrição em português, em no máximo 60 palavras, para um chef de cozinha
+que não pode vê-la (alimentos e ingredientes visíveis, quantidades aproximadas, estado, utensílios e qualquer
+texto legível). Essa parte não é mostrada ao usuário."""
+
+# Mensagens que voltam a falar da foto mantêm as imagens no prompt
+REFERENCIA_A_IMAGEM = re.compile(r"\b(foto|fotos|imagem|imagens|figura|print|picture|photo|image)\b", re.IGNORECASE)
+LINHA_DESCRICAO = re.compile(r"^\s*(\d+)\s*[:.)-]\s*(.+?)\s*$")
+
+_descricoes = CacheLRU(max_itens=DESCRICAO_IMAGEM_MAX_ITENS, ttl=DESCRICAO_IMAGEM_TTL)  # url pública -> descrição ('' = sem)
+
+
+def _urls_de_imagens(mensagem):
+    content = mensagem.get("content")
+    if not isinstance(content, list):
+        return []
+    return [parte["image_url"]["url"] for parte in content
+            if isinstance(parte, dict) and (parte.get("image_url") or {}).get("url")]
+
+
+def _ultima_do_assistente(historico):
+    return max((i for i, m in enumerate(historico) if m.get("role") == "assistant"), default=None)
+
+
+def fotos_a_descrever(janela):
+    """URLs das fotos do turno atual (tudo o que o usuário mandou depois da última resposta), em ordem."""
+    if not DESCRICAO_IMAGEM_ATIVA:
+        return []
+    inicio = _ultima_do_assistente(janela)
+    inicio = 0 if inicio is None else inicio + 1
+    return [url for mensagem in janela[inicio:] if mensagem.get("role") == "user" for url in _urls_de_imagens(mensagem)]
+
+
+def instrucao_descricoes(fotos):
+    return INSTRUCAO_DESCRICOES.format(quantidade=len(fotos))
+
+
+def _tamanho_do_prefixo_do_marcador(texto):
+    """Quantos caracteres do final do texto podem ser o começo do marcador, partido entre dois pedaços."""
+    for tamanho in range(min(len(MARCADOR_DESCRICOES) - 1, len(texto)), 0, -1):
+        if texto.endswith(MARCADOR_DESCRICOES[:tamanho]):
+            return tamanho
+    return 0
+
+
+class SeparadorDescricoes:
+    """
+    Separa, do texto gerado (em stream ou de uma vez), as descrições das fotos que vêm depois do marcador.
+    filtrar(pedaço) devolve o que vai para o usuário; concluir() devolve o que ainda estava retido
+    e grava as descrições encontradas. Sem fotos, o texto passa direto.
+    """
+
+    def __init__(self, fotos):
+        self.fotos = fotos
+        self._retido = ''
+        self._descricoes = None  # Texto depois do marcador; None enquanto ele não apareceu
+
+    def filtrar(self, pedaco):
+        if not self.fotos:
+            return pedaco
+        if self._descricoes is not None:
+            self._descricoes += pedaco
+            return ''
+        texto = self._retido + pedaco
+        posicao = texto.find(MARCADOR_DESCRICOES)
+        if posicao >= 0:
+            self._retido = ''
+            self._descricoes = texto[posicao + len(MARCADOR_DESCRICOES):]
+            return texto[:posicao]
+        retido = _tamanho_do_prefixo_do_marcador(texto)
+        self._retido = texto[len(texto) - retido:]
+        return texto[:len(texto) - retido]
+
+    def concluir(self):
+        restante, self._retido = self._retido, ''
+        if self._descricoes:
+            guardar_descricoes(self.fotos, self._descricoes)
+        return restante
+
+
+def guardar_descricoes(fotos, texto):
+    """Grava as descrições 'n: descrição' do texto para as fotos correspondentes."""
+    descricoes = {}
+    for linha in texto.splitlines():
+        encontrada = LINHA_DESCRICAO.match(linha)
+        if encontrada and 1 <= int(encontrada.group(1)) <= len(fotos):
+            descricoes[fotos[int(encontrada.group(1)) - 1]] = encontrada.group(2)
+    if len(descricoes) < len(fotos):
+        print(f"AVISO: {len(fotos) - len(descricoes)} de {len(fotos)} foto(s) ficaram sem descrição.", file=sys.stderr)
+    for url, descricao in descricoes.items():
+        _descricoes.definir(url, descricao)
+    if descricoes:
+        registrar_descricoes(descricoes)
+
+
+def obter_descricao(url):
+    return _descricoes.obter(url) or None
+
+
+def _descricoes_das_urls(urls):
+    """Descrições das urls (url -> descrição), do cache ou do banco numa consulta só para as que faltam."""
+    encontradas = {url: _descricoes.obter(url) for url in urls}
+    faltando = [url for url, descricao in encontradas.items() if descricao is None]
+    if faltando:
+        do_banco = buscar_descricoes(faltando)
+        for url in faltando:
+            # As sem descrição também ficam no cache: ela só é gerada no turno em que a foto chegou
+            encontradas[url] = do_banco.get(url, '')
+            _descricoes.definir(url, encontradas[url])
+    return {url: descricao for url, descricao in encontradas.items() if descricao}
+
+
+def _texto_da_mensagem(mensagem):
+    content = mensagem.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(p.get("text", "") for p in content if isinstance(p, dict) and p.get("type") == "text")
+    return ""
+
+
+def trocar_imagens_por_descricoes(historico):
+    """
+    Retorna o histórico com as imagens das mensagens anteriores à última resposta do assistente trocadas
+    por suas descrições: as fotos do turno atual (tudo o que o usuário mandou depois da última
+    resposta, que pode ser mais de uma mensagem quando elas são agrupadas) vão sempre como imagem.
+    Imagens sem descrição ficam como estão; se a última mensagem do usuário fala da foto, nada é
+    trocado. Não altera as mensagens recebidas.
+    """
+    if not DESCRICAO_IMAGEM_ATIVA:
+        return historico
+    ultima_do_assistente = _ultima_do_assistente(historico)
+    ultima_do_usuario = max((i for i, m in enumerate(historico) if m.get("role") == "user"), default=None)
+    if ultima_do_assistente is None or ultima_do_usuario is None or \
+            REFERENCIA_A_IMAGEM.search(_texto_da_mensagem(historico[ultima_do_usuario])):
+        return historico
+    urls = {url for mensagem in historico[:ultima_do_assistente] for url in _urls_de_imagens(mensagem)}
+    if not urls:
+        return historico
+    descricoes = _descricoes_das_urls(urls)
+    if not descricoes:
+        return historico
+    resultado = []
+    for i, mensagem in enumerate(historico):
+        content = mensagem.get("content")
+        if i < ultima_do_assistente and isinstance(content, list):
+            novas_partes = []
+            for parte in content:
+                url = (parte.get("image_url") or {}).get("url") if isinstance(parte, dict) else None
+                descricao = descricoes.get(url) if url else None
+                if descricao:
+                    parte = {"type": "text", "text": f"[Foto enviada antes pelo usuário: {descricao}]"}
+                novas_partes.append(parte)
+            mensagem = {**mensagem, "content": novas_partes}
+        resultado.append(mensagem)
+    return resultado
+
+
+def estatisticas_descricoes():
+    return {"cache": _descricoes.estatisticas()}
@@ -0,0 +1,39 @@
+import atexit
+import sys
+import threading
+import time
+
+from config import DESPACHANTE_TIMEOUT_DESLIGAMENTO
+
+# Desligamento ordenado do processo. Cada módulo com trabalho em segundo plano registra aqui a sua etapa,
+# com uma ordem que segue o fluxo do trabalho (quem produz encerra antes de quem consome), e um único
+# hook do atexit roda todas dentro de um prazo total, abaixo do graceful timeout do gunicorn (30s).
+# Etapas que não cabem no prazo restante são puladas e avisadas no log.
+
+_etapas = []  # (ordem, nome, funcao(timeout))
+_lock = threading.Lock()
+
+
+def registrar_etapa(ordem, nome, funcao):
+    """Registra funcao(timeout_restante) para rodar no desligamento, em ordem crescente de `ordem`."""
+    with _lock:
+        _etapas.append((ordem, nome, funcao))
+
+
+def desligar(prazo=DESPACHANTE_TIMEOUT_DESLIGAMENTO):
+    limite = time.monotonic() + prazo
+    with _lock:
+        etapas = sorted(_etapas, key=lambda etapa: etapa[0])
+        _etapas.clear()
+    for ordem, nome, funcao in etapas:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            print(f"AVISO: Prazo de desligamento esgotado; etapa {nome} não executada.", file=sys.stderr)
+            continue
+        try:
+            funcao(restante)
+        except Exception as e:
+            print(f"ERRO: Etapa de desligamento {nome} falhou. Erro: {e}", file=sys.stderr)
+
+
+atexit.register(desligar)
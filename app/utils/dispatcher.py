@@ -0,0 +1,127 @@
+import sys
+import threading
+import time
+from collections import deque
+
+from config import DESPACHANTE_WORKERS, DESPACHANTE_MAX_PENDENTES
+from app.utils.desligamento import registrar_etapa
+
+
+class FilaCheia(Exception):
+    """Levantada quando o despachante já tem o máximo de jobs pendentes."""
+
+
+class DespachantePorChat:
+    """
+    Pool de threads limitado que processa jobs em segundo plano.
+    Jobs com a mesma chave (ex.: chat_id) rodam um de cada vez e na ordem em que chegaram,
+    enquanto chaves diferentes são processadas em paralelo.
+    """
+
+    def __init__(self, max_workers=4, max_pendentes=500, nome="despachante"):
+        self.max_workers = max_workers
+        self.max_pendentes = max_pendentes
+        self.nome = nome
+        self._cond = threading.Condition()
+        self._filas = {}          # chave -> deque de jobs (existe enquanto há job pendente ou em execução)
+        self._prontas = deque()   # chaves com job pendente e nenhum job em execução
+        self._threads = []
+        self._pendentes = 0
+        self._em_execucao = 0
+        self._processados = 0
+        self._erros = 0
+        self._encerrando = False
+
+    def submeter(self, chave, funcao, *args, **kwargs):
+        """Enfileira funcao(*args, **kwargs) na fila da chave. Retorna imediatamente."""
+        with self._cond:
+            if self._encerrando:
+                raise RuntimeError(f"{self.nome} está encerrando, job recusado.")
+            if self._pendentes >= self.max_pendentes:
+                raise FilaCheia(f"{self.nome}: {self._pendentes} jobs pendentes.")
+            self._iniciar_threads()
+            fila = self._filas.get(chave)
+            if fila is None:
+                fila = deque()
+                self._filas[chave] = fila
+                self._prontas.append(chave)
+            fila.append((funcao, args, kwargs, time.monotonic()))
+            self._pendentes += 1
+            self._cond.notify()
+
+    def _iniciar_threads(self):
+        # As threads só sobem no primeiro job, depois do fork dos workers do gunicorn.
+        if self._threads:
+            return
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._loop, name=f"{self.nome}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._prontas and not self._encerrando:
+                    self._cond.wait()
+                if not self._prontas:
+                    return  # Encerrando e sem nada pendente
+                chave = self._prontas.popleft()
+                funcao, args, kwargs, enfileirado_em = self._filas[chave].popleft()
+                self._pendentes -= 1
+                self._em_execucao += 1
+
+            try:
+                funcao(*args, **kwargs)
+            except Exception as e:
+                with self._cond:
+                    self._erros += 1
+                print(f"ERRO: Job do {self.nome} falhou para chave {chave}. Erro: {e}", file=sys.stderr)
+
+            with self._cond:
+                self._em_execucao -= 1
+                self._processados += 1
+                if self._filas[chave]:
+                    self._prontas.append(chave)  # Volta para o fim da fila, dando vez aos outros chats
+                    self._cond.notify()
+                else:
+                    del self._filas[chave]
+                if self._pendentes == 0 and self._em_execucao == 0:
+                    self._cond.notify_all()
+
+    def desligar(self, timeout=None):
+        """Para de aceitar jobs e espera os pendentes e em execução terminarem (até timeout segundos)."""
+        with self._cond:
+            self._encerrando = True
+            self._cond.notify_all()
+            pendentes = self._pendentes + self._em_execucao
+        if pendentes:
+            print(f"{self.nome}: aguardando {pendentes} jobs antes de encerrar.", file=sys.stderr)
+        limite = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            restante = None if limite is None else max(0, limite - time.monotonic())
+            t.join(restante)
+        with self._cond:
+            sobras = self._pendentes + self._em_execucao
+        if sobras:
+            print(f"AVISO: {self.nome} encerrou com {sobras} jobs não concluídos.", file=sys.stderr)
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "workers": self.max_workers,
+                "pendentes": self._pendentes,
+                "em_execucao": self._em_execucao,
+                "chats_ativos": len(self._filas),
+                "processados": self._processados,
+                "erros": self._erros,
+            }
+
+
+despachante = DespachantePorChat(
+    max_workers=DESPACHANTE_WORKERS,
+    max_pendentes=DESPACHANTE_MAX_PENDENTES,
+    nome="despachante-telegram",
+)
+
+# Ao encerrar o processo (ex.: SIGTERM do gunicorn) drena os jobs em andamento.
+registrar_etapa(20, despachante.nome, despachante.desligar)
@@ -0,0 +1,222 @@
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from config import (TELEGRAM_ENVIO_POR_CHAT, TELEGRAM_ENVIO_RAJADA_CHAT, TELEGRAM_ENVIO_GLOBAL,
+                    TELEGRAM_ENVIO_WORKERS, TELEGRAM_ENVIO_MAX_PENDENTES)
+from app.utils.desligamento import registrar_etapa
+from app.utils.dispatcher import FilaCheia
+from app.utils.helpers import enviar_mensagem_telegram
+
+
+class _Balde:
+    """Token bucket: até `capacidade` envios seguidos, repostos a `taxa` por segundo."""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.tokens = capacidade
+        self.atualizado_em = time.monotonic()
+
+    def _repor(self, agora):
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+
+    def espera(self, agora):
+        """Segundos até haver um token disponível (0 se já houver)."""
+        self._repor(agora)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.taxa
+
+    def consumir(self):
+        self.tokens -= 1
+
+    def cheio(self, agora):
+        self._repor(agora)
+        return self.tokens >= self.capacidade
+
+
+class AgendadorEnvios:
+    """
+    Fila de saída das mensagens ao Telegram, respeitando os limites da Bot API
+    (~1 mensagem/s por chat e ~30 mensagens/s no total) com um token bucket por chat e um global.
+    Mensagens do mesmo chat saem na ordem em que foram agendadas; chats diferentes são
+    intercalados em rodízio, para que uma resposta longa não atrase as dos outros chats.
+    """
+
+    def __init__(self, funcao_envio, taxa_por_chat=1.0, rajada_por_chat=1, taxa_global=30.0,
+                 max_workers=4, max_pendentes=5000, nome="envios-telegram"):
+        self.funcao_envio = funcao_envio
+        self.taxa_por_chat = taxa_por_chat
+        self.rajada_por_chat = rajada_por_chat
+        self.max_workers = max_workers
+        self.max_pendentes = max_pendentes
+        self.nome = nome
+        self._cond = threading.Condition()
+        self._global = _Balde(taxa_global, max(1, int(taxa_global)))
+        self._filas = {}         # chat_id -> deque de (texto, future, agendado_em)
+        self._baldes = {}        # chat_id -> _Balde
+        self._rodada = deque()   # chats com mensagem pendente e nenhum envio em andamento
+        self._threads = []
+        self._pendentes = 0
+        self._em_envio = 0
+        self._enviados = 0
+        self._erros = 0
+        self._atraso_total = 0.0
+        self._atraso_max = 0.0
+        self._encerrando = False
+
+    def agendar(self, chat_id, texto):
+        """Coloca o texto na fila do chat e retorna um Future resolvido quando o envio terminar."""
+        futuro = Future()
+        with self._cond:
+            if self._encerrando:
+                raise RuntimeError(f"{self.nome} está encerrando, mensagem recusada.")
+            if self._pendentes >= self.max_pendentes:
+                raise FilaCheia(f"{self.nome}: {self._pendentes} mensagens pendentes.")
+            self._iniciar_threads()
+            fila = self._filas.get(chat_id)
+            if fila is None:
+                fila = deque()
+                self._filas[chat_id] = fila
+                self._rodada.append(chat_id)
+            fila.append((texto, futuro, time.monotonic()))
+            self._pendentes += 1
+            self._cond.notify()
+        return futuro
+
+    def _iniciar_threads(self):
+        # Como no despachante, as threads só sobem no primeiro envio, depois do fork do gunicorn.
+        if self._threads:
+            return
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._loop, name=f"{self.nome}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _balde(self, chat_id):
+        balde = self._baldes.get(chat_id)
+        if balde is None:
+            balde = _Balde(self.taxa_por_chat, self.rajada_por_chat)
+            self._baldes[chat_id] = balde
+        return balde
+
+    def _proximo(self):
+        """Com o lock: retorna o próximo chat liberado pelos dois baldes, ou (None, segundos a esperar)."""
+        agora = time.monotonic()
+        espera_global = self._global.espera(agora)
+        if espera_global:
+            return None, espera_global
+        menor_espera = None
+        for _ in range(len(self._rodada)):
+            chat_id = self._rodada.popleft()
+            espera = self._balde(chat_id).espera(agora)
+            if not espera:
+                return chat_id, 0.0
+            self._rodada.append(chat_id)
+            menor_espera = espera if menor_espera is None else min(menor_espera, espera)
+        return None, menor_espera
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._rodada:
+                        if self._encerrando and self._pendentes == 0:
+                            return
+                        self._cond.wait()
+                        continue
+                    chat_id, espera = self._proximo()
+                    if chat_id is not None:
+                        break
+                    self._cond.wait(espera)
+                self._global.consumir()
+                self._baldes[chat_id].consumir()
+                texto, futuro, agendado_em = self._filas[chat_id].popleft()
+                self._pendentes -= 1
+                self._em_envio += 1
+
+            atraso = time.monotonic() - agendado_em
+            try:
+                resultado = self.funcao_envio(chat_id, texto)
+                futuro.set_result(resultado)
+                erro = False
+            except Exception as e:
+                futuro.set_exception(e)
+                erro = True
+                print(f"ERRO: {self.nome} não conseguiu enviar mensagem ao chat {chat_id}. Erro: {e}", file=sys.stderr)
+
+            with self._cond:
+                self._em_envio -= 1
+                self._enviados += int(not erro)
+                self._erros += int(erro)
+                self._atraso_total += atraso
+                self._atraso_max = max(self._atraso_max, atraso)
+                if self._filas[chat_id]:
+                    self._rodada.append(chat_id)
+                else:
+                    del self._filas[chat_id]
+                    self._podar_baldes()
+                self._cond.notify_all()
+
+    def _podar_baldes(self):
+        # Baldes cheios de chats sem fila equivalem a um balde novo; não precisam ficar em memória.
+        if len(self._baldes) <= 1000:
+            return
+        agora = time.monotonic()
+        for chat_id in [c for c, b in self._baldes.items() if c not in self._filas and b.cheio(agora)]:
+            del self._baldes[chat_id]
+
+    def desligar(self, timeout=None):
+        """Para de aceitar mensagens e espera as pendentes serem enviadas (até timeout segundos)."""
+        with self._cond:
+            self._encerrando = True
+            self._cond.notify_all()
+            pendentes = self._pendentes + self._em_envio
+        if pendentes:
+            print(f"{self.nome}: aguardando {pendentes} mensagens antes de encerrar.", file=sys.stderr)
+        limite = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            restante = None if limite is None else max(0, limite - time.monotonic())
+            t.join(restante)
+        with self._cond:
+            sobras = self._pendentes + self._em_envio
+        if sobras:
+            print(f"AVISO: {self.nome} encerrou com {sobras} mensagens não enviadas.", file=sys.stderr)
+
+    def estatisticas(self):
+        with self._cond:
+            processados = self._enviados + self._erros
+            return {
+                "pendentes": self._pendentes,
+                "em_envio": self._em_envio,
+                "chats_na_fila": len(self._filas),
+                "maior_fila": max((len(f) for f in self._filas.values()), default=0),
+                "enviados": self._enviados,
+                "erros": self._erros,
+                "atraso_medio_ms": round(1000 * self._atraso_total / processados, 1) if processados else 0.0,
+                "atraso_max_ms": round(1000 * self._atraso_max, 1),
+            }
+
+
+agendador_envios = AgendadorEnvios(
+    enviar_mensagem_telegram,
+    taxa_por_chat=TELEGRAM_ENVIO_POR_CHAT,
+    rajada_por_chat=TELEGRAM_ENVIO_RAJADA_CHAT,
+    taxa_global=TELEGRAM_ENVIO_GLOBAL,
+    max_workers=TELEGRAM_ENVIO_WORKERS,
+    max_pendentes=TELEGRAM_ENVIO_MAX_PENDENTES,
+)
+
+# Encerra depois dos despachantes, cujos jobs ainda agendam mensagens
+registrar_etapa(60, "envios-telegram", agendador_envios.desligar)
+
+
+def agendar_mensagem_telegram(chat_id, texto):
+    """Envia texto ao chat pela fila de saída com limite de taxa. Não bloqueia; retorna um Future."""
+    return agendador_envios.agendar(chat_id, texto)
+
+
+def estatisticas_envios_telegram():
+    return agendador_envios.estatisticas()
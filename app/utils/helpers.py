@@ -2,10 +2,20 @@ import psycopg2
 import os
 import requests
 import sys
-from psycopg2 import pool
+import tempfile
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from config import (HISTORICO_LIMITE, HISTORICO_CACHE_ATIVO, HISTORICO_CACHE_TTL,
+                    HISTORICO_CACHE_MAX_USUARIOS, HISTORICO_CACHE_MAX_BYTES, HISTORICO_CACHE_VALIDAR, DB_POOL_MIN, DB_POOL_MAX,
+                    DB_POOL_TIMEOUT, DB_POOL_IDADE_MAXIMA, DB_POOL_PING_OCIOSO, TELEGRAM_TIMEOUT_CONEXAO,
+                    TELEGRAM_TIMEOUT_LEITURA, TELEGRAM_MAX_TENTATIVAS, TELEGRAM_BACKOFF_BASE,
+                    TELEGRAM_RETRY_AFTER_MAX, TELEGRAM_POOL_CONEXOES, MIDIA_LIMITE_MEMORIA,
+                    TELEGRAM_FILE_URL_TTL, HISTORICO_PAGINA_MAX)
+from app.utils.cache import CacheLRU
+from app.utils.historico_cache import HistoricoCache
+from app.utils.db_pool import PoolDeConexoes
+from app.utils.clientes_http import openai_client
+from app.utils.telegram_client import TelegramClient, TelegramErro
 from psycopg2.extras import Json
 from urllib.parse import urlparse, quote_plus # Importe urlparse e quote_plus
 
@@ -13,18 +23,56 @@ load_dotenv()  # Carrega variáveis de ambiente uma vez no início
 
 
 DB_PASSWORD = os.environ['SUPABASE_PASSWORD']
+DB_USER = "postgres.ohwzezjffhjhetzsnjdd"
+DB_HOST = "aws-0-us-east-2.pooler.supabase.com"
+DB_PORT = 5432
+DB_NAME = "postgres"
 TELEGRAM_TOKEN = os.environ['TELEGRAM_TOKEN']
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = openai_client
+
+# Cliente único da Bot API: reaproveita as conexões TLS com api.telegram.org entre chamadas.
+telegram = TelegramClient(
+    TELEGRAM_TOKEN,
+    timeout_conexao=TELEGRAM_TIMEOUT_CONEXAO,
+    timeout_leitura=TELEGRAM_TIMEOUT_LEITURA,
+    max_tentativas=TELEGRAM_MAX_TENTATIVAS,
+    backoff_base=TELEGRAM_BACKOFF_BASE,
+    retry_after_max=TELEGRAM_RETRY_AFTER_MAX,
+    pool_maxsize=TELEGRAM_POOL_CONEXOES,
+)
+# O link de download devolvido pelo getFile vale por cerca de uma hora; guardamos um pouco menos.
+_file_url_cache = CacheLRU(max_itens=2000, ttl=TELEGRAM_FILE_URL_TTL)
+
+# Cache da janela de histórico por user_id, evitando reler o Supabase a cada turno.
+# É por processo: com HISTORICO_CACHE_VALIDAR, cada uso da janela é conferido no banco (no próprio INSERT ao
+# gravar um turno, ver _gravar_e_conferir_janela; numa consulta só de índice nas leituras, ver _janela_em_cache),
+# o que cobre mensagens gravadas ou apagadas por outros workers do gunicorn, pelo worker da fila ou pela limpeza.
+historico_cache = HistoricoCache(
+    limite=HISTORICO_LIMITE,
+    max_usuarios=HISTORICO_CACHE_MAX_USUARIOS,
+    ttl=HISTORICO_CACHE_TTL,
+    max_bytes=HISTORICO_CACHE_MAX_BYTES,
+) if HISTORICO_CACHE_ATIVO else None
 
 
 # Cria o pool de conexões
 # minconn: Número mínimo de conexões ociosas no pool
 # maxconn: Número máximo de conexões que o pool pode ter
-# O pool é global para ser acessível por todas as funções.
+# timeout: quanto tempo obter uma conexão espera quando todas estão em uso
+# idade_maxima / ping_apos_ocioso: reciclagem e teste de conexões que o pooler do Supabase pode ter derrubado
+# O pool é global e thread-safe, para ser acessível por todas as funções e threads.
 # Adicionamos um try-except para a inicialização do pool, pois ela é crítica.
 
 try:
-    connection_pool= pool.SimpleConnectionPool(minconn=1, maxconn=10, dsn=f"user=postgres.ohwzezjffhjhetzsnjdd password={DB_PASSWORD} host=aws-0-us-east-2.pooler.supabase.com port=5432 dbname=postgres ")
+    connection_pool= PoolDeConexoes(
+        dsn=f"user={DB_USER} password={DB_PASSWORD} host={DB_HOST} port={DB_PORT} dbname={DB_NAME} ",
+        minconn=DB_POOL_MIN,
+        maxconn=DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        idade_maxima=DB_POOL_IDADE_MAXIMA,
+        ping_apos_ocioso=DB_POOL_PING_OCIOSO,
+        keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+    )
     print("Connection pool established")
 except Exception as e:
     print(f"ERRO: Não foi possível criar o pool de conexões do Supabase. Verifique a SUPABASE_URL. Erro: {e}")
@@ -37,7 +85,7 @@ def get_db_connection():
     """Obtém uma conexão do pool."""
     # Retorna uma conexão do pool. Erros na obtenção serão propagados.
     try:
-        return connection_pool.getconn()
+        return connection_pool.obter()
     except Exception as e:
         print(f"ERRO: Falha ao obter conexão do pool. Erro: {e}")
         raise  # Re-lança a exceção para ser tratada pela função chamadora
@@ -46,24 +94,39 @@ def put_db_connection(con):
     """Devolve uma conexão ao pool."""
     if con: # Garante que a conexão existe antes de tentar devolvê-la
         try:
-            connection_pool.putconn(con)
+            connection_pool.devolver(con)
         except Exception as e:
             print(f"AVISO: Falha ao devolver conexão ao pool. Erro: {e}")
             # Este é um erro menos crítico, apenas logamos. A conexão pode ser perdida.
 
+@contextmanager
+def db_connection():
+    """
+    Empresta uma conexão do pool durante o bloco with.
+    Se o bloco levantar exceção a transação é desfeita; conexões quebradas são descartadas em vez de voltar ao pool.
+    """
+    conn = get_db_connection()
+    descartar = False
+    try:
+        yield conn
+    except Exception as e:
+        descartar = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()  # Desfaz a transação em caso de erro
+            except psycopg2.Error:
+                descartar = True
+        raise
+    finally:
+        connection_pool.devolver(conn, descartar=descartar)
 
-def enviar_mensagem_telegram(chat_id, texto):
-    token = os.getenv('TELEGRAM_TOKEN')
-    if not token:
-        print("ERRO: TELEGRAM_TOKEN não configurado nas variáveis de ambiente.")
-        raise ValueError("Token do Telegram não configurado.")
+def estatisticas_pool_db():
+    return connection_pool.estatisticas()
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {"chat_id":chat_id , "text":texto}
 
+def enviar_mensagem_telegram(chat_id, texto):
     try:
-        response=requests.post(url, json=payload)
-        response.raise_for_status()  # Lança um erro para status HTTP 4xx/5xx
+        telegram.enviar_mensagem(chat_id, texto)
         print(f"Mensagem enviada para {chat_id} com sucesso.")
 
     except requests.exceptions.RequestException as e:
@@ -71,117 +134,372 @@ def enviar_mensagem_telegram(chat_id, texto):
         raise  # Re-lança a exceção para ser tratada nas rotas
 
 
+def estatisticas_telegram():
+    return telegram.estatisticas()
+
+
 def inserir_mensagem(user_id, role, message_content):
-    conn = None
-    cur = None
     if isinstance(message_content, str):
         message_content = {"content": message_content}
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""INSERT INTO tabelademensagens(user_id, role, messages) VALUES (%s, %s, %s)""",
-                    (user_id, role,Json(message_content)))
-        conn.commit()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""INSERT INTO tabelademensagens(user_id, role, messages) VALUES (%s, %s, %s) RETURNING id""",
+                        (user_id, role,Json(message_content)))
+            mensagem_id = cur.fetchone()[0]
+            conn.commit()
         print(f"Mensagem inserida para user_id: {user_id}, role: {role}")
     except psycopg2.Error as e: # Captura erros específicos do psycopg2
         print(f"ERRO DB: Falha ao inserir mensagem para user_id {user_id}. Erro: {e}")
-        if conn:
-            conn.rollback() # Desfaz a transação em caso de erro
         raise # Re-lança a exceção
     except Exception as e: # Captura quaisquer outras exceções inesperadas
         print(f"ERRO INESPERADO: Falha ao inserir mensagem para user_id {user_id}. Erro: {e}")
-        if conn:
-            conn.rollback()
         raise
-    finally:
-        if cur:
-            cur.close()
-        put_db_connection(conn)
+    if historico_cache:
+        historico_cache.anexar(user_id, (mensagem_id, role, conteudo_do_historico(message_content)))
+    return mensagem_id
+
+def registrar_e_buscar_historico(user_id, role, message_content):
+    """
+    Insere a mensagem e devolve a janela de histórico já incluindo ela, em uma única ida ao banco
+    (ou nenhuma leitura, se a janela estiver em cache). Substitui inserir_mensagem + buscar_historico.
+    """
+    return registrar_mensagens(user_id, [(role, message_content)], retornar_historico=True)
+
+def registrar_resposta(user_id, resposta, proxima_mensagem=None):
+    """
+    Grava a resposta do assistente e, opcionalmente, a próxima mensagem do usuário no mesmo lote.
+    Com proxima_mensagem, devolve a janela de histórico atualizada para o próximo turno.
+    """
+    mensagens = [("assistant", resposta)]
+    if proxima_mensagem is not None:
+        mensagens.append(("user", proxima_mensagem))
+    return registrar_mensagens(user_id, mensagens, retornar_historico=proxima_mensagem is not None)
+
+def registrar_mensagens(user_id, mensagens, retornar_historico=False):
+    """
+    Grava várias mensagens [(role, conteúdo), ...] em um único INSERT.
+    Com retornar_historico=True devolve a janela de histórico após a gravação; se ela não estiver
+    em cache, o INSERT e o SELECT vão juntos em uma CTE. Com a janela em cache, a conferência dela
+    (HISTORICO_CACHE_VALIDAR) vai no mesmo INSERT: continua sendo uma ida ao banco.
+    """
+    janela = historico_cache.obter(user_id) if historico_cache and historico_cache.contem(user_id) else None
+    if janela is not None:
+        if HISTORICO_CACHE_VALIDAR:
+            registros, atual = _gravar_e_conferir_janela(user_id, mensagens, janela)
+        else:
+            registros, atual = _gravar_mensagens(user_id, mensagens, ler_janela=False), True
+        if atual:
+            for registro in registros:
+                historico_cache.anexar(user_id, registro)
+            if not retornar_historico:
+                return None
+            janela = juntar_na_janela(janela, registros, historico_cache.limite)
+            return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in janela]
+        # Outro processo gravou ou apagou mensagens: a janela é relida (só neste caso, uma segunda ida ao banco)
+        historico_cache.invalidar(user_id)
+        if not retornar_historico:
+            return None
+        registros = historico_cache.carregar(user_id, lambda: _ler_janela_historico(user_id))
+        return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in registros]
+
+    if not retornar_historico:
+        _gravar_mensagens(user_id, mensagens, ler_janela=False)
+        return None
+
+    if historico_cache:
+        registros = historico_cache.carregar(user_id, lambda: _gravar_mensagens(user_id, mensagens, ler_janela=True))
+    else:
+        registros = _gravar_mensagens(user_id, mensagens, ler_janela=True)
+    return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in registros]
+
+def _gravar_mensagens(user_id, mensagens, ler_janela):
+    """
+    Executa o INSERT em lote e retorna registros (id, role, content): só os inseridos,
+    ou a janela de HISTORICO_LIMITE mensagens em ordem crescente se ler_janela=True.
+    """
+    valores = []
+    for role, message_content in mensagens:
+        if isinstance(message_content, str):
+            message_content = {"content": message_content}
+        valores.extend([user_id, role, Json(message_content)])
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(mensagens))
+    if ler_janela:
+        # A SELECT externa não enxerga as linhas da CTE de INSERT, por isso elas entram pelo UNION ALL.
+        sql = f"""WITH novas AS (
+                     INSERT INTO tabelademensagens(user_id, role, messages) VALUES {placeholders}
+                     RETURNING id, role, messages)
+                  SELECT id, role, messages FROM (
+                     SELECT id, role, messages FROM novas
+                     UNION ALL
+                     (SELECT id, role, messages FROM tabelademensagens WHERE user_id=%s ORDER BY id DESC LIMIT %s)
+                  ) janela ORDER BY id DESC LIMIT %s"""
+        valores.extend([user_id, HISTORICO_LIMITE, HISTORICO_LIMITE])
+    else:
+        sql = f"""INSERT INTO tabelademensagens(user_id, role, messages) VALUES {placeholders} RETURNING id, role, messages"""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, valores)
+            linhas = cur.fetchall()
+            conn.commit()
+        print(f"{len(mensagens)} mensagem(ns) inserida(s) para user_id: {user_id}")
+        linhas.sort(key=lambda linha: linha[0])
+        return [(mensagem_id, role, conteudo_do_historico(msg)) for mensagem_id, role, msg in linhas]
+    except psycopg2.Error as e:
+        print(f"ERRO DB: Falha ao registrar mensagens para user_id {user_id}. Erro: {e}")
+        raise
+    except Exception as e:
+        print(f"ERRO INESPERADO: Falha ao registrar mensagens para user_id {user_id}. Erro: {e}")
+        raise
+
+def _gravar_e_conferir_janela(user_id, mensagens, janela):
+    """
+    INSERT em lote que também confere a janela em cache: a CTE `antes` lê o banco como estava antes
+    do INSERT (mesma quantidade e maior id a partir da primeira mensagem da janela, só pelo índice).
+    Retorna (registros inseridos, se a janela ainda estava atual).
+    """
+    valores = []
+    for role, message_content in mensagens:
+        if isinstance(message_content, str):
+            message_content = {"content": message_content}
+        valores.extend([user_id, role, Json(message_content)])
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(mensagens))
+    primeiro = janela[0][0] if janela else 0
+    valores.extend([user_id, primeiro])
+    sql = f"""WITH novas AS (
+                 INSERT INTO tabelademensagens(user_id, role, messages) VALUES {placeholders}
+                 RETURNING id, role, messages),
+              antes AS (
+                 SELECT COUNT(*) AS quantidade, COALESCE(MAX(id), 0) AS ultimo_id
+                   FROM tabelademensagens WHERE user_id=%s AND id >= %s)
+              SELECT novas.id, novas.role, novas.messages, antes.quantidade, antes.ultimo_id
+                FROM novas CROSS JOIN antes"""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, valores)
+            linhas = cur.fetchall()
+            conn.commit()
+    except psycopg2.Error as e:
+        print(f"ERRO DB: Falha ao registrar mensagens para user_id {user_id}. Erro: {e}")
+        raise
+    print(f"{len(mensagens)} mensagem(ns) inserida(s) para user_id: {user_id}")
+    _, _, _, quantidade, ultimo_id = linhas[0]
+    atual = janela_confere(janela, quantidade, ultimo_id)
+    linhas.sort(key=lambda linha: linha[0])
+    return [(mensagem_id, role, conteudo_do_historico(msg)) for mensagem_id, role, msg, _, _ in linhas], atual
+
+def janela_confere(janela, quantidade, ultimo_id):
+    """Se a contagem e o maior id lidos no banco a partir da primeira mensagem da janela batem com ela."""
+    return quantidade == len(janela) and ultimo_id == (janela[-1][0] if janela else 0)
+
+def juntar_na_janela(janela, registros, limite):
+    """A janela com os registros recém-gravados, em ordem de id, limitada às últimas `limite` mensagens."""
+    por_id = {registro[0]: registro for registro in (*janela, *registros)}
+    return [por_id[mensagem_id] for mensagem_id in sorted(por_id)][-limite:]
+
+def conteudo_do_historico(msg):
+    # Se o conteúdo é um dicionário e tem a chave 'content',
+    # extraímos apenas o valor. Se for um objeto multimodal, ele já está no formato correto.
+    if isinstance(msg, dict) and 'content' in msg:
+        return msg['content']
+    return msg
 
 def buscar_historico(user_id):
-    conn = None
-    cur = None
+    if historico_cache:
+        registros = _janela_em_cache(user_id)
+        if registros is None:
+            registros = historico_cache.carregar(user_id, lambda: _ler_janela_historico(user_id))
+    else:
+        registros = _ler_janela_historico(user_id)
+    return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in registros]
+
+def _janela_em_cache(user_id):
+    """Retorna a janela em cache do user_id, ou None se não houver ou se outro processo já a tornou obsoleta."""
+    registros = historico_cache.obter(user_id)
+    if registros is None or not HISTORICO_CACHE_VALIDAR or _janela_atual(user_id, registros):
+        return registros
+    historico_cache.invalidar(user_id)
+    return None
+
+def _janela_atual(user_id, registros):
+    """
+    Confere se a janela ainda bate com o banco: a partir da primeira mensagem dela, a mesma quantidade
+    e o mesmo maior id. Lê só o índice (user_id, id), sem o conteúdo das mensagens.
+    """
+    primeiro = registros[0][0] if registros else 0
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM tabelademensagens WHERE user_id=%s AND id >= %s",
+                    (user_id, primeiro))
+        quantidade, ultimo_id = cur.fetchone()
+    return janela_confere(registros, quantidade, ultimo_id)
+
+def estatisticas_cache_historico():
+    return historico_cache.estatisticas() if historico_cache else {}
+
+def _ler_janela_historico(user_id):
+    """Lê as últimas HISTORICO_LIMITE mensagens do banco como registros (id, role, content)."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""SELECT role, messages FROM tabelademensagens WHERE user_id=%s ORDER BY id DESC LIMIT 20""", (user_id,))
-        mensagens = cur.fetchall()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""SELECT id, role, messages FROM tabelademensagens WHERE user_id=%s ORDER BY id DESC LIMIT %s""",
+                        (user_id, HISTORICO_LIMITE))
+            mensagens = cur.fetchall()
         mensagens.reverse()
         print(f"Histórico buscado para user_id: {user_id}")
-        historico=[]
-        for role, msg in mensagens:
-            # Se o conteúdo é um dicionário e tem a chave 'content',
-            # extraímos apenas o valor. Se for um objeto multimodal, ele já está no formato correto.
-            if isinstance(msg, dict) and 'content' in msg:
-                historico.append({"role": role, "content": msg['content']})
-            else:
-                historico.append({"role": role, "content": msg})
-        return historico
+        return [(mensagem_id, role, conteudo_do_historico(msg)) for mensagem_id, role, msg in mensagens]
     except psycopg2.Error as e:
         print(f"ERRO DB: Falha ao buscar histórico para user_id {user_id}. Erro: {e}")
         raise
     except Exception as e:
         print(f"ERRO INESPERADO: Falha ao buscar histórico para user_id {user_id}. Erro: {e}")
         raise
-    finally:
-        if cur:
-            cur.close()
-        put_db_connection(conn)
+
+def versao_historico(user_id):
+    """
+    Retorna (maior id, quantidade) das mensagens do user_id, sem ler o conteúdo.
+    Muda a cada mensagem gravada e quando o histórico é apagado; serve de ETag para o histórico.
+    """
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM tabelademensagens WHERE user_id=%s", (user_id,))
+        return cur.fetchone()
+
+def etag_historico(user_id, *parametros):
+    """
+    Retorna (ETag sem aspas, maior id, quantidade) do histórico do user_id para uma consulta com os
+    parametros dados. A página deve ser buscada com ate=maior id, para sair da mesma versão do ETag.
+    """
+    ultimo_id, quantidade = versao_historico(user_id)
+    return "-".join(str(parte) for parte in ("h", ultimo_id, quantidade, *parametros)), ultimo_id, quantidade
+
+def buscar_pagina_historico(user_id, antes_de=None, depois_de=None, limite=HISTORICO_LIMITE, ate=None):
+    """
+    Paginação por id (keyset): as `limite` mensagens mais recentes anteriores a antes_de, as primeiras
+    depois de depois_de ou, sem cursor, as mais recentes. Retorna (registros, ha_mais) com os registros
+    (id, role, content) em ordem crescente; ha_mais indica que a consulta parou no limite.
+    A janela em cache atende a página quando a cobre, sem ir ao banco. Com ate (o maior id de
+    etag_historico), a página vai só até ele e a janela só serve se já chegou a esse id, para que o
+    conteúdo seja o da versão do ETag; sem ate, a janela é conferida no banco.
+    """
+    limite = max(1, min(limite, HISTORICO_PAGINA_MAX))
+    registros = None
+    if historico_cache and antes_de is None:
+        if ate is None:
+            registros = _janela_em_cache(user_id)
+        else:
+            registros = historico_cache.obter(user_id)
+            if registros is not None and (registros[-1][0] if registros else 0) < ate:
+                registros = None  # Janela atrasada em relação à versão (gravação feita por outro processo)
+    if registros is not None:
+        completo = len(registros) < historico_cache.limite  # A janela tem o histórico inteiro
+        if ate is not None:
+            registros = [r for r in registros if r[0] <= ate]
+        if depois_de is not None and (completo or (registros and registros[0][0] <= depois_de)):
+            novos = [r for r in registros if r[0] > depois_de]
+            return novos[:limite], len(novos) > limite
+        if depois_de is None and (completo or limite <= len(registros)):
+            return list(registros[-limite:]), len(registros) > limite or not completo
+
+    condicoes, params = ["user_id=%s"], [user_id]
+    if antes_de is not None:
+        condicoes.append("id < %s")
+        params.append(antes_de)
+    if depois_de is not None:
+        condicoes.append("id > %s")
+        params.append(depois_de)
+    if ate is not None:
+        condicoes.append("id <= %s")
+        params.append(ate)
+    ordem = "ASC" if depois_de is not None else "DESC"
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""SELECT id, role, messages FROM tabelademensagens WHERE {' AND '.join(condicoes)}
+                        ORDER BY id {ordem} LIMIT %s""", params + [limite + 1])
+        linhas = cur.fetchall()
+    ha_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+    linhas.sort(key=lambda linha: linha[0])
+    return [(mensagem_id, role, conteudo_do_historico(msg)) for mensagem_id, role, msg in linhas], ha_mais
 
 def deletar_historico(user_id):
-    conn = None
-    cur = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM tabelademensagens WHERE user_id=%s", (user_id,))
-        conn.commit()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM tabelademensagens WHERE user_id=%s", (user_id,))
+            conn.commit()
+        if historico_cache:
+            historico_cache.invalidar(user_id)
         print(f"Histórico deletado para user_id: {user_id}")
+        from app.utils.resumo import invalidar_resumo  # Import local: resumo depende deste módulo
+        invalidar_resumo(user_id)
     except psycopg2.Error as e:
         print(f"ERRO DB: Falha ao deletar histórico para user_id {user_id}. Erro: {e}")
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
         print(f"ERRO INESPERADO: Falha ao deletar histórico para user_id {user_id}. Erro: {e}")
-        if conn:
-            conn.rollback()
         raise
-    finally:
-        if cur:
-            cur.close()
-        put_db_connection(conn)
+
+def substituir_imagem_no_historico(user_id, url_imagem, texto):
+    """
+    Troca, nas mensagens do usuário, a imagem url_imagem por uma parte de texto, mantendo as demais partes.
+    Retorna quantas mensagens foram alteradas.
+    """
+    filtro = [{"image_url": {"url": url_imagem}}]
+    alteradas = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            # FOR UPDATE: duas fotos do mesmo álbum podem falhar ao mesmo tempo na mesma mensagem
+            cur.execute("SELECT id, messages FROM tabelademensagens WHERE user_id=%s AND messages @> %s FOR UPDATE",
+                        (user_id, Json(filtro)))
+            for mensagem_id, partes in cur.fetchall():
+                novas = [{"type": "text", "text": texto}
+                         if isinstance(parte, dict) and (parte.get("image_url") or {}).get("url") == url_imagem
+                         else parte for parte in partes]
+                cur.execute("UPDATE tabelademensagens SET messages=%s WHERE id=%s", (Json(novas), mensagem_id))
+                alteradas += 1
+            conn.commit()
+    except psycopg2.Error as e:
+        print(f"ERRO DB: Falha ao substituir imagem para user_id {user_id}. Erro: {e}", file=sys.stderr)
+        raise
+    if historico_cache:
+        historico_cache.invalidar(user_id)
+    return alteradas
 
 def get_file_url_telegram(file_id: str) -> str:
-    if not TELEGRAM_TOKEN:
-        print("TELEGRAM_TOKEN não configurado.", file=sys.stderr)
+    url = _file_url_cache.obter(file_id)
+    if url:
+        return url
+    try:
+        file_path = telegram.obter_file_path(file_id)
+    except TelegramErro as e:
+        print(f"Erro ao obter file_path do Telegram para file_id {file_id}: {e}", file=sys.stderr)
         return None
-    get_file_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getFile?file_id={file_id}"
-    response = requests.get(get_file_url)
-    file_info = response.json()
-    if file_info.get('ok') and 'file_path' in file_info['result']:
-        file_path = file_info['result']['file_path']
-        return f"https://api.telegram.org/file/bot{TELEGRAM_TOKEN}/{file_path}"
-    print(f"Erro ao obter file_path do Telegram para file_id {file_id}: {file_info}", file=sys.stderr)
-    return None
+    if not file_path:
+        print(f"Erro ao obter file_path do Telegram para file_id {file_id}: resposta sem file_path", file=sys.stderr)
+        return None
+    url = telegram.url_arquivo(file_path)
+    _file_url_cache.definir(file_id, url)
+    return url
 
-def download_file(url: str, save_path: str):
+def baixar_arquivo(url: str, limite_memoria: int = MIDIA_LIMITE_MEMORIA):
+    """
+    Baixa a URL para um buffer que fica em memória até limite_memoria bytes e só então vai para disco.
+    Retorna o buffer posicionado no início; o chamador deve fechá-lo (pode usar with).
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=limite_memoria)
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        print(f"Arquivo baixado para: {save_path}")
+        telegram.baixar(url, buffer)
     except requests.exceptions.RequestException as e:
-        print(f"Erro ao baixar arquivo da URL {url}: {e}")
-        raise
-    except IOError as e:
-        print(f"Erro ao salvar arquivo em {save_path}: {e}")
+        buffer.close()
+        print(f"Erro ao baixar arquivo da URL {url}: {e}", file=sys.stderr)
         raise
+    buffer.seek(0)
+    return buffer
 
-def transcrever_audio(file_path):
-    with open(file_path, "rb") as audio_file:
+def transcrever_audio(arquivo):
+    """
+    Transcreve o áudio com o Whisper. arquivo pode ser um caminho ou uma tupla (nome, buffer);
+    o nome (ex.: 'voz.ogg') indica o formato do áudio para a API.
+    """
+    if isinstance(arquivo, tuple):
+        transcription = client.audio.transcriptions.create(model="whisper-1", file=arquivo)
+        return transcription.text
+    with open(arquivo, "rb") as audio_file:
         transcription = client.audio.transcriptions.create(
             model="whisper-1",
             file=audio_file
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import sys
+from config import ASYNC_DB_POOL_MIN, ASYNC_DB_POOL_MAX, HISTORICO_CACHE_VALIDAR
+from app.utils import helpers
+from app.utils.helpers import (historico_cache, conteudo_do_historico, janela_confere, juntar_na_janela,
+                               HISTORICO_LIMITE)
+
+# Versões assíncronas das funções de histórico, usadas pelo modo ASGI (asgi.py).
+# Com asyncpg instalado as consultas rodam no event loop; sem ele, as funções síncronas
+# de helpers rodam em threads (asyncio.to_thread), com o mesmo comportamento.
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+_pool = None
+_pool_lock = None
+
+
+async def _configurar_conexao(conn):
+    await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def _obter_pool():
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    user=helpers.DB_USER, password=helpers.DB_PASSWORD, host=helpers.DB_HOST,
+                    port=helpers.DB_PORT, database=helpers.DB_NAME,
+                    min_size=ASYNC_DB_POOL_MIN, max_size=ASYNC_DB_POOL_MAX,
+                    statement_cache_size=0,  # Compatível com o pooler (pgbouncer) do Supabase
+                    init=_configurar_conexao,
+                )
+                print("Async connection pool established", file=sys.stderr)
+    return _pool
+
+
+async def fechar_pool_async():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def registrar_e_buscar_historico_async(user_id, role, message_content):
+    return await registrar_mensagens_async(user_id, [(role, message_content)], retornar_historico=True)
+
+
+async def registrar_resposta_async(user_id, resposta, proxima_mensagem=None):
+    mensagens = [("assistant", resposta)]
+    if proxima_mensagem is not None:
+        mensagens.append(("user", proxima_mensagem))
+    return await registrar_mensagens_async(user_id, mensagens, retornar_historico=proxima_mensagem is not None)
+
+
+async def registrar_mensagens_async(user_id, mensagens, retornar_historico=False):
+    """Mesma semântica de helpers.registrar_mensagens, incluindo o cache de histórico."""
+    if asyncpg is None:
+        return await asyncio.to_thread(helpers.registrar_mensagens, user_id, mensagens, retornar_historico)
+
+    janela = historico_cache.obter(user_id) if historico_cache and historico_cache.contem(user_id) else None
+    if janela is not None:
+        # A conferência da janela (HISTORICO_CACHE_VALIDAR) vai no mesmo INSERT
+        registros = await _gravar_mensagens_async(user_id, mensagens, ler_janela=False,
+                                                  conferir=janela if HISTORICO_CACHE_VALIDAR else None)
+        if registros is not None:
+            for registro in registros:
+                historico_cache.anexar(user_id, registro)
+            if not retornar_historico:
+                return None
+            janela = juntar_na_janela(janela, registros, historico_cache.limite)
+            return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in janela]
+        # Outro processo gravou ou apagou mensagens: a janela vem do banco pelo asyncpg
+        historico_cache.invalidar(user_id)
+        if not retornar_historico:
+            return None
+        registros = await historico_cache.carregar_async(user_id, lambda: _ler_janela_async(user_id))
+        return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in registros]
+
+    if not retornar_historico:
+        await _gravar_mensagens_async(user_id, mensagens, ler_janela=False)
+        return None
+
+    if historico_cache:
+        registros = await historico_cache.carregar_async(
+            user_id, lambda: _gravar_mensagens_async(user_id, mensagens, ler_janela=True))
+    else:
+        registros = await _gravar_mensagens_async(user_id, mensagens, ler_janela=True)
+    return [{"id": mensagem_id, "role": role, "content": content} for mensagem_id, role, content in registros]
+
+
+async def _ler_janela_async(user_id):
+    try:
+        pool = await _obter_pool()
+        async with pool.acquire() as conn:
+            linhas = await conn.fetch(
+                "SELECT id, role, messages FROM tabelademensagens WHERE user_id=$1 ORDER BY id DESC LIMIT $2",
+                user_id, HISTORICO_LIMITE)
+    except Exception as e:
+        print(f"ERRO DB (async): Falha ao buscar histórico para user_id {user_id}. Erro: {e}", file=sys.stderr)
+        raise
+    return [(linha["id"], linha["role"], conteudo_do_historico(linha["messages"])) for linha in reversed(linhas)]
+
+
+async def _gravar_mensagens_async(user_id, mensagens, ler_janela, conferir=None):
+    """
+    Igual a helpers._gravar_mensagens. Com conferir (a janela em cache), o INSERT também confere a janela,
+    como helpers._gravar_e_conferir_janela, e retorna None se ela estava obsoleta (as mensagens são gravadas).
+    """
+    valores = [user_id]
+    placeholders = []
+    for role, message_content in mensagens:
+        if isinstance(message_content, str):
+            message_content = {"content": message_content}
+        valores.extend([role, message_content])
+        placeholders.append(f"($1, ${len(valores) - 1}, ${len(valores)})")
+    placeholders = ", ".join(placeholders)
+    if ler_janela:
+        valores.append(HISTORICO_LIMITE)
+        sql = f"""WITH novas AS (
+                     INSERT INTO tabelademensagens(user_id, role, messages) VALUES {placeholders}
+                     RETURNING id, role, messages)
+                  SELECT id, role, messages FROM (
+                     SELECT id, role, messages FROM novas
+                     UNION ALL
+                     (SELECT id, role, messages FROM tabelademensagens WHERE user_id=$1 ORDER BY id DESC LIMIT ${len(valores)})
+                  ) janela ORDER BY id DESC LIMIT ${len(valores)}"""
+    elif conferir is not None:
+        valores.append(conferir[0][0] if conferir else 0)
+        sql = f"""WITH novas AS (
+                     INSERT INTO tabelademensagens(user_id, role, messages) VALUES {placeholders}
+                     RETURNING id, role, messages),
+                  antes AS (
+                     SELECT COUNT(*) AS quantidade, COALESCE(MAX(id), 0) AS ultimo_id
+                       FROM tabelademensagens WHERE user_id=$1 AND id >= ${len(valores)})
+                  SELECT novas.id, novas.role, novas.messages, antes.quantidade, antes.ultimo_id
+                    FROM novas CROSS JOIN antes"""
+    else:
+        sql = f"""INSERT INTO tabelademensagens(user_id, role, messages) VALUES {placeholders} RETURNING id, role, messages"""
+    try:
+        pool = await _obter_pool()
+        async with pool.acquire() as conn:
+            linhas = await conn.fetch(sql, *valores)
+    except Exception as e:
+        print(f"ERRO DB (async): Falha ao registrar mensagens para user_id {user_id}. Erro: {e}", file=sys.stderr)
+        raise
+    print(f"{len(mensagens)} mensagem(ns) inserida(s) para user_id: {user_id}")
+    if conferir is not None and not janela_confere(conferir, linhas[0]["quantidade"], linhas[0]["ultimo_id"]):
+        return None
+    registros = sorted(((linha["id"], linha["role"], conteudo_do_historico(linha["messages"])) for linha in linhas),
+                       key=lambda r: r[0])
+    return registros
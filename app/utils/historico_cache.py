@@ -0,0 +1,91 @@
+import json
+import threading
+from app.utils.cache import CacheLRU
+
+
+def _tamanho_registros(registros):
+    """Estimativa barata do tamanho em bytes de uma janela de histórico."""
+    total = 0
+    for _, role, content in registros:
+        texto = content if isinstance(content, str) else json.dumps(content)
+        total += 64 + len(role) + len(texto)
+    return total
+
+
+class HistoricoCache:
+    """
+    Cache write-through da janela de histórico de cada user_id.
+    Cada mensagem é guardada como uma tupla compacta (id, role, content), em ordem crescente de id.
+    """
+
+    def __init__(self, limite=20, max_usuarios=1000, ttl=300, max_bytes=None):
+        self.limite = limite
+        self._cache = CacheLRU(max_itens=max_usuarios, ttl=ttl, max_bytes=max_bytes,
+                               tamanho_fn=_tamanho_registros)
+        self._carregando = {}  # user_id -> ticket da leitura do banco em andamento
+        self._lock = threading.Lock()
+
+    def obter(self, user_id):
+        """Retorna a tupla de registros do user_id ou None se não estiver em cache."""
+        return self._cache.obter(user_id)
+
+    def contem(self, user_id):
+        """Indica se o user_id está em cache, sem contar como hit ou miss."""
+        return user_id in self._cache
+
+    def carregar(self, user_id, ler_do_banco):
+        """
+        Executa ler_do_banco() (que retorna a lista de registros) e guarda o resultado.
+        Se houver escrita ou invalidação para o user_id durante a leitura, o resultado não é guardado,
+        pois pode não conter a mensagem recém-escrita.
+        """
+        ticket = self._iniciar_carga(user_id)
+        registros = None
+        try:
+            registros = ler_do_banco()
+            return registros
+        finally:
+            self._concluir_carga(user_id, ticket, registros)
+
+    async def carregar_async(self, user_id, ler_do_banco):
+        """Igual a carregar, para uma corrotina ler_do_banco() (modo ASGI)."""
+        ticket = self._iniciar_carga(user_id)
+        registros = None
+        try:
+            registros = await ler_do_banco()
+            return registros
+        finally:
+            self._concluir_carga(user_id, ticket, registros)
+
+    def _iniciar_carga(self, user_id):
+        ticket = object()
+        with self._lock:
+            self._carregando[user_id] = ticket
+        return ticket
+
+    def _concluir_carga(self, user_id, ticket, registros):
+        with self._lock:
+            valido = self._carregando.get(user_id) is ticket
+            if valido:
+                del self._carregando[user_id]
+            if valido and registros is not None:
+                self._cache.definir(user_id, tuple(registros[-self.limite:]))
+
+    def anexar(self, user_id, registro):
+        """Acrescenta uma mensagem recém-gravada à janela em cache (se o user_id estiver em cache)."""
+        def _anexar(registros):
+            if any(r[0] == registro[0] for r in registros):
+                return registros
+            return tuple(sorted(registros + (registro,), key=lambda r: r[0])[-self.limite:])
+
+        with self._lock:
+            self._carregando.pop(user_id, None)
+            self._cache.atualizar(user_id, _anexar)
+
+    def invalidar(self, user_id):
+        with self._lock:
+            self._carregando.pop(user_id, None)
+            self._cache.invalidar(user_id)
+
+    def estatisticas(self):
+        return self._cache.estatisticas()
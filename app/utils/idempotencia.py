@@ -0,0 +1,197 @@
+import asyncio
+import threading
+from config import IDEMPOTENCIA_TTL, IDEMPOTENCIA_MAX_ITENS, UPDATES_VISTOS_MAX
+from app.utils.cache import CacheLRU
+
+# Proteção contra trabalho repetido:
+# - updates do Telegram reenviados (mesmo update_id) são descartados no webhook;
+# - requisições HTTP repetidas com o mesmo cabeçalho Idempotency-Key recebem o mesmo resultado.
+#   Se a original ainda está em andamento, as repetidas esperam por ela em vez de gravar a mensagem
+#   e chamar a OpenAI de novo. Erros não ficam guardados: a próxima tentativa executa de novo. O mesmo vale
+#   para resultados que quem chama marca como falha (guardar), como o pedido de desculpas da OpenAI fora do ar.
+# Respostas em stream não podem esperar pela original: reservar() diz se a chave já terminou (e com que
+# resultado) ou se ainda está em andamento, para a rota repetir a resposta guardada ou recusar com 409.
+# Tudo é por processo, como os demais caches. Com a fila no Postgres, o índice único de update_id em
+# jobs_webhook só barra o reenvio enquanto o job original está na tabela (ele é apagado ao concluir):
+# depois disso, quem barra é updates_vistos, no processo que recebeu o update.
+
+
+class ConjuntoVistos:
+    """Conjunto limitado (LRU + TTL) de chaves já vistas, com marcação atômica."""
+
+    def __init__(self, max_itens, ttl):
+        self._cache = CacheLRU(max_itens=max_itens, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def marcar(self, chave):
+        """Marca a chave como vista. Retorna False se ela já tinha sido vista (duplicata)."""
+        with self._lock:
+            if chave in self._cache:
+                return False
+            self._cache.definir(chave, True)
+            return True
+
+    def esquecer(self, chave):
+        self._cache.invalidar(chave)
+
+    def estatisticas(self):
+        return self._cache.estatisticas()
+
+
+class _EmAndamento:
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class SingleFlight:
+    """
+    Executa funcao() uma vez por chave: chamadas concorrentes com a mesma chave esperam a primeira
+    e recebem o mesmo resultado (ou a mesma exceção), e chamadas posteriores recebem o resultado
+    guardado por `ttl` segundos, exceto quando guardar(resultado) é falso.
+    Tem versão síncrona (threads) e assíncrona (asyncio).
+    """
+
+    def __init__(self, max_itens, ttl):
+        self._resultados = CacheLRU(max_itens=max_itens, ttl=ttl)
+        self._em_andamento = {}        # chave -> _EmAndamento
+        self._em_andamento_async = {}  # chave -> asyncio.Future
+        self._lock = threading.Lock()
+        self.compartilhadas = 0
+
+    def executar(self, chave, funcao, guardar=None):
+        with self._lock:
+            resultado = self._resultados.obter(chave, _AUSENTE)
+            if resultado is not _AUSENTE:
+                self.compartilhadas += 1
+                return resultado
+            voo = self._em_andamento.get(chave)
+            lider = voo is None
+            if lider:
+                voo = _EmAndamento()
+                self._em_andamento[chave] = voo
+            else:
+                self.compartilhadas += 1
+
+        if not lider:
+            voo.pronto.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado
+
+        try:
+            voo.resultado = funcao()
+            if guardar is None or guardar(voo.resultado):
+                self._resultados.definir(chave, voo.resultado)
+            return voo.resultado
+        except Exception as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            voo.pronto.set()
+
+    async def executar_async(self, chave, funcao_async, guardar=None):
+        with self._lock:
+            resultado = self._resultados.obter(chave, _AUSENTE)
+            if resultado is not _AUSENTE:
+                self.compartilhadas += 1
+                return resultado
+            futuro = self._em_andamento_async.get(chave)
+            lider = futuro is None
+            if lider:
+                futuro = asyncio.get_running_loop().create_future()
+                self._em_andamento_async[chave] = futuro
+            else:
+                self.compartilhadas += 1
+
+        if not lider:
+            return await asyncio.shield(futuro)
+
+        try:
+            resultado = await funcao_async()
+            if guardar is None or guardar(resultado):
+                self._resultados.definir(chave, resultado)
+            futuro.set_result(resultado)
+            return resultado
+        except Exception as e:
+            futuro.set_exception(e)
+            futuro.exception()  # Marca como recuperada para o asyncio não avisar quando não há quem espere
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento_async[chave]
+
+    def reservar(self, chave):
+        """
+        Versão sem espera de executar(), para quem entrega o resultado aos poucos: retorna o resultado guardado,
+        EM_ANDAMENTO se outra requisição com a chave ainda não terminou, ou None quando quem chamou passa a ser
+        o dono da chave e deve chamar liberar() ao terminar.
+        """
+        with self._lock:
+            resultado = self._resultados.obter(chave, _AUSENTE)
+            if resultado is not _AUSENTE:
+                self.compartilhadas += 1
+                return resultado
+            if chave in self._em_andamento or chave in self._em_andamento_async:
+                self.compartilhadas += 1
+                return EM_ANDAMENTO
+            self._em_andamento[chave] = _EmAndamento()
+            return None
+
+    def liberar(self, chave, resultado=None):
+        """Encerra uma reserva, guardando o resultado se houver. Chamadas repetidas são ignoradas."""
+        with self._lock:
+            voo = self._em_andamento.pop(chave, None)
+            if voo is None:
+                return
+            if resultado is not None:
+                self._resultados.definir(chave, resultado)
+        voo.resultado = resultado
+        voo.pronto.set()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                **self._resultados.estatisticas(),
+                "em_andamento": len(self._em_andamento) + len(self._em_andamento_async),
+                "compartilhadas": self.compartilhadas,
+            }
+
+
+_AUSENTE = object()
+EM_ANDAMENTO = object()
+
+updates_vistos = ConjuntoVistos(max_itens=UPDATES_VISTOS_MAX, ttl=24 * 3600)
+requisicoes = SingleFlight(max_itens=IDEMPOTENCIA_MAX_ITENS, ttl=IDEMPOTENCIA_TTL)
+
+
+def chave_idempotencia(rota, usuario, chave):
+    """Chave completa, separada por rota e usuário para que clientes diferentes não colidam. None sem cabeçalho."""
+    chave = (chave or '').strip()
+    if not chave:
+        return None
+    return f"{rota}:{usuario}:{chave[:200]}"
+
+
+def executar_idempotente(chave, funcao, guardar=None):
+    return requisicoes.executar(chave, funcao, guardar) if chave else funcao()
+
+
+async def executar_idempotente_async(chave, funcao_async, guardar=None):
+    return await requisicoes.executar_async(chave, funcao_async, guardar) if chave else await funcao_async()
+
+
+def reservar_idempotente(chave):
+    return requisicoes.reservar(chave) if chave else None
+
+
+def liberar_idempotente(chave, resultado=None):
+    if chave:
+        requisicoes.liberar(chave, resultado)
+
+
+def estatisticas_idempotencia():
+    return {"updates_vistos": updates_vistos.estatisticas(), "requisicoes": requisicoes.estatisticas()}
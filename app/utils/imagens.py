@@ -0,0 +1,92 @@
+import io
+import math
+import sys
+import threading
+
+# Pré-processamento das fotos antes de irem para o Storage e para o modelo de visão:
+# escolhe o menor tamanho do Telegram que atende à resolução alvo e, com Pillow instalado,
+# reduz e recomprime localmente o que ainda passar dela.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+_stats = {"imagens": 0, "redimensionadas": 0, "bytes_originais": 0, "bytes_enviados": 0,
+          "tokens_originais": 0, "tokens_enviados": 0}
+_stats_lock = threading.Lock()
+
+
+def escolher_tamanho_foto(tamanhos, lado_alvo):
+    """
+    Entre os PhotoSize do Telegram (message['photo']), retorna o menor cujo lado menor
+    é >= lado_alvo; se nenhum chega lá, o maior disponível.
+    """
+    ordenados = sorted(tamanhos, key=lambda t: (t.get('width', 0) * t.get('height', 0), t.get('file_size', 0)))
+    for tamanho in ordenados:
+        if min(tamanho.get('width', 0), tamanho.get('height', 0)) >= lado_alvo:
+            return tamanho
+    return ordenados[-1]
+
+
+def tokens_visao(largura, altura, detalhe="auto"):
+    """
+    Estimativa dos tokens cobrados por uma imagem (regra publicada pela OpenAI para o gpt-4o):
+    'low' custa 85; 'high' reduz a imagem para caber em 2048x2048 e o lado menor para 768,
+    e cobra 170 por bloco de 512x512 mais 85. 'auto' é contado como 'high' (o pior caso).
+    """
+    if detalhe == "low" or not largura or not altura:
+        return 85
+    escala = min(1.0, 2048 / max(largura, altura))
+    largura, altura = largura * escala, altura * escala
+    escala = min(1.0, 768 / min(largura, altura))
+    largura, altura = largura * escala, altura * escala
+    return 170 * math.ceil(largura / 512) * math.ceil(altura / 512) + 85
+
+
+def reduzir_imagem(dados, lado_alvo, qualidade=85):
+    """
+    Reduz a imagem para que o lado menor fique em lado_alvo e a recomprime em JPEG.
+    Retorna (dados, largura, altura); sem Pillow, ou se não compensar, devolve os dados originais
+    (com largura/altura None quando não é possível lê-las).
+    """
+    if Image is None:
+        return dados, None, None
+    try:
+        with Image.open(io.BytesIO(dados)) as imagem:
+            largura, altura = imagem.size
+            if min(largura, altura) <= lado_alvo:
+                return dados, largura, altura
+            escala = lado_alvo / min(largura, altura)
+            nova = imagem.convert("RGB").resize((round(largura * escala), round(altura * escala)), Image.LANCZOS)
+            saida = io.BytesIO()
+            nova.save(saida, format="JPEG", quality=qualidade, optimize=True)
+    except Exception as e:
+        print(f"AVISO: Não foi possível redimensionar a imagem. Erro: {e}", file=sys.stderr)
+        return dados, None, None
+    reduzidos = saida.getvalue()
+    if len(reduzidos) >= len(dados):
+        return dados, largura, altura
+    return reduzidos, nova.width, nova.height
+
+
+def registrar_economia(bytes_originais, bytes_enviados, tokens_originais, tokens_enviados, redimensionada=False):
+    economia_bytes = bytes_originais - bytes_enviados
+    economia_tokens = tokens_originais - tokens_enviados
+    with _stats_lock:
+        _stats["imagens"] += 1
+        _stats["redimensionadas"] += int(redimensionada)
+        _stats["bytes_originais"] += bytes_originais
+        _stats["bytes_enviados"] += bytes_enviados
+        _stats["tokens_originais"] += tokens_originais
+        _stats["tokens_enviados"] += tokens_enviados
+    print(f"Imagem: {economia_bytes} bytes e {economia_tokens} tokens de visão economizados", file=sys.stderr)
+
+
+def estatisticas_imagens():
+    with _stats_lock:
+        return {
+            **_stats,
+            "bytes_economizados": _stats["bytes_originais"] - _stats["bytes_enviados"],
+            "tokens_economizados": _stats["tokens_originais"] - _stats["tokens_enviados"],
+            "pillow": Image is not None,
+        }
@@ -0,0 +1,266 @@
+import sys
+import threading
+import psycopg2
+from psycopg2.errors import UniqueViolation
+from psycopg2.extras import Json
+from app.utils.helpers import db_connection
+
+# Fila durável de jobs do webhook no Postgres.
+# Vários processos (python -m app.worker) consomem a mesma tabela com FOR UPDATE SKIP LOCKED.
+# Estados: 'pendente' -> 'executando' -> (apagado ao concluir) | 'pendente' (retry) | 'morto' (dead-letter)
+# Além dos updates do Telegram, há os jobs 'responder': a resposta agrupada de um chat, agendada pelos jobs
+# dos updates (no máximo um pendente por chat; cada mensagem nova adia o horário dele).
+# Se chega mensagem enquanto uma resposta está executando, ela para e a resposta seguinte (pendente) cobre o resto.
+# As fotos de um álbum viram um job 'album' só, com as mensagens no payload, montado na própria tabela:
+# assim o álbum não se divide entre processos do webhook nem entre workers.
+
+TIPO_RESPONDER = 'responder'
+TIPO_ALBUM = 'album'
+
+DDL_JOBS = """
+CREATE TABLE IF NOT EXISTS jobs_webhook (
+    id BIGSERIAL PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INT NOT NULL DEFAULT 0,
+    max_tentativas INT NOT NULL DEFAULT 5,
+    disponivel_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    bloqueado_ate TIMESTAMPTZ,
+    bloqueado_por TEXT,
+    ultimo_erro TEXT,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_webhook_ativos ON jobs_webhook (id) WHERE status IN ('pendente', 'executando');
+CREATE INDEX IF NOT EXISTS idx_jobs_webhook_chat ON jobs_webhook (chat_id, id) WHERE status IN ('pendente', 'executando');
+-- update_id do Telegram: um update reenviado enquanto o job original ainda está na tabela é ignorado
+ALTER TABLE jobs_webhook ADD COLUMN IF NOT EXISTS update_id BIGINT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_webhook_update ON jobs_webhook (update_id);
+-- Uma resposta pendente por chat: as mensagens seguintes só adiam a que já existe
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_webhook_responder ON jobs_webhook (chat_id)
+    WHERE tipo = 'responder' AND status = 'pendente';
+-- Um álbum pendente por media_group_id: as fotos seguintes entram no payload dele
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_webhook_album ON jobs_webhook ((payload->>'media_group_id'))
+    WHERE tipo = 'album' AND status = 'pendente';
+"""
+
+# Pega o job mais antigo disponível (ou cuja visibilidade expirou) sem bloquear os outros workers.
+# Um update só é elegível se não houver update anterior ativo do mesmo chat, mantendo a ordem por chat entre nós.
+# Uma resposta espera todos os updates ativos do chat (as mensagens deles ainda não foram gravadas) e a resposta
+# em execução, mas não segura os updates que chegam depois dela.
+SQL_RESERVAR = """
+UPDATE jobs_webhook j
+   SET status = 'executando',
+       tentativas = j.tentativas + 1,
+       bloqueado_ate = now() + make_interval(secs => %s),
+       bloqueado_por = %s,
+       atualizado_em = now()
+ WHERE j.id = (
+        SELECT c.id FROM jobs_webhook c
+         WHERE ((c.status = 'pendente' AND c.disponivel_em <= now())
+             OR (c.status = 'executando' AND c.bloqueado_ate < now()))
+           AND NOT EXISTS (
+                SELECT 1 FROM jobs_webhook a
+                 WHERE a.chat_id = c.chat_id AND a.id <> c.id
+                   AND a.status IN ('pendente', 'executando')
+                   AND CASE WHEN c.tipo = 'responder' THEN a.tipo <> 'responder' OR a.status = 'executando'
+                            ELSE a.tipo <> 'responder' AND a.id < c.id END)
+         ORDER BY c.id
+         LIMIT 1
+         FOR UPDATE SKIP LOCKED)
+RETURNING j.id, j.tipo, j.chat_id, j.payload, j.tentativas, j.max_tentativas
+"""
+
+_tabela_garantida = False
+_tabela_lock = threading.Lock()
+
+
+def garantir_tabela_jobs():
+    """Cria a tabela de jobs e seus índices, se ainda não existirem (uma vez por processo)."""
+    global _tabela_garantida
+    with _tabela_lock:
+        if _tabela_garantida:
+            return
+        _executar(DDL_JOBS, ())
+        _tabela_garantida = True
+
+
+def enfileirar_job(tipo, chat_id, payload, max_tentativas=5, update_id=None):
+    """Grava o job na fila e retorna seu id (None se o update_id já estiver na fila)."""
+    garantir_tabela_jobs()
+    row = _executar(
+        """INSERT INTO jobs_webhook(tipo, chat_id, payload, max_tentativas, update_id) VALUES (%s, %s, %s, %s, %s)
+           ON CONFLICT (update_id) DO NOTHING RETURNING id""",
+        (tipo, str(chat_id), Json(payload), max_tentativas, update_id), fetch=True)
+    return row[0] if row else None
+
+
+def agendar_resposta(chat_id, atraso, max_tentativas=5):
+    """
+    Agenda a resposta do chat para daqui a atraso segundos; se já houver uma pendente, só adia o horário dela
+    (sem antecipar uma nova tentativa que esteja em backoff).
+    O chat_id original (inteiro) vai no payload, para o envio usar a mesma chave dos handlers.
+    """
+    garantir_tabela_jobs()
+    _executar(
+        """INSERT INTO jobs_webhook(tipo, chat_id, payload, max_tentativas, disponivel_em)
+           VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+           ON CONFLICT (chat_id) WHERE tipo = 'responder' AND status = 'pendente'
+           DO UPDATE SET disponivel_em = GREATEST(jobs_webhook.disponivel_em, EXCLUDED.disponivel_em),
+                         atualizado_em = now()""",
+        (TIPO_RESPONDER, str(chat_id), Json({"chat_id": chat_id}), max_tentativas, atraso))
+
+
+def resposta_agendada(chat_id):
+    """
+    Se há um job 'responder' pendente para o chat. Chamada durante a resposta em execução (que está em
+    'executando'): um pendente só existe se chegou mensagem nova depois que ela começou.
+    """
+    row = _executar(
+        """SELECT EXISTS (SELECT 1 FROM jobs_webhook WHERE chat_id=%s AND tipo='responder' AND status='pendente')""",
+        (str(chat_id),), fetch=True)
+    return row[0]
+
+
+def marcar_resposta_seguinte(chat_id):
+    """
+    Anota na resposta pendente do chat (se houver) o id da última mensagem gravada, logo depois de uma resposta
+    ser salva: a mensagem que agendou a pendente pode ter sido gravada antes dessa resposta, e então o
+    histórico termina numa resposta do assistente mesmo havendo mensagem sem resposta.
+    """
+    _executar(
+        """UPDATE jobs_webhook
+              SET payload = payload || jsonb_build_object('respondida_ate',
+                                (SELECT MAX(id) FROM tabelademensagens WHERE user_id=%s)),
+                  atualizado_em = now()
+            WHERE chat_id=%s AND tipo='responder' AND status='pendente'""",
+        (str(chat_id), str(chat_id)))
+
+
+def enfileirar_foto_de_album(chat_id, message, janela, max_tentativas=5):
+    """
+    Junta a foto ao job 'album' pendente do seu media_group_id (ou cria o job) e adia o job por janela
+    segundos, para que as demais fotos do álbum entrem nele. Uma foto reenviada não é adicionada de novo.
+    """
+    garantir_tabela_jobs()
+    payload = {"chat_id": chat_id, "media_group_id": message['media_group_id'], "mensagens": [message]}
+    _executar(
+        """INSERT INTO jobs_webhook(tipo, chat_id, payload, max_tentativas, disponivel_em)
+           VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+           ON CONFLICT ((payload->>'media_group_id')) WHERE tipo = 'album' AND status = 'pendente'
+           DO UPDATE SET payload = jsonb_set(jobs_webhook.payload, '{mensagens}',
+                                             (jobs_webhook.payload->'mensagens') || (EXCLUDED.payload->'mensagens')),
+                         disponivel_em = GREATEST(jobs_webhook.disponivel_em, EXCLUDED.disponivel_em),
+                         atualizado_em = now()
+           WHERE NOT (jobs_webhook.payload->'mensagens') @> (EXCLUDED.payload->'mensagens')""",
+        (TIPO_ALBUM, str(chat_id), Json(payload), max_tentativas, janela))
+
+
+def reservar_job(worker_id, visibilidade_segundos):
+    """
+    Reserva o próximo job disponível por visibilidade_segundos.
+    Retorna um dict com id, tipo, chat_id, payload, tentativas e max_tentativas, ou None se a fila estiver vazia.
+    """
+    row = _executar(SQL_RESERVAR, (visibilidade_segundos, worker_id), fetch=True)
+    if not row:
+        return None
+    job_id, tipo, chat_id, payload, tentativas, max_tentativas = row
+    return {"id": job_id, "tipo": tipo, "chat_id": chat_id, "payload": payload,
+            "tentativas": tentativas, "max_tentativas": max_tentativas}
+
+
+def concluir_job(job_id):
+    _executar("DELETE FROM jobs_webhook WHERE id=%s", (job_id,))
+
+
+def falhar_job(job, erro, backoff_base, backoff_max):
+    """
+    Reagenda o job com backoff exponencial ou move para 'morto' quando as tentativas acabam.
+    Retorna True se o job foi para o dead-letter.
+    """
+    morto = job["tentativas"] >= job["max_tentativas"]
+    atraso = min(backoff_max, backoff_base * (2 ** (job["tentativas"] - 1)))
+    if morto:
+        sql = """UPDATE jobs_webhook SET status='morto', ultimo_erro=%s, bloqueado_ate=NULL, atualizado_em=now() WHERE id=%s"""
+        params = (str(erro), job["id"])
+    else:
+        sql = """UPDATE jobs_webhook SET status='pendente', ultimo_erro=%s, bloqueado_ate=NULL,
+                        disponivel_em=now() + make_interval(secs => %s), atualizado_em=now() WHERE id=%s"""
+        params = (str(erro), atraso, job["id"])
+
+    if job["tipo"] == TIPO_RESPONDER:
+        if _falhar_resposta(job, sql, params):
+            # Chegou mensagem durante a tentativa: a resposta já agendada cobre as mesmas mensagens
+            print(f"AVISO: Job {job['id']} (responder) falhou e foi substituído pela resposta já agendada. Erro: {erro}",
+                  file=sys.stderr)
+            return False
+    else:
+        _executar(sql, params)
+
+    if morto:
+        print(f"ERRO: Job {job['id']} ({job['tipo']}) movido para dead-letter após {job['tentativas']} tentativas. Erro: {erro}",
+              file=sys.stderr)
+        return True
+    print(f"AVISO: Job {job['id']} ({job['tipo']}) falhou (tentativa {job['tentativas']}), nova tentativa em {atraso}s. Erro: {erro}",
+          file=sys.stderr)
+    return False
+
+
+def _falhar_resposta(job, sql, params):
+    """
+    Registra a falha de um job 'responder' numa transação só. Se já houver outra resposta pendente para o chat
+    (agendada por uma mensagem que chegou durante a tentativa), o job é apagado em vez de reagendado; isso
+    também vale quando ela é agendada entre a conferência e o UPDATE, que então viola o índice único.
+    Retorna True se o job foi substituído.
+    """
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""DELETE FROM jobs_webhook j WHERE j.id=%s AND EXISTS (
+                               SELECT 1 FROM jobs_webhook o WHERE o.chat_id=j.chat_id AND o.tipo='responder'
+                                  AND o.status='pendente' AND o.id<>j.id)""", (job["id"],))
+            substituido = cur.rowcount > 0
+            if not substituido:
+                cur.execute("SAVEPOINT reagendar")
+                try:
+                    cur.execute(sql, params)
+                except UniqueViolation:
+                    cur.execute("ROLLBACK TO SAVEPOINT reagendar")
+                    cur.execute("DELETE FROM jobs_webhook WHERE id=%s", (job["id"],))
+                    substituido = True
+            conn.commit()
+            return substituido
+    except psycopg2.Error as e:
+        print(f"ERRO DB: Falha na fila de jobs. Erro: {e}", file=sys.stderr)
+        raise
+
+
+def reenfileirar_mortos(tipo=None):
+    """
+    Devolve jobs do dead-letter para a fila, zerando as tentativas. Retorna quantos foram reenfileirados.
+    Respostas mortas ficam de fora (só pode haver uma pendente por chat): a próxima mensagem agenda outra.
+    """
+    sql = """UPDATE jobs_webhook SET status='pendente', tentativas=0, disponivel_em=now(), atualizado_em=now()
+              WHERE status='morto' AND tipo <> 'responder'"""
+    params = ()
+    if tipo:
+        sql += " AND tipo=%s"
+        params = (tipo,)
+    return _executar(sql, params, rowcount=True)
+
+
+def _executar(sql, params, fetch=False, rowcount=False):
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            resultado = None
+            if fetch:
+                resultado = cur.fetchone()
+            elif rowcount:
+                resultado = cur.rowcount
+            conn.commit()
+            return resultado
+    except psycopg2.Error as e:
+        print(f"ERRO DB: Falha na fila de jobs. Erro: {e}", file=sys.stderr)
+        raise
@@ -0,0 +1,144 @@
+import hashlib
+import sys
+import threading
+from config import MIDIA_CACHE_TTL, MIDIA_CACHE_MAX_ITENS
+from app.utils.cache import CacheLRU
+from app.utils.helpers import db_connection
+
+# Deduplicação de mídias do Telegram: uma foto encaminhada ou um áudio reenviado têm o mesmo
+# file_unique_id (e o mesmo conteúdo), então reaproveitamos o objeto no Storage, a URL pública
+# e a transcrição em vez de baixar, subir e transcrever de novo. As fotos guardam também a descrição
+# em texto que a resposta escreve sobre elas (app/utils/descricoes.py), procurada pela URL pública.
+# A tabela guarda o registro de forma durável; o CacheLRU evita ir ao banco para as mídias recentes.
+
+DDL_MIDIAS = """
+CREATE TABLE IF NOT EXISTS midias_telegram (
+    file_unique_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    objeto TEXT,
+    url_publica TEXT,
+    transcricao TEXT,
+    criado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS midias_telegram_sha256_idx ON midias_telegram (sha256);
+ALTER TABLE midias_telegram ADD COLUMN IF NOT EXISTS descricao TEXT;
+CREATE INDEX IF NOT EXISTS midias_telegram_url_idx ON midias_telegram (url_publica);
+"""
+
+_CAMPOS = ("file_unique_id", "sha256", "objeto", "url_publica", "transcricao", "descricao")
+
+_cache = CacheLRU(max_itens=MIDIA_CACHE_MAX_ITENS, ttl=MIDIA_CACHE_TTL)  # 'uid:<id>' / 'sha:<hash>' -> registro
+_tabela_garantida = False
+_tabela_lock = threading.Lock()
+
+
+def garantir_tabela_midias():
+    global _tabela_garantida
+    with _tabela_lock:
+        if _tabela_garantida:
+            return
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(DDL_MIDIAS)
+            conn.commit()
+        _tabela_garantida = True
+
+
+def sha256_do_buffer(buffer, chunk_size=65536):
+    """Calcula o sha256 do conteúdo do buffer e o devolve posicionado no início."""
+    buffer.seek(0)
+    h = hashlib.sha256()
+    for chunk in iter(lambda: buffer.read(chunk_size), b''):
+        h.update(chunk)
+    buffer.seek(0)
+    return h.hexdigest()
+
+
+def _guardar_no_cache(registro):
+    _cache.definir(f"uid:{registro['file_unique_id']}", registro)
+    _cache.definir(f"sha:{registro['sha256']}", registro)
+
+
+def buscar_midia(file_unique_id=None, sha256=None):
+    """
+    Retorna o registro (dict) da mídia pelo file_unique_id ou pelo hash do conteúdo, ou None.
+    Falhas no banco são logadas e tratadas como 'não encontrada' (a mídia é processada normalmente).
+    """
+    if file_unique_id:
+        chave, coluna, valor = f"uid:{file_unique_id}", "file_unique_id", file_unique_id
+    elif sha256:
+        chave, coluna, valor = f"sha:{sha256}", "sha256", sha256
+    else:
+        return None
+    registro = _cache.obter(chave)
+    if registro is not None:
+        return registro
+    try:
+        garantir_tabela_midias()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(_CAMPOS)} FROM midias_telegram WHERE {coluna}=%s "
+                        f"ORDER BY (transcricao IS NULL), (url_publica IS NULL) LIMIT 1", (valor,))
+            row = cur.fetchone()
+    except Exception as e:
+        print(f"AVISO: Falha ao buscar mídia {valor} no cache. Erro: {e}", file=sys.stderr)
+        return None
+    if not row:
+        return None
+    registro = dict(zip(_CAMPOS, row))
+    _guardar_no_cache(registro)
+    return registro
+
+
+def registrar_midia(file_unique_id, sha256, objeto=None, url_publica=None, transcricao=None, descricao=None):
+    """Grava (ou completa) o registro da mídia. Campos None não apagam valores já gravados."""
+    try:
+        garantir_tabela_midias()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""INSERT INTO midias_telegram ({', '.join(_CAMPOS)}) VALUES (%s, %s, %s, %s, %s, %s)
+                            ON CONFLICT (file_unique_id) DO UPDATE SET
+                                sha256 = EXCLUDED.sha256,
+                                objeto = COALESCE(EXCLUDED.objeto, midias_telegram.objeto),
+                                url_publica = COALESCE(EXCLUDED.url_publica, midias_telegram.url_publica),
+                                transcricao = COALESCE(EXCLUDED.transcricao, midias_telegram.transcricao),
+                                descricao = COALESCE(EXCLUDED.descricao, midias_telegram.descricao)
+                            RETURNING {', '.join(_CAMPOS)}""",
+                        (file_unique_id, sha256, objeto, url_publica, transcricao, descricao))
+            row = cur.fetchone()
+            conn.commit()
+    except Exception as e:
+        print(f"AVISO: Falha ao registrar mídia {file_unique_id} no cache. Erro: {e}", file=sys.stderr)
+        return
+    _guardar_no_cache(dict(zip(_CAMPOS, row)))
+
+
+def registrar_descricoes(descricoes):
+    """
+    Grava as descrições {url pública: descrição} nas mídias com essa URL (um UPDATE só).
+    A foto ainda sem registro (upload adiado em andamento) recebe a descrição quando for registrada.
+    """
+    try:
+        garantir_tabela_midias()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""UPDATE midias_telegram m SET descricao = d.descricao
+                             FROM unnest(%s::text[], %s::text[]) AS d(url_publica, descricao)
+                            WHERE m.url_publica = d.url_publica""",
+                        (list(descricoes), list(descricoes.values())))
+            conn.commit()
+    except Exception as e:
+        print(f"AVISO: Falha ao gravar descrições de {len(descricoes)} foto(s). Erro: {e}", file=sys.stderr)
+
+
+def buscar_descricoes(urls):
+    """Descrições gravadas das URLs (url -> descrição), numa consulta só. Falhas no banco valem como nenhuma."""
+    try:
+        garantir_tabela_midias()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""SELECT DISTINCT ON (url_publica) url_publica, descricao FROM midias_telegram
+                            WHERE url_publica = ANY(%s) AND descricao IS NOT NULL""", (list(urls),))
+            return dict(cur.fetchall())
+    except Exception as e:
+        print(f"AVISO: Falha ao buscar descrições de {len(urls)} foto(s). Erro: {e}", file=sys.stderr)
+        return {}
+
+
+def estatisticas_cache_midias():
+    return _cache.estatisticas()
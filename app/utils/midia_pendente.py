@@ -0,0 +1,46 @@
+import base64
+from config import MIDIA_PENDENTE_TTL, MIDIA_PENDENTE_MAX_BYTES
+from app.utils.cache import CacheLRU
+
+# Imagens cujo upload para o Storage ainda está em andamento (modo MIDIA_UPLOAD_ADIADO).
+# O histórico já guarda a URL pública definitiva, mas enquanto o objeto não existe a OpenAI
+# não conseguiria baixá-lo: até o upload terminar, a URL é trocada pelo data URL em base64.
+# É por processo, como o cache de histórico; por isso o modo fica desligado com a fila no Postgres (config.py).
+
+_pendentes = CacheLRU(max_itens=200, ttl=MIDIA_PENDENTE_TTL, max_bytes=MIDIA_PENDENTE_MAX_BYTES, tamanho_fn=len)
+
+
+def data_url(dados, content_type="image/jpeg"):
+    return f"data:{content_type};base64,{base64.b64encode(dados).decode('ascii')}"
+
+
+def marcar_pendente(url_publica, dados, content_type="image/jpeg"):
+    """Registra que url_publica ainda não existe no Storage e deve ser servida a partir de dados."""
+    _pendentes.definir(url_publica, data_url(dados, content_type))
+
+
+def concluir_pendente(url_publica):
+    _pendentes.invalidar(url_publica)
+
+
+def trocar_urls_pendentes(mensagens):
+    """
+    Retorna as mensagens com as URLs de imagens pendentes trocadas pelos data URLs.
+    Não altera as mensagens recebidas (elas podem ser as do cache de histórico).
+    """
+    if not len(_pendentes):
+        return mensagens
+    resultado = []
+    for mensagem in mensagens:
+        content = mensagem.get("content")
+        if isinstance(content, list):
+            novas_partes = []
+            for parte in content:
+                url = (parte.get("image_url") or {}).get("url") if isinstance(parte, dict) else None
+                substituta = _pendentes.obter(url) if url else None
+                if substituta:
+                    parte = {**parte, "image_url": {**parte["image_url"], "url": substituta}}
+                novas_partes.append(parte)
+            mensagem = {**mensagem, "content": novas_partes}
+        resultado.append(mensagem)
+    return resultado
@@ -0,0 +1,18 @@
+# Divisão do texto da resposta em parágrafos, para enviá-la ao Telegram em várias mensagens.
+
+
+def iterar_paragrafos(pedacos):
+    """
+    Versão incremental de helpers.split_long_message: recebe os pedaços de texto de um stream e gera
+    cada parágrafo assim que a quebra de linha dupla (\\n\\n) que o encerra chega.
+    O último parágrafo é gerado quando o stream termina.
+    """
+    buffer = ''
+    for pedaco in pedacos:
+        buffer += pedaco
+        while '\n\n' in buffer:
+            paragrafo, buffer = buffer.split('\n\n', 1)
+            if paragrafo.strip():
+                yield paragrafo.strip()
+    if buffer.strip():
+        yield buffer.strip()
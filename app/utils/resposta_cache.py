@@ -0,0 +1,60 @@
+import hashlib
+import json
+import re
+from app.utils.cache import CacheLRU
+
+_ESPACOS = re.compile(r"\s+")
+
+
+def _normalizar_texto(texto):
+    # "O que faço com  frango e arroz?" e "o que faço com frango e arroz" viram a mesma chave
+    return _ESPACOS.sub(" ", texto).strip().lower().rstrip("?!. ")
+
+
+def chave_resposta(modelo, mensagens, max_mensagens):
+    """
+    Hash da lista de mensagens normalizada (incluindo system prompt e modelo), ou None quando
+    a requisição não deve usar o cache: conteúdo multimodal ou mais de max_mensagens fora do system prompt.
+    """
+    conversa = [m for m in mensagens if m["role"] != "system"]
+    if not conversa or len(conversa) > max_mensagens:
+        return None
+    normalizadas = []
+    for m in mensagens:
+        if not isinstance(m["content"], str):
+            return None
+        normalizadas.append([m["role"], _normalizar_texto(m["content"])])
+    bruto = json.dumps([modelo, normalizadas], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+class RespostaCache:
+    """Cache LRU+TTL de respostas completas do agente, chaveado por chave_resposta."""
+
+    def __init__(self, max_itens=500, ttl=3600, max_bytes=None, max_mensagens=1):
+        self.max_mensagens = max_mensagens
+        self._cache = CacheLRU(max_itens=max_itens, ttl=ttl, max_bytes=max_bytes,
+                               tamanho_fn=lambda resposta: len(resposta.encode("utf-8")))
+        self.ignoradas = 0  # Requisições que não passaram pelas regras do cache
+
+    def chave(self, modelo, mensagens, tamanho_historico):
+        """
+        tamanho_historico é o número de mensagens da conversa antes do recorte por orçamento de tokens:
+        o recorte pode deixar só a última mensagem de uma conversa longa, que não é mais uma abertura.
+        """
+        if tamanho_historico > self.max_mensagens:
+            self.ignoradas += 1
+            return None
+        chave = chave_resposta(modelo, mensagens, self.max_mensagens)
+        if chave is None:
+            self.ignoradas += 1
+        return chave
+
+    def obter(self, chave):
+        return self._cache.obter(chave)
+
+    def definir(self, chave, resposta):
+        self._cache.definir(chave, resposta)
+
+    def estatisticas(self):
+        return dict(self._cache.estatisticas(), ignoradas=self.ignoradas)
@@ -0,0 +1,170 @@
+import sys
+import threading
+from collections import namedtuple
+import psycopg2
+from config import HISTORICO_LIMITE, RESUMO_MAX_TOKENS
+from app.utils.cache import CacheLRU
+from app.utils.clientes_http import openai_client
+from app.utils.dispatcher import DespachantePorChat
+from app.utils.helpers import db_connection, conteudo_do_historico
+
+# Resumo incremental das mensagens que já saíram do prompt de cada conversa.
+# O resumo guarda o id da última mensagem que ele cobre: o prompt leva só as mensagens posteriores, e cada
+# atualização resume até a mensagem mais antiga que de fato coube no prompt (agent_logic.janela_do_prompt),
+# então nenhuma mensagem vai duas vezes nem some entre o resumo e a janela. Ele entra logo após o system prompt.
+
+DDL_RESUMOS = """
+CREATE TABLE IF NOT EXISTS resumos_conversa (
+    user_id TEXT PRIMARY KEY,
+    resumo TEXT NOT NULL,
+    ultimo_id BIGINT NOT NULL,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+PROMPT_RESUMO = """Você mantém o resumo de uma conversa entre um usuário e um chef de cozinha virtual.
+Atualize o resumo existente com as novas mensagens. Preserve o que importa para continuar a conversa:
+ingredientes e utensílios que o usuário tem, restrições e preferências alimentares, receitas já sugeridas
+e perguntas em aberto. Escreva em português, em no máximo 120 palavras, sem introdução."""
+
+LOTE_RESUMO = 200  # Mensagens novas incorporadas por chamada à OpenAI
+
+Resumo = namedtuple("Resumo", ["texto", "ultimo_id"])
+
+client = openai_client
+
+_cache = CacheLRU(max_itens=2000, ttl=600)           # user_id -> Resumo (texto '' quando não há)
+_fronteiras = CacheLRU(max_itens=5000, ttl=6 * 3600)  # user_id -> última fronteira agendada
+_fronteiras_lock = threading.Lock()
+_tabela_garantida = False
+_tabela_lock = threading.Lock()
+
+# Um job de resumo por vez para cada usuário, fora do caminho da requisição
+despachante_resumos = DespachantePorChat(max_workers=2, max_pendentes=200, nome="despachante-resumos")
+
+
+def garantir_tabela_resumos():
+    global _tabela_garantida
+    with _tabela_lock:
+        if _tabela_garantida:
+            return
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(DDL_RESUMOS)
+            conn.commit()
+        _tabela_garantida = True
+
+
+def buscar_resumo(user_id):
+    """
+    Retorna o Resumo (texto, id da última mensagem resumida) da conversa ou None.
+    Falhas são logadas e tratadas como 'sem resumo'.
+    """
+    resumo = _cache.obter(user_id)
+    if resumo is not None:
+        return resumo if resumo.texto else None
+    try:
+        garantir_tabela_resumos()
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT resumo, ultimo_id FROM resumos_conversa WHERE user_id=%s", (user_id,))
+            row = cur.fetchone()
+    except Exception as e:
+        print(f"AVISO: Falha ao buscar resumo para user_id {user_id}. Erro: {e}", file=sys.stderr)
+        return None
+    resumo = Resumo(*row) if row else Resumo('', 0)
+    _cache.definir(user_id, resumo)
+    return resumo if resumo.texto else None
+
+
+def registrar_turno(user_id, historico, janela):
+    """
+    Depois de uma resposta, agenda a atualização do resumo até a mensagem mais antiga que foi no prompt
+    (janela), se ficaram de fora mensagens ainda não resumidas: recortadas pelo orçamento de tokens ou
+    mais antigas que o histórico lido do banco.
+    """
+    if not janela or "id" not in janela[0]:
+        return
+    fronteira = janela[0]["id"]
+    resumo = buscar_resumo(user_id)
+    resumido_ate = resumo.ultimo_id if resumo else 0
+    recortadas = any(resumido_ate < m.get("id", 0) < fronteira for m in historico)
+    mais_antigas = len(historico) >= HISTORICO_LIMITE and historico[0].get("id", 0) > resumido_ate
+    if not (recortadas or mais_antigas):
+        return
+    with _fronteiras_lock:
+        if _fronteiras.obter(user_id) == fronteira:
+            return  # Já agendada
+        _fronteiras.definir(user_id, fronteira)
+    try:
+        despachante_resumos.submeter(user_id, atualizar_resumo, user_id, fronteira)
+    except Exception as e:
+        _fronteiras.invalidar(user_id)
+        print(f"AVISO: Atualização de resumo não agendada para user_id {user_id}. Erro: {e}", file=sys.stderr)
+
+
+def atualizar_resumo(user_id, fronteira):
+    """Incorpora ao resumo as mensagens ainda não resumidas anteriores à fronteira (id excluído)."""
+    garantir_tabela_resumos()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT resumo, ultimo_id FROM resumos_conversa WHERE user_id=%s", (user_id,))
+        row = cur.fetchone()
+        resumo_anterior, ultimo_id = row if row else ('', 0)
+        cur.execute(
+            """SELECT id, role, messages FROM tabelademensagens
+                WHERE user_id=%s AND id > %s AND id < %s
+                ORDER BY id LIMIT %s""",
+            (user_id, ultimo_id, fronteira, LOTE_RESUMO))
+        novas = cur.fetchall()
+    if not novas:
+        return
+
+    transcricao = "\n".join(f"{'Usuário' if role == 'user' else 'Chef'}: {_texto_para_resumo(conteudo_do_historico(msg))}"
+                            for _, role, msg in novas)
+    entrada = f"Resumo atual:\n{resumo_anterior or '(vazio)'}\n\nNovas mensagens:\n{transcricao}"
+    resposta = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "system", "content": PROMPT_RESUMO}, {"role": "user", "content": entrada}],
+        max_tokens=RESUMO_MAX_TOKENS,
+    )
+    resumo = resposta.choices[0].message.content.strip()
+    novo_ultimo_id = novas[-1][0]
+
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            # Só grava se ninguém tiver avançado o resumo enquanto a OpenAI respondia
+            cur.execute(
+                """INSERT INTO resumos_conversa(user_id, resumo, ultimo_id) VALUES (%s, %s, %s)
+                   ON CONFLICT (user_id) DO UPDATE SET resumo=EXCLUDED.resumo, ultimo_id=EXCLUDED.ultimo_id, atualizado_em=now()
+                   WHERE resumos_conversa.ultimo_id < EXCLUDED.ultimo_id""",
+                (user_id, resumo, novo_ultimo_id))
+            conn.commit()
+    except psycopg2.Error as e:
+        print(f"ERRO DB: Falha ao salvar resumo para user_id {user_id}. Erro: {e}", file=sys.stderr)
+        raise
+    _cache.invalidar(user_id)
+    if len(novas) == LOTE_RESUMO:
+        _fronteiras.invalidar(user_id)  # Ainda há mensagens antes da fronteira: o próximo turno agenda de novo
+    print(f"Resumo atualizado para user_id {user_id} até a mensagem {novo_ultimo_id}", file=sys.stderr)
+
+
+def invalidar_resumo(user_id):
+    """Apaga o resumo da conversa (usado quando o histórico é deletado)."""
+    _cache.invalidar(user_id)
+    _fronteiras.invalidar(user_id)
+    garantir_tabela_resumos()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM resumos_conversa WHERE user_id=%s", (user_id,))
+        conn.commit()
+
+
+def _texto_para_resumo(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        partes = []
+        for parte in content:
+            if isinstance(parte, dict) and parte.get("type") == "text":
+                partes.append(parte.get("text", ""))
+            elif isinstance(parte, dict) and parte.get("type") == "image_url":
+                partes.append("[imagem]")
+        return " ".join(partes)
+    return str(content)
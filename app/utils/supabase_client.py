@@ -17,40 +17,32 @@ if not SUPABASE_LIBRARY_URL or not SUPABASE_ANON_KEY:
 supabase: Client = create_client(SUPABASE_LIBRARY_URL, SUPABASE_ANON_KEY)
 
 
-def upload_file_to_supabase(file_path: str, bucket_name: str, file_name: str) -> bool:
+def upload_bytes_to_supabase(dados, bucket_name: str, file_name: str, content_type: str = None,
+                             upsert: bool = False) -> bool:
     """
-    Faz o upload de um arquivo para o Supabase Storage.
-    Retorna True se o upload/update foi bem-sucedido, False caso contrário.
+    Faz o upload de um conteúdo já em memória (bytes ou buffer aberto) para o Supabase Storage,
+    sem passar por um arquivo temporário. Se o objeto já existe (409), ele é sobrescrito.
+    Com upsert=True sobrescreve o objeto numa única requisição (x-upsert), sem o 409 + update.
     """
+    if not isinstance(dados, bytes):
+        dados.seek(0)
+        dados = dados.read()
+    opcoes = {"content-type": content_type} if content_type else {}
+    if upsert:
+        opcoes["upsert"] = "true"
+    opcoes = opcoes or None
     try:
-        with open(file_path, 'rb') as f:
-            try:
-                supabase.storage.from_(bucket_name).upload(file_name, f)
-                print(f"Arquivo {file_name} carregado com sucesso.", file=sys.stderr)
-            except Exception as e:
-                if "409" in str(e) or "Duplicate" in str(e):
-                    f.seek(0)
-                    supabase.storage.from_(bucket_name).update(file_name, f)
-                    print(f"Arquivo {file_name} atualizado (sobrescrito) com sucesso.", file=sys.stderr)
-                else:
-                    print(f"Erro ao fazer upload ou atualizar para o Supabase (fora do 409): {e}", file=sys.stderr)
-                    return False # Retorna False em caso de erro
-        return True # Retorna True se tudo ocorreu bem
+        try:
+            supabase.storage.from_(bucket_name).upload(file_name, dados, opcoes)
+            print(f"Arquivo {file_name} carregado com sucesso.", file=sys.stderr)
+        except Exception as e:
+            if "409" in str(e) or "Duplicate" in str(e):
+                supabase.storage.from_(bucket_name).update(file_name, dados, opcoes)
+                print(f"Arquivo {file_name} atualizado (sobrescrito) com sucesso.", file=sys.stderr)
+            else:
+                print(f"Erro ao fazer upload ou atualizar para o Supabase (fora do 409): {e}", file=sys.stderr)
+                return False
+        return True
     except Exception as e:
         print(f"Erro geral ao fazer upload para o Supabase: {e}", file=sys.stderr)
-        return False # Retorna False em caso de erro
-
-def get_public_url(bucket_name: str, file_name: str) -> str:
-    """
-    Retorna a URL pública de um arquivo já existente no Supabase Storage.
-
-    :param bucket_name: O nome do bucket.
-    :param file_name: O nome do arquivo no bucket.
-    :return: A URL pública, ou uma string vazia se não for encontrado.
-    """
-    try:
-        return supabase.storage.from_(bucket_name).get_public_url(file_name)
-    except Exception as e:
-        print(f"Erro ao obter URL pública do Supabase: {e}")
-        return ""
-
+        return False
@@ -0,0 +1,134 @@
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TELEGRAM_API = "https://api.telegram.org"
+
+
+class TelegramErro(requests.exceptions.RequestException):
+    """Erro da Bot API (ok=false) ou falha após esgotar as tentativas."""
+
+    def __init__(self, mensagem, error_code=None, retry_after=None):
+        super().__init__(mensagem)
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    """
+    Cliente da Bot API do Telegram com sessão HTTP persistente (pool de conexões keep-alive),
+    timeouts explícitos de conexão/leitura e novas tentativas automáticas:
+    - 429: espera o parameters.retry_after informado pelo Telegram;
+    - 5xx e falhas de rede: backoff exponencial.
+    Guarda estatísticas de latência por método da API.
+    """
+
+    def __init__(self, token, timeout_conexao=3.05, timeout_leitura=30, max_tentativas=4,
+                 backoff_base=0.5, retry_after_max=60, pool_maxsize=20):
+        self.token = token
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.retry_after_max = retry_after_max
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adaptador)
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def chamar(self, metodo, **params):
+        """Chama um método da Bot API e retorna o campo 'result' da resposta."""
+        if not self.token:
+            raise TelegramErro("Token do Telegram não configurado.")
+        url = f"{TELEGRAM_API}/bot{self.token}/{metodo}"
+        for tentativa in range(1, self.max_tentativas + 1):
+            inicio = time.monotonic()
+            try:
+                resposta = self.session.post(url, json=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._registrar(metodo, inicio, erro=True)
+                if tentativa == self.max_tentativas:
+                    raise TelegramErro(f"{metodo}: falha de rede após {tentativa} tentativas: {e}") from e
+                self._esperar(metodo, self._backoff(tentativa))
+                continue
+            self._registrar(metodo, inicio, erro=resposta.status_code >= 400)
+
+            try:
+                dados = resposta.json()
+            except ValueError:
+                dados = {"ok": False, "description": resposta.text[:200]}
+
+            if resposta.status_code == 429:
+                retry_after = (dados.get("parameters") or {}).get("retry_after", self._backoff(tentativa))
+                if tentativa == self.max_tentativas or retry_after > self.retry_after_max:
+                    raise TelegramErro(f"{metodo}: limite de envio do Telegram (retry_after={retry_after}s)",
+                                       error_code=429, retry_after=retry_after)
+                self._esperar(metodo, retry_after)
+                continue
+            if resposta.status_code >= 500 and tentativa < self.max_tentativas:
+                self._esperar(metodo, self._backoff(tentativa))
+                continue
+            if not dados.get("ok"):
+                raise TelegramErro(f"{metodo}: {dados.get('description', resposta.status_code)}",
+                                   error_code=dados.get("error_code", resposta.status_code))
+            return dados.get("result")
+
+    def enviar_mensagem(self, chat_id, texto):
+        return self.chamar("sendMessage", chat_id=chat_id, text=texto)
+
+    def obter_file_path(self, file_id):
+        return self.chamar("getFile", file_id=file_id).get("file_path")
+
+    def url_arquivo(self, file_path):
+        return f"{TELEGRAM_API}/file/bot{self.token}/{file_path}"
+
+    def baixar(self, url, arquivo, chunk_size=65536):
+        """Baixa url escrevendo em arquivo (objeto com write), pela mesma sessão persistente."""
+        inicio = time.monotonic()
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as resposta:
+                resposta.raise_for_status()
+                for chunk in resposta.iter_content(chunk_size=chunk_size):
+                    arquivo.write(chunk)
+        except requests.exceptions.RequestException:
+            self._registrar("download", inicio, erro=True)
+            raise
+        self._registrar("download", inicio)
+
+    def _backoff(self, tentativa):
+        return self.backoff_base * (2 ** (tentativa - 1))
+
+    def _esperar(self, metodo, segundos):
+        with self._lock:
+            self._stats_de(metodo)["retentativas"] += 1
+        print(f"AVISO: Telegram {metodo}: nova tentativa em {segundos}s", file=sys.stderr)
+        time.sleep(segundos)
+
+    def _stats_de(self, metodo):
+        return self._stats.setdefault(metodo, {"chamadas": 0, "erros": 0, "retentativas": 0,
+                                               "latencia_total": 0.0, "latencia_max": 0.0})
+
+    def _registrar(self, metodo, inicio, erro=False):
+        latencia = time.monotonic() - inicio
+        with self._lock:
+            stats = self._stats_de(metodo)
+            stats["chamadas"] += 1
+            stats["erros"] += int(erro)
+            stats["latencia_total"] += latencia
+            stats["latencia_max"] = max(stats["latencia_max"], latencia)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                metodo: {
+                    "chamadas": s["chamadas"],
+                    "erros": s["erros"],
+                    "retentativas": s["retentativas"],
+                    "latencia_media_ms": round(1000 * s["latencia_total"] / s["chamadas"], 1) if s["chamadas"] else 0.0,
+                    "latencia_max_ms": round(1000 * s["latencia_max"], 1),
+                }
+                for metodo, s in self._stats.items()
+            }
@@ -0,0 +1,56 @@
+import math
+from functools import lru_cache
+
+# Estimativa local e rápida de tokens, sem tokenizer: serve para montar a janela de histórico,
+# não para cobrança. Fica um pouco acima da contagem real do gpt-4o-mini para textos em português.
+TOKENS_POR_MENSAGEM = 4  # Overhead de role/separadores de cada mensagem no formato de chat
+TOKENS_IMAGEM = {"low": 85, "high": 765, "auto": 765}
+
+
+@lru_cache(maxsize=8192)
+def estimar_tokens_texto(texto):
+    """Estimativa memoizada: o maior entre ~4 caracteres por token e ~1,3 token por palavra."""
+    if not texto:
+        return 0
+    return max(math.ceil(len(texto) / 4), math.ceil(len(texto.split()) * 1.3))
+
+
+def estimar_tokens_conteudo(content):
+    if isinstance(content, str):
+        return estimar_tokens_texto(content)
+    if isinstance(content, list):
+        total = 0
+        for parte in content:
+            if not isinstance(parte, dict):
+                continue
+            if parte.get("type") == "text":
+                total += estimar_tokens_texto(parte.get("text", ""))
+            elif parte.get("type") == "image_url":
+                detalhe = (parte.get("image_url") or {}).get("detail", "auto")
+                total += TOKENS_IMAGEM.get(detalhe, TOKENS_IMAGEM["auto"])
+        return total
+    if isinstance(content, dict):
+        return estimar_tokens_texto(str(content))
+    return 0
+
+
+def estimar_tokens_mensagem(mensagem):
+    return TOKENS_POR_MENSAGEM + estimar_tokens_conteudo(mensagem.get("content"))
+
+
+def recortar_por_orcamento(historico, orcamento):
+    """
+    Mantém as mensagens mais recentes do histórico cuja soma estimada de tokens cabe no orçamento.
+    A última mensagem sempre fica, mesmo que sozinha ultrapasse o orçamento.
+    """
+    if not historico:
+        return []
+    usados = 0
+    inicio = len(historico)
+    for i in range(len(historico) - 1, -1, -1):
+        custo = estimar_tokens_mensagem(historico[i])
+        if usados + custo > orcamento and inicio < len(historico):
+            break
+        usados += custo
+        inicio = i
+    return historico[inicio:]
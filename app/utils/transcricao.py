@@ -0,0 +1,155 @@
+import hashlib
+import io
+import re
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from config import (TRANSCRICAO_FFMPEG, TRANSCRICAO_BITRATE, TRANSCRICAO_TRECHO_SEGUNDOS, TRANSCRICAO_PARALELISMO,
+                    TRANSCRICAO_SILENCIO_DB, TRANSCRICAO_SILENCIO_MIN, TRANSCRICAO_CACHE_TTL,
+                    TRANSCRICAO_CACHE_MAX_ITENS, MIDIA_LIMITE_MEMORIA)
+from app.utils.cache import CacheLRU
+from app.utils.helpers import transcrever_audio
+
+# Transcrição de áudios longos: com ffmpeg disponível, o áudio é convertido para opus mono de baixa taxa
+# (bem menor para enviar), dividido nos silêncios em trechos de ~TRANSCRICAO_TRECHO_SEGUNDOS e os trechos
+# são transcritos em paralelo e juntados na ordem. Sem ffmpeg, o áudio vai inteiro numa chamada, como antes.
+
+_ffmpeg = shutil.which(TRANSCRICAO_FFMPEG)
+if not _ffmpeg:
+    print(f"AVISO: {TRANSCRICAO_FFMPEG} não encontrado; áudios serão transcritos sem conversão nem divisão.",
+          file=sys.stderr)
+
+# Maior arquivo aceito pela API de transcrição; sem ffmpeg para converter, o áudio vai como veio
+LIMITE_API_BYTES = 25 * 1024 * 1024
+
+_cache = CacheLRU(max_itens=TRANSCRICAO_CACHE_MAX_ITENS, ttl=TRANSCRICAO_CACHE_TTL)  # sha256 do áudio -> texto
+_executor = ThreadPoolExecutor(max_workers=TRANSCRICAO_PARALELISMO, thread_name_prefix="transcricao")
+
+_RE_SILENCIO_INICIO = re.compile(r"silence_start: (-?[\d.]+)")
+_RE_SILENCIO_FIM = re.compile(r"silence_end: ([\d.]+)")
+_RE_TEMPO = re.compile(r"time=(\d+):(\d+):([\d.]+)")
+
+
+class AudioGrandeDemais(Exception):
+    """O áudio passa do limite da API e não há como convertê-lo; a mensagem é a que vai para o usuário."""
+
+
+def verificar_tamanho(tamanho, convertido=None):
+    """
+    Recusa áudios que iriam inteiros para a API acima de LIMITE_API_BYTES (sem ffmpeg, ou quando a conversão
+    falhou). Pode ser chamada com o file_size do Telegram, antes mesmo do download.
+    """
+    convertido = bool(_ffmpeg) if convertido is None else convertido
+    if not convertido and tamanho and tamanho > LIMITE_API_BYTES:
+        raise AudioGrandeDemais("Desculpe, esse áudio é grande demais para eu transcrever (limite de 25 MB).")
+
+
+def _rodar_ffmpeg(argumentos, entrada):
+    """entrada são bytes ou um arquivo aberto, que o ffmpeg lê direto do descritor, sem passar pela memória."""
+    fonte = {"input": entrada} if isinstance(entrada, bytes) else {"stdin": entrada}
+    resultado = subprocess.run([_ffmpeg, "-hide_banner", *argumentos],
+                               capture_output=True, timeout=300, **fonte)
+    if resultado.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou: {resultado.stderr.decode(errors='replace')[-300:]}")
+    return resultado.stdout, resultado.stderr.decode(errors='replace')
+
+
+def _converter(entrada):
+    """Converte para opus mono e detecta os silêncios na mesma passada. Retorna (ogg, duração, silêncios)."""
+    ogg, log = _rodar_ffmpeg(
+        ["-i", "pipe:0", "-af", f"silencedetect=noise={TRANSCRICAO_SILENCIO_DB}dB:d={TRANSCRICAO_SILENCIO_MIN}",
+         "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", TRANSCRICAO_BITRATE, "-f", "ogg", "pipe:1"],
+        entrada)
+    tempos = _RE_TEMPO.findall(log)
+    duracao = 0.0
+    if tempos:
+        h, m, s = tempos[-1]
+        duracao = int(h) * 3600 + int(m) * 60 + float(s)
+    inicios = [max(0.0, float(x)) for x in _RE_SILENCIO_INICIO.findall(log)]
+    fins = [float(x) for x in _RE_SILENCIO_FIM.findall(log)]
+    silencios = [(inicio + fim) / 2 for inicio, fim in zip(inicios, fins)]
+    return ogg, duracao, silencios
+
+
+def pontos_de_corte(duracao, silencios, trecho):
+    """
+    Escolhe onde dividir o áudio: perto de cada múltiplo de `trecho` segundos, no meio do silêncio
+    mais próximo (entre meio e um trecho e meio depois do corte anterior); sem silêncio ali, corta seco.
+    """
+    cortes = []
+    ultimo = 0.0
+    while duracao - ultimo > trecho * 1.25:
+        alvo = ultimo + trecho
+        candidatos = [s for s in silencios if ultimo + trecho / 2 <= s <= ultimo + trecho * 1.5]
+        corte = min(candidatos, key=lambda s: abs(s - alvo)) if candidatos else alvo
+        cortes.append(corte)
+        ultimo = corte
+    return cortes
+
+
+def _recortar(ogg, inicio, fim):
+    argumentos = ["-i", "pipe:0", "-ss", f"{inicio:.2f}"]
+    if fim is not None:
+        argumentos += ["-t", f"{fim - inicio:.2f}"]
+    trecho, _ = _rodar_ffmpeg(argumentos + ["-c:a", "libopus", "-b:a", TRANSCRICAO_BITRATE, "-f", "ogg", "pipe:1"], ogg)
+    return trecho
+
+
+def _transcrever_convertido(ogg, duracao, silencios, nome):
+    cortes = pontos_de_corte(duracao, silencios, TRANSCRICAO_TRECHO_SEGUNDOS)
+    if not cortes:
+        return transcrever_audio((f"{nome}.ogg", ogg))
+    limites = list(zip([0.0] + cortes, cortes + [None]))
+    print(f"Transcrição: {duracao:.0f}s de áudio em {len(limites)} trechos", file=sys.stderr)
+
+    def transcrever_trecho(i, inicio, fim):
+        return transcrever_audio((f"{nome}-{i}.ogg", _recortar(ogg, inicio, fim)))
+
+    futuros = [_executor.submit(transcrever_trecho, i, inicio, fim) for i, (inicio, fim) in enumerate(limites)]
+    return " ".join(texto.strip() for texto in (f.result() for f in futuros) if texto and texto.strip())
+
+
+def _sha256(arquivo, chunk_size=65536):
+    h = hashlib.sha256()
+    for chunk in iter(lambda: arquivo.read(chunk_size), b''):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def transcrever(arquivo, nome, sha256=None):
+    """
+    Transcreve o áudio (bytes ou buffer aberto, ex.: o SpooledTemporaryFile de baixar_arquivo); nome
+    (ex.: 'voz.ogg') indica o formato original. O resultado fica em cache pelo sha256 do conteúdo.
+    Áudios acima de MIDIA_LIMITE_MEMORIA não são lidos para a memória: o ffmpeg lê o arquivo pelo descritor.
+    """
+    if isinstance(arquivo, bytes):
+        arquivo = io.BytesIO(arquivo)
+    tamanho = arquivo.seek(0, io.SEEK_END)
+    arquivo.seek(0)
+    if not sha256:
+        sha256 = _sha256(arquivo)
+        arquivo.seek(0)
+    texto = _cache.obter(sha256)
+    if texto is not None:
+        return texto
+
+    texto = None
+    if _ffmpeg:
+        try:
+            # Pequeno: vai por pipe; grande: o ffmpeg lê do arquivo em disco (o spool passa para disco se preciso)
+            entrada = arquivo.read() if tamanho <= MIDIA_LIMITE_MEMORIA or isinstance(arquivo, io.BytesIO) else arquivo
+            ogg, duracao, silencios = _converter(entrada)
+            texto = _transcrever_convertido(ogg, duracao, silencios, nome.rsplit('.', 1)[0])
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"AVISO: Conversão do áudio falhou, transcrevendo o original. Erro: {e}", file=sys.stderr)
+    if texto is None:
+        verificar_tamanho(tamanho, convertido=False)
+        arquivo.seek(0)
+        texto = transcrever_audio((nome, arquivo))
+    _cache.definir(sha256, texto)
+    return texto
+
+
+def estatisticas_transcricao():
+    return {**_cache.estatisticas(), "ffmpeg": bool(_ffmpeg)}
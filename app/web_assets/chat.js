@@ -0,0 +1,524 @@
+class ChatInterface {
+    constructor() {
+        this.chatMessages = document.getElementById('chatMessages');
+        this.messageInput = document.getElementById('messageInput');
+        this.sendButton = document.getElementById('sendButton');
+        this.statusText = document.getElementById('statusText');
+        this.typingIndicator = document.getElementById('typingIndicator');
+        this.sendText = document.getElementById('sendText');
+        this.sendIcon = document.getElementById('sendIcon');
+        this.debugInfo = document.getElementById('debugInfo');
+
+        // Estado interno
+        this.isProcessing = false;
+        this.retryCount = 0;
+        this.maxRetries = 3;
+        this.historyPageSize = 50;
+        this.maxCachedMessages = 200;
+        this.sessionId = this.getOrCreateSessionId(); // Gerar/Obter ID da sessão
+
+        this.setupEventListeners();
+        this.loadHistory();
+        this.checkConnection();
+        this.enableDebugMode();
+    }
+
+    // Gera ou obtém um UUID para a sessão do chat
+    getOrCreateSessionId() {
+        let id = localStorage.getItem('chatSessionId');
+        if (!id) {
+            id = this.generateUuid();
+            localStorage.setItem('chatSessionId', id);
+            this.log('Novo session_id gerado:', id);
+        } else {
+            this.log('Session_id existente:', id);
+        }
+        return id;
+    }
+
+    generateUuid() {
+        return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function(c) {
+            var r = Math.random() * 16 | 0, v = c == 'x' ? r : (r & 0x3 | 0x8);
+            return v.toString(16);
+        });
+    }
+
+    setupEventListeners() {
+        this.sendButton.addEventListener('click', () => {
+            this.sendMessage();
+        });
+
+        this.messageInput.addEventListener('keydown', (e) => {
+            if (e.key === 'Enter' && !e.shiftKey) {
+                e.preventDefault();
+                this.sendMessage();
+            }
+        });
+
+        this.messageInput.addEventListener('input', () => {
+            this.messageInput.style.height = 'auto';
+            this.messageInput.style.height = Math.min(this.messageInput.scrollHeight, 150) + 'px';
+        });
+
+        setTimeout(() => {
+            this.messageInput.focus();
+        }, 100);
+
+        document.addEventListener('keydown', (e) => {
+            if (e.ctrlKey && e.key === 'd') {
+                e.preventDefault();
+                this.toggleDebug();
+            }
+        });
+    }
+
+    async sendMessage() {
+        const message = this.messageInput.value.trim();
+        if (!message || this.isProcessing) {
+            this.log('Tentativa de envio bloqueada: mensagem vazia ou processando');
+            return;
+        }
+
+        this.log(`Enviando mensagem: "${message}" para session_id: ${this.sessionId}`);
+
+        this.addMessage(message, 'user');
+        this.messageInput.value = '';
+        this.messageInput.style.height = 'auto';
+
+        // Uma chave por mensagem, repetida em todas as tentativas: o servidor não grava a mensagem duas vezes
+        this.retryCount = 0;
+        await this.postMessage({ message: message, key: this.generateUuid() });
+    }
+
+    async postMessage(pending) {
+        this.showTyping();
+        this.setStatus('Processando...', '🤔');
+        this.setButtonLoading(true);
+        this.isProcessing = true;
+
+        try {
+            this.log('Fazendo requisição para /api/chat/stream');
+
+            const response = await fetch('/api/chat/stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
+                    'Idempotency-Key': pending.key
+                },
+                body: JSON.stringify({  
+                    message: pending.message,
+                    session_id: this.sessionId // Usar o sessionId dinâmico
+                })
+            });
+
+            this.log(`Resposta recebida - Status: ${response.status}`);
+
+            // 409: a tentativa anterior desta mensagem ainda está sendo respondida; espera por ela
+            if (response.status === 409 && this.retryCount < this.maxRetries) {
+                this.retryCount++;
+                setTimeout(() => this.postMessage(pending), 2000);
+                return;
+            }
+
+            if (!response.ok || !response.body) {
+                const data = await response.json();
+                this.log(`Dados da resposta:`, data);
+                this.hideTyping();
+                const errorMsg = data.error || `Erro HTTP ${response.status}. Mensagem: ${data.message || 'Desconhecido'}`;
+                this.addMessage(`❌ ${errorMsg}`, 'error');
+                this.setStatus('Erro', '❌');
+                return;
+            }
+
+            const final = await this.readStream(response);
+            this.log(`Fim do stream:`, final);
+
+            if (final && final.status === 'success') {
+                this.setStatus('Pronto', '⚡');
+                this.retryCount = 0;
+            } else {
+                const errorMsg = (final && final.error) || 'A resposta foi interrompida.';
+                this.addMessage(`❌ ${errorMsg}`, 'error');
+                this.setStatus('Erro', '❌');
+            }
+
+        } catch (error) {
+            this.log('Erro na requisição:', error);
+            this.hideTyping();
+
+            if (this.retryCount < this.maxRetries) {
+                this.retryCount++;
+                this.addMessage(`🔄 Tentativa ${this.retryCount}/${this.maxRetries}. Tentando novamente...`, 'error');
+                setTimeout(() => this.postMessage(pending), 2000);
+                return;
+            }
+
+            this.addMessage('🔌 Erro de conexão. Verifique sua internet e tente novamente.', 'error');
+            this.setStatus('Sem conexão', '🔌');
+        } finally {
+            this.setButtonLoading(false);
+            this.isProcessing = false;
+            this.messageInput.focus();
+        }
+    }
+
+    addMessage(content, type) {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = `message ${type} fade-in`;
+
+        const contentDiv = document.createElement('div');
+        contentDiv.textContent = content;
+        messageDiv.appendChild(contentDiv);
+
+        const timeDiv = document.createElement('div');
+        timeDiv.className = 'message-time';
+        timeDiv.textContent = new Date().toLocaleTimeString('pt-BR', {hour: '2-digit', minute:'2-digit'});
+        messageDiv.appendChild(timeDiv);
+
+        this.chatMessages.appendChild(messageDiv);
+        this.scrollToBottom();
+
+        this.log(`Mensagem adicionada - Tipo: ${type}, Conteúdo: ${content.substring(0, 50)}...`);
+        return contentDiv;
+    }
+
+    // Lê os eventos SSE de /api/chat/stream e vai desenhando a resposta do bot à medida que chega
+    async readStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let botContent = null;
+        let text = '';
+        let final = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, sep);
+                buffer = buffer.slice(sep + 2);
+
+                let eventName = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (!data) continue;
+                const payload = JSON.parse(data);
+
+                if (eventName === 'done') {
+                    final = payload;
+                } else if (payload.delta) {
+                    if (!botContent) {
+                        this.hideTyping();
+                        botContent = this.addMessage('', 'bot');
+                    }
+                    text += payload.delta;
+                    botContent.textContent = text;
+                    this.scrollToBottom();
+                }
+            }
+        }
+
+        this.hideTyping();
+        return final;
+    }
+
+    showTyping() {
+        this.typingIndicator.style.display = 'block';
+        this.scrollToBottom();
+    }
+
+    hideTyping() {
+        this.typingIndicator.style.display = 'none';
+    }
+
+    setStatus(text, icon = '⚡') {
+        this.statusText.innerHTML = `<span>${icon}</span><span>${text}</span>`;
+    }
+
+    setButtonLoading(loading) {
+        this.sendButton.disabled = loading;
+        if (loading) {
+            this.sendText.textContent = 'Enviando...';
+            this.sendIcon.innerHTML = '<div class="spinner"></div>';
+        } else {
+            this.sendText.textContent = 'Enviar';
+            this.sendIcon.textContent = '📤';
+        }
+    }
+
+    scrollToBottom() {
+        setTimeout(() => {
+            this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        }, 100);
+    }
+
+    async checkConnection() {
+        try {
+            this.log('Verificando conexão...');
+            const response = await fetch('/api/status');
+            const data = await response.json();
+
+            if (response.ok && data.status === 'online') {
+                this.setStatus('Online', '🟢');
+                this.log('Conexão OK:', data);
+            } else {
+                this.setStatus('Instável', '🟡');
+                this.log('Conexão instável ou offline:', data);
+            }
+        } catch (error) {
+            this.setStatus('Offline', '🔴');
+            this.log('Erro de conexão:', error);
+        }
+    }
+
+    // Histórico guardado no navegador por sessão: { etag, lastId, count, messages: [{id, role, content}] }
+    // count é quantas mensagens a sessão tinha no servidor até lastId, inclusive as que não foram baixadas
+    historyCacheKey() {
+        return `chatHistory:${this.sessionId}`;
+    }
+
+    readHistoryCache() {
+        try {
+            const cache = JSON.parse(localStorage.getItem(this.historyCacheKey()));
+            if (cache && Array.isArray(cache.messages) && typeof cache.count === 'number') return cache;
+        } catch (error) {
+            this.log('Cache de histórico inválido, descartando:', error);
+        }
+        return { etag: null, lastId: null, count: 0, messages: [] };
+    }
+
+    saveHistoryCache(cache) {
+        cache.messages = cache.messages.slice(-this.maxCachedMessages);
+        try {
+            localStorage.setItem(this.historyCacheKey(), JSON.stringify(cache));
+        } catch (error) {
+            this.log('Não foi possível salvar o histórico no navegador:', error);
+        }
+    }
+
+    renderHistory(messages) {
+        this.chatMessages.innerHTML = ''; // Limpa tudo antes de carregar
+
+        // Adiciona a mensagem de boas-vindas inicial, mesmo se houver histórico.
+        this.addMessage('👋 Olá! Sou seu agente IA inteligente. Posso ajudá-lo com diversas tarefas. Como posso ajudá-lo hoje?', 'bot');
+
+        messages.forEach(item => {
+            if (item.role === 'user') {
+                this.addMessage(item.content, 'user');
+            } else if (item.role === 'assistant') {
+                this.addMessage(item.content, 'bot');
+            }
+        });
+    }
+
+    // Mostra na hora o histórico guardado no navegador e busca no servidor só o que chegou depois dele
+    // (since_id). Com o ETag da última sincronização, o servidor responde 304 se nada mudou.
+    async loadHistory() {
+        let cache = this.readHistoryCache();
+        this.renderHistory(cache.messages);
+        try {
+            this.log(`Carregando histórico para session_id: ${this.sessionId} a partir do id ${cache.lastId}...`);
+            let changed = false;
+            while (true) {
+                const params = new URLSearchParams({ session_id: this.sessionId, limit: this.historyPageSize });
+                if (cache.lastId !== null) params.set('since_id', cache.lastId);
+                const headers = cache.etag ? { 'If-None-Match': cache.etag } : {};
+                const response = await fetch(`/api/history?${params}`, { headers, cache: 'no-store' });
+                if (response.status === 304) break;
+
+                const data = await response.json();
+                if (!response.ok) throw new Error(data.error || `Erro HTTP ${response.status}`);
+
+                const initial = cache.lastId === null;
+                // O servidor conta todas as mensagens da sessão: as que o cache já cobre mais as desta página
+                // (e, se ainda há mais, as seguintes). Se não bate, o histórico foi apagado no servidor, mesmo
+                // que já tenha mensagens novas com ids maiores: descarta o cache e recarrega do início
+                const expected = cache.count + data.history.length;
+                if (!initial && (data.count < expected || (!data.has_more && data.count !== expected))) {
+                    cache = { etag: null, lastId: null, count: 0, messages: [] };
+                    changed = true;
+                    continue;
+                }
+                if (data.history.length > 0) {
+                    cache.messages = cache.messages.concat(data.history);
+                    cache.lastId = data.history[data.history.length - 1].id;
+                    changed = true;
+                }
+                // Na carga inicial a contagem inclui as mensagens mais antigas que não foram baixadas
+                cache.count = initial ? data.count : expected;
+                // Na carga inicial, has_more indica mensagens mais antigas, que não são buscadas
+                if (initial || !data.has_more) {
+                    cache.etag = response.headers.get('ETag');
+                    changed = true;
+                    break;
+                }
+            }
+            if (changed) {
+                this.saveHistoryCache(cache);
+                this.renderHistory(cache.messages);
+            }
+            this.log(`Histórico carregado: ${cache.messages.length} mensagens`);
+        } catch (error) {
+            this.log('Erro ao carregar histórico:', error);
+            this.addMessage('Erro ao carregar histórico. Por favor, tente recarregar a página.', 'error');
+        } finally {
+            this.scrollToBottom();
+        }
+    }
+
+    async clearChat() {
+        if (confirm('🗑️ Tem certeza que deseja limpar toda a conversa?\n\nEsta ação não pode ser desfeita.')) {
+            try {
+                this.log(`Limpando conversa para session_id: ${this.sessionId}...`);
+
+                const response = await fetch('/api/clear', { 
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({ session_id: this.sessionId })
+                });
+
+                const data = await response.json();
+                this.log('Resposta do clear:', data);
+
+                if (response.ok && data.status === 'success') {
+                    localStorage.removeItem(this.historyCacheKey());
+                    this.chatMessages.innerHTML = 
+                        '<div class="message bot fade-in">👋 Olá! Sou seu agente IA inteligente. Posso ajudá-lo com diversas tarefas. Como posso ajudá-lo hoje?</div>';
+                    this.setStatus('Conversa limpa', '✅');
+                    this.scrollToBottom();
+                } else {
+                    this.setStatus('Erro ao limpar', '❌');
+                    this.addMessage('Erro ao limpar o histórico.', 'error');
+                }
+            } catch (error) {
+                this.log('Erro ao limpar:', error);
+                this.setStatus('Erro de conexão', '🔌');
+                this.addMessage('Erro de conexão ao limpar o histórico.', 'error');
+            }
+        }
+    }
+
+    enableDebugMode() {
+        this.debugMode = window.location.search.includes('debug=true');
+        if (this.debugMode) {
+            this.debugInfo.style.display = 'block';
+            this.log('Modo debug habilitado');
+        }
+    }
+
+    toggleDebug() {
+        this.debugMode = !this.debugMode;
+        this.debugInfo.style.display = this.debugMode ? 'block' : 'none';
+        this.log('Debug mode:', this.debugMode ? 'habilitado' : 'desabilitado');
+        if (this.debugMode) {
+            this.debugInfo.innerHTML = '';
+        }
+    }
+
+    log(message, data = null) {
+        const timestamp = new Date().toLocaleTimeString('pt-BR');
+        const logMessage = `[${timestamp}] ${message}`;
+
+        console.log(logMessage, data || '');
+
+        if (this.debugMode && this.debugInfo) {
+            const logDiv = document.createElement('div');
+            // Melhorar a exibição de dados para debug:
+            let displayData = '';
+            if (data !== null && typeof data === 'object') {
+                try {
+                    displayData = JSON.stringify(data, null, 2); // Formata JSON
+                } catch (e) {
+                    displayData = String(data); // Fallback para outros tipos
+                }
+            } else if (data !== null) {
+                displayData = String(data);
+            }
+
+            logDiv.innerHTML = `${logMessage}<pre>${displayData}</pre>`; // Usar <pre> para formatar JSON
+            logDiv.style.whiteSpace = 'pre-wrap'; // Preservar quebras de linha e espaços
+            logDiv.style.wordBreak = 'break-all'; // Quebrar palavras longas
+            this.debugInfo.appendChild(logDiv);
+
+            while (this.debugInfo.children.length > 20) {
+                this.debugInfo.removeChild(this.debugInfo.firstChild);
+            }
+
+            this.debugInfo.scrollTop = this.debugInfo.scrollHeight;
+        }
+    }
+}
+
+// Global functions for console testing (optional, but useful)
+window.testConnection = async () => {
+    try {
+        const response = await fetch('/api/status');
+        const data = await response.json();
+        console.log('Status da conexão:', data);
+        alert(`Status: ${data.status}\nSessões ativas: ${data.sessions_active}\nMensagens totais: ${data.total_messages || 0}`);
+    } catch (error) {
+        console.error('Erro no teste:', error);
+        alert('Erro ao testar conexão: ' + error.message);
+    }
+};
+
+window.testMessage = async () => {
+    try {
+        const testMsg = 'Teste de mensagem - ' + new Date().toLocaleTimeString();
+        const response = await fetch('/api/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                message: testMsg,
+                session_id: window.chatInterface.sessionId // Usar o ID da sessão atual
+            })
+        });
+
+        const data = await response.json();
+        console.log('Teste de mensagem:', data);
+        alert('Teste enviado com sucesso!\nResposta: ' + data.response);
+    } catch (error) {
+        console.error('Erro no teste:', error);
+        alert('Erro no teste: ' + error.message);
+    }
+};
+
+// Inicializar interface quando página carregar
+document.addEventListener('DOMContentLoaded', () => {
+    console.log('Inicializando interface do chat...');
+    window.chatInterface = new ChatInterface();
+
+    console.log('🤖 Chat Interface carregada!');
+    console.log('💡 Comandos disponíveis:');
+    console.log('    - window.testConnection(): Testa conexão com API');
+    console.log('    - window.testMessage(): Envia mensagem de teste');
+    console.log('    - window.chatInterface.clearChat(): Limpa o histórico de chat'); // Chamar via instância
+    console.log('    - Ctrl+D: Alternar modo debug');
+    console.log('    - Adicione ?debug=true na URL para iniciar em modo debug.');
+});
+
+// Tratamento de erros globais (JavaScript)
+window.addEventListener('error', (event) => {
+    console.error('Erro global JavaScript:', event.error);
+    if (window.chatInterface) {
+        window.chatInterface.log('Erro JavaScript:', event.error.message);
+    }
+});
+
+window.addEventListener('unhandledrejection', (event) => {
+    console.error('Promise rejeitada JavaScript:', event.reason);
+    if (window.chatInterface) {
+        window.chatInterface.log('Promise rejeitada:', event.reason);
+    }
+});
@@ -0,0 +1,115 @@
+"""
+Worker da fila durável de jobs do webhook.
+
+Uso:
+    python -m app.worker                   # consome a fila
+    python -m app.worker --requeue [tipo]  # devolve à fila os jobs do dead-letter (de um tipo, se dado) e sai
+
+Pode rodar em quantos hosts forem necessários; cada processo abre FILA_WORKER_THREADS threads
+que disputam a tabela jobs_webhook com FOR UPDATE SKIP LOCKED.
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+
+from config import (FILA_WORKER_THREADS, FILA_VISIBILIDADE_SEGUNDOS, FILA_INTERVALO_POLL,
+                    FILA_BACKOFF_BASE, FILA_BACKOFF_MAX)
+from app.telegram_handlers import processar_update, processar_album, responder_da_fila, avisar_falha
+from app.utils.job_queue import (garantir_tabela_jobs, reservar_job, concluir_job, falhar_job, reenfileirar_mortos,
+                                 TIPO_RESPONDER, TIPO_ALBUM)
+
+_parar = threading.Event()
+
+
+def _loop(worker_id):
+    while not _parar.is_set():
+        try:
+            job = reservar_job(worker_id, FILA_VISIBILIDADE_SEGUNDOS)
+        except Exception as e:
+            print(f"ERRO: {worker_id} não conseguiu reservar job. Erro: {e}", file=sys.stderr)
+            _parar.wait(FILA_INTERVALO_POLL)
+            continue
+
+        if job is None:
+            _parar.wait(FILA_INTERVALO_POLL)
+            continue
+
+        if job["tentativas"] > job["max_tentativas"]:
+            # A visibilidade expirou vezes demais (processo morto no meio do job).
+            _falhar(job, "visibilidade expirada")
+            continue
+
+        print(f"{worker_id}: processando job {job['id']} ({job['tipo']}) do chat {job['chat_id']}", file=sys.stderr)
+        try:
+            # Erros sobem até aqui para o job ser tentado de novo com backoff ou ir para o dead-letter
+            if job["tipo"] == TIPO_RESPONDER:
+                responder_da_fila(job["payload"]["chat_id"], job["payload"].get("respondida_ate"))
+            elif job["tipo"] == TIPO_ALBUM:
+                processar_album(job["payload"]["chat_id"], job["payload"]["mensagens"], relancar=True)
+            else:
+                processar_update(job["payload"], relancar=True)
+        except Exception as e:
+            _falhar(job, e)
+            continue
+
+        try:
+            concluir_job(job["id"])
+        except Exception as e:
+            print(f"ERRO: Falha ao concluir job {job['id']}. Erro: {e}", file=sys.stderr)
+
+
+def _falhar(job, erro):
+    try:
+        morto = falhar_job(job, erro, FILA_BACKOFF_BASE, FILA_BACKOFF_MAX)
+    except Exception as db_erro:
+        # Sem conseguir registrar a falha, o job volta sozinho quando a visibilidade expirar.
+        print(f"ERRO: Falha ao registrar erro do job {job['id']}. Erro: {db_erro}", file=sys.stderr)
+        return
+    if morto:
+        # Sem mais tentativas: o usuário recebe o pedido de desculpas que o handler daria em modo direto
+        try:
+            # O id numérico do payload, o mesmo que os handlers usam como chave da fila de envio
+            payload = job["payload"]
+            chat_id = payload["chat_id"] if "chat_id" in payload else payload["message"]["chat"]["id"]
+            avisar_falha(chat_id, job["tipo"])
+        except Exception as e:
+            print(f"ERRO: Falha ao avisar o chat {job['chat_id']} sobre o job {job['id']}. Erro: {e}", file=sys.stderr)
+
+
+def _sinal_parada(signum, frame):
+    print(f"Sinal {signum} recebido, terminando jobs em andamento...", file=sys.stderr)
+    _parar.set()
+
+
+def main():
+    garantir_tabela_jobs()
+    if len(sys.argv) > 1:
+        if sys.argv[1] != "--requeue" or len(sys.argv) > 3:
+            print(__doc__, file=sys.stderr)
+            sys.exit(2)
+        tipo = sys.argv[2] if len(sys.argv) == 3 else None
+        print(f"{reenfileirar_mortos(tipo)} job(s) devolvido(s) à fila.", file=sys.stderr)
+        return
+
+    base_id = f"{socket.gethostname()}-{os.getpid()}"
+    signal.signal(signal.SIGTERM, _sinal_parada)
+    signal.signal(signal.SIGINT, _sinal_parada)
+
+    threads = []
+    for i in range(FILA_WORKER_THREADS):
+        t = threading.Thread(target=_loop, args=(f"{base_id}-{i}",), name=f"worker-{i}")
+        t.start()
+        threads.append(t)
+    print(f"Worker {base_id} iniciado com {FILA_WORKER_THREADS} threads.", file=sys.stderr)
+
+    # Espera com timeout para o processo principal continuar recebendo sinais.
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(0.5)
+    print(f"Worker {base_id} encerrado.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
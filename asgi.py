@@ -0,0 +1,44 @@
+"""
+Entrada ASGI do app, alternativa ao run.py/gunicorn síncrono:
+
+    uvicorn asgi:app --workers 2
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+As rotas de conversa (/responder, /api/chat, /api/chat/stream) rodam em asyncio com AsyncOpenAI,
+asyncpg e clientes httpx compartilhados, então um processo segura centenas de conversas em andamento.
+As demais rotas (webhook, histórico, interface web...) são as mesmas do Flask, servidas pelo adaptador WSGI.
+"""
+import sys
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from app.async_routes import ROTAS_ASYNC
+from app.utils.clientes_http import fechar_clientes_async
+from app.utils.helpers_async import fechar_pool_async
+
+_flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            try:
+                await fechar_pool_async()
+                await fechar_clientes_async()
+            except Exception as e:
+                print(f"AVISO: Falha ao fechar recursos assíncronos. Erro: {e}", file=sys.stderr)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http':
+        rota = ROTAS_ASYNC.get((scope['method'], scope['path']))
+        if rota:
+            return await rota(scope, receive, send)
+    return await _flask_asgi(scope, receive, send)
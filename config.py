@@ -3,4 +3,135 @@ load_dotenv()
 
 import os
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
\ No newline at end of file
+SUPABASE_URL = os.environ.get('SUPABASE_URL')
+
+# Processamento do webhook do Telegram em segundo plano
+DESPACHANTE_WORKERS = int(os.environ.get('DESPACHANTE_WORKERS', '4'))
+DESPACHANTE_MAX_PENDENTES = int(os.environ.get('DESPACHANTE_MAX_PENDENTES', '500'))
+# Prazo total para drenar todo o trabalho em segundo plano ao encerrar (abaixo dos 30s do gunicorn)
+DESPACHANTE_TIMEOUT_DESLIGAMENTO = float(os.environ.get('DESPACHANTE_TIMEOUT_DESLIGAMENTO', '25'))
+
+# Fila do webhook: 'memoria' (despachante no próprio processo) ou 'postgres' (fila durável + python -m app.worker)
+FILA_BACKEND = os.environ.get('FILA_BACKEND', 'memoria')
+FILA_MAX_TENTATIVAS = int(os.environ.get('FILA_MAX_TENTATIVAS', '5'))
+FILA_WORKER_THREADS = int(os.environ.get('FILA_WORKER_THREADS', '4'))
+FILA_VISIBILIDADE_SEGUNDOS = int(os.environ.get('FILA_VISIBILIDADE_SEGUNDOS', '300'))
+FILA_INTERVALO_POLL = float(os.environ.get('FILA_INTERVALO_POLL', '1'))
+FILA_BACKOFF_BASE = int(os.environ.get('FILA_BACKOFF_BASE', '5'))
+FILA_BACKOFF_MAX = int(os.environ.get('FILA_BACKOFF_MAX', '600'))
+# De quanto em quanto tempo (segundos) uma resposta da fila confere se chegou mensagem nova no chat
+FILA_CONFERIR_MENSAGEM_NOVA = float(os.environ.get('FILA_CONFERIR_MENSAGEM_NOVA', '1'))
+
+# Histórico: quantas mensagens são lidas do banco (teto da janela), o orçamento de tokens
+# que decide quantas delas vão de fato para o agente, e o cache em memória por user_id
+HISTORICO_LIMITE = int(os.environ.get('HISTORICO_LIMITE', '40'))
+HISTORICO_ORCAMENTO_TOKENS = int(os.environ.get('HISTORICO_ORCAMENTO_TOKENS', '3000'))
+HISTORICO_CACHE_ATIVO = os.environ.get('HISTORICO_CACHE_ATIVO', 'true').lower() == 'true'
+HISTORICO_CACHE_TTL = int(os.environ.get('HISTORICO_CACHE_TTL', '300'))
+HISTORICO_CACHE_MAX_USUARIOS = int(os.environ.get('HISTORICO_CACHE_MAX_USUARIOS', '1000'))
+HISTORICO_CACHE_MAX_BYTES = int(os.environ.get('HISTORICO_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Antes de usar a janela em cache, confere no banco (consulta só de índice) se nenhum outro processo
+# gravou ou apagou mensagens do user_id. Ao gravar um turno, a conferência vai no próprio INSERT (sem ida
+# extra ao banco); só a leitura sem gravação paga a consulta. Desligue só com um único processo atendendo os chats
+HISTORICO_CACHE_VALIDAR = os.environ.get('HISTORICO_CACHE_VALIDAR', 'true').lower() == 'true'
+# Maior página aceita por /api/history e /historico (parâmetro limit)
+HISTORICO_PAGINA_MAX = int(os.environ.get('HISTORICO_PAGINA_MAX', '200'))
+
+# Pool de conexões com o Postgres do Supabase
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_IDADE_MAXIMA = int(os.environ.get('DB_POOL_IDADE_MAXIMA', '1800'))
+DB_POOL_PING_OCIOSO = int(os.environ.get('DB_POOL_PING_OCIOSO', '30'))
+
+# Resumo incremental das conversas longas do Telegram (cobre as mensagens que ficaram de fora do prompt)
+RESUMO_MAX_TOKENS = int(os.environ.get('RESUMO_MAX_TOKENS', '300'))
+
+# Cache de respostas para perguntas de abertura idênticas (desligado por padrão)
+RESPOSTA_CACHE_ATIVO = os.environ.get('RESPOSTA_CACHE_ATIVO', 'false').lower() == 'true'
+RESPOSTA_CACHE_TTL = int(os.environ.get('RESPOSTA_CACHE_TTL', '3600'))
+RESPOSTA_CACHE_MAX_ITENS = int(os.environ.get('RESPOSTA_CACHE_MAX_ITENS', '500'))
+RESPOSTA_CACHE_MAX_BYTES = int(os.environ.get('RESPOSTA_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+RESPOSTA_CACHE_MAX_MENSAGENS = int(os.environ.get('RESPOSTA_CACHE_MAX_MENSAGENS', '1'))
+
+# Clientes HTTP compartilhados (OpenAI) e modo ASGI
+HTTP_MAX_CONEXOES = int(os.environ.get('HTTP_MAX_CONEXOES', '100'))
+HTTP_MAX_KEEPALIVE = int(os.environ.get('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '60'))
+ASYNC_DB_POOL_MIN = int(os.environ.get('ASYNC_DB_POOL_MIN', '1'))
+ASYNC_DB_POOL_MAX = int(os.environ.get('ASYNC_DB_POOL_MAX', '10'))
+
+# Cliente da Bot API do Telegram (sessão keep-alive com novas tentativas)
+TELEGRAM_TIMEOUT_CONEXAO = float(os.environ.get('TELEGRAM_TIMEOUT_CONEXAO', '3.05'))
+TELEGRAM_TIMEOUT_LEITURA = float(os.environ.get('TELEGRAM_TIMEOUT_LEITURA', '30'))
+TELEGRAM_MAX_TENTATIVAS = int(os.environ.get('TELEGRAM_MAX_TENTATIVAS', '4'))
+TELEGRAM_BACKOFF_BASE = float(os.environ.get('TELEGRAM_BACKOFF_BASE', '0.5'))
+TELEGRAM_RETRY_AFTER_MAX = float(os.environ.get('TELEGRAM_RETRY_AFTER_MAX', '60'))
+TELEGRAM_POOL_CONEXOES = int(os.environ.get('TELEGRAM_POOL_CONEXOES', '20'))
+
+# Fila de saída para o Telegram (limites de ~1 msg/s por chat e ~30 msg/s no total)
+TELEGRAM_ENVIO_POR_CHAT = float(os.environ.get('TELEGRAM_ENVIO_POR_CHAT', '1'))
+TELEGRAM_ENVIO_RAJADA_CHAT = int(os.environ.get('TELEGRAM_ENVIO_RAJADA_CHAT', '1'))
+TELEGRAM_ENVIO_GLOBAL = float(os.environ.get('TELEGRAM_ENVIO_GLOBAL', '30'))
+TELEGRAM_ENVIO_WORKERS = int(os.environ.get('TELEGRAM_ENVIO_WORKERS', '4'))
+TELEGRAM_ENVIO_MAX_PENDENTES = int(os.environ.get('TELEGRAM_ENVIO_MAX_PENDENTES', '5000'))
+
+# Downloads de mídia do Telegram ficam em memória até este tamanho; acima disso vão para disco
+MIDIA_LIMITE_MEMORIA = int(os.environ.get('MIDIA_LIMITE_MEMORIA', str(5 * 1024 * 1024)))
+
+# Deduplicação de mídias (file_unique_id / sha256) e cache das URLs do getFile (válidas por ~1h)
+MIDIA_CACHE_TTL = int(os.environ.get('MIDIA_CACHE_TTL', str(24 * 3600)))
+MIDIA_CACHE_MAX_ITENS = int(os.environ.get('MIDIA_CACHE_MAX_ITENS', '5000'))
+TELEGRAM_FILE_URL_TTL = int(os.environ.get('TELEGRAM_FILE_URL_TTL', '3300'))
+
+# Fotos: responde a partir do data URL e sobe para o Storage em segundo plano.
+# Desligado sempre com FILA_BACKEND=postgres: o data URL fica na memória do worker que recebeu a foto, e o job
+# 'responder' pode rodar em outro worker, que mandaria à OpenAI a URL de um objeto que ainda não existe
+MIDIA_UPLOAD_ADIADO = FILA_BACKEND != 'postgres' and os.environ.get('MIDIA_UPLOAD_ADIADO', 'true').lower() == 'true'
+MIDIA_PENDENTE_TTL = int(os.environ.get('MIDIA_PENDENTE_TTL', '600'))
+MIDIA_PENDENTE_MAX_BYTES = int(os.environ.get('MIDIA_PENDENTE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Fotos enviadas ao modelo de visão: resolução alvo (lado menor, em px) e nível de detalhe da OpenAI
+IMAGEM_LADO_ALVO = int(os.environ.get('IMAGEM_LADO_ALVO', '768'))
+IMAGEM_DETALHE = os.environ.get('IMAGEM_DETALHE', 'auto')  # 'low', 'high' ou 'auto'
+IMAGEM_REDIMENSIONAR = os.environ.get('IMAGEM_REDIMENSIONAR', 'true').lower() == 'true'
+IMAGEM_QUALIDADE_JPEG = int(os.environ.get('IMAGEM_QUALIDADE_JPEG', '85'))
+
+# Descrições das fotos (escritas pela própria resposta à foto), usadas no histórico no lugar da imagem
+# depois do primeiro turno; o cache em memória fica na frente da coluna descricao de midias_telegram
+DESCRICAO_IMAGEM_ATIVA = os.environ.get('DESCRICAO_IMAGEM_ATIVA', 'true').lower() == 'true'
+DESCRICAO_IMAGEM_TTL = int(os.environ.get('DESCRICAO_IMAGEM_TTL', str(7 * 24 * 3600)))
+DESCRICAO_IMAGEM_MAX_ITENS = int(os.environ.get('DESCRICAO_IMAGEM_MAX_ITENS', '5000'))
+
+# Transcrição de áudio: conversão com ffmpeg, divisão nos silêncios e trechos transcritos em paralelo
+TRANSCRICAO_FFMPEG = os.environ.get('TRANSCRICAO_FFMPEG', 'ffmpeg')
+TRANSCRICAO_BITRATE = os.environ.get('TRANSCRICAO_BITRATE', '24k')
+TRANSCRICAO_TRECHO_SEGUNDOS = float(os.environ.get('TRANSCRICAO_TRECHO_SEGUNDOS', '120'))
+TRANSCRICAO_PARALELISMO = int(os.environ.get('TRANSCRICAO_PARALELISMO', '4'))
+TRANSCRICAO_SILENCIO_DB = int(os.environ.get('TRANSCRICAO_SILENCIO_DB', '-35'))
+TRANSCRICAO_SILENCIO_MIN = float(os.environ.get('TRANSCRICAO_SILENCIO_MIN', '0.5'))
+TRANSCRICAO_CACHE_TTL = int(os.environ.get('TRANSCRICAO_CACHE_TTL', str(24 * 3600)))
+TRANSCRICAO_CACHE_MAX_ITENS = int(os.environ.get('TRANSCRICAO_CACHE_MAX_ITENS', '1000'))
+
+# Mensagens seguidas do mesmo chat do Telegram dentro desta janela recebem uma resposta só (0 desliga)
+COALESCER_JANELA_SEGUNDOS = float(os.environ.get('COALESCER_JANELA_SEGUNDOS', '1.5'))
+
+# Álbuns do Telegram (fotos com o mesmo media_group_id) viram uma única mensagem
+ALBUM_JANELA_SEGUNDOS = float(os.environ.get('ALBUM_JANELA_SEGUNDOS', '1.0'))
+ALBUM_PARALELISMO = int(os.environ.get('ALBUM_PARALELISMO', '4'))
+
+# Idempotência: updates do Telegram já vistos e respostas guardadas por Idempotency-Key (segundos)
+IDEMPOTENCIA_TTL = int(os.environ.get('IDEMPOTENCIA_TTL', '600'))
+IDEMPOTENCIA_MAX_ITENS = int(os.environ.get('IDEMPOTENCIA_MAX_ITENS', '2000'))
+UPDATES_VISTOS_MAX = int(os.environ.get('UPDATES_VISTOS_MAX', '10000'))
+
+# Estrutura do banco (python -m app.schema): partições por hash de user_id para instalações novas
+# (0 = tabela sem partições) e limpeza das sessões da interface web sem mensagens há RETENCAO_SESSOES_DIAS dias
+HISTORICO_PARTICOES = int(os.environ.get('HISTORICO_PARTICOES', '0'))
+# Data gravada em criado_em das mensagens de antes da coluna existir (a real é desconhecida). O padrão as
+# trata como mais antigas que qualquer corte de retenção; para adiar a limpeza delas, use a data da migração
+HISTORICO_CRIADO_EM_LEGADO = os.environ.get('HISTORICO_CRIADO_EM_LEGADO', '1970-01-01T00:00:00+00:00')
+RETENCAO_SESSOES_DIAS = int(os.environ.get('RETENCAO_SESSOES_DIAS', '90'))
+RETENCAO_LOTE = int(os.environ.get('RETENCAO_LOTE', '500'))
+RETENCAO_PAUSA_SEGUNDOS = float(os.environ.get('RETENCAO_PAUSA_SEGUNDOS', '0.2'))
+RETENCAO_ARQUIVAR = os.environ.get('RETENCAO_ARQUIVAR', 'false').lower() == 'true'
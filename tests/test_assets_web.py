@@ -0,0 +1,47 @@
+import gzip
+
+import pytest
+
+from app.utils.assets_web import construir_assets
+
+CSS = b"body { color: #333; }\n" * 50
+
+
+@pytest.fixture
+def diretorio(tmp_path):
+    (tmp_path / "chat.html").write_text('<link href="/assets/chat.css"><script src="/assets/chat.js"></script>')
+    (tmp_path / "chat.css").write_bytes(CSS)
+    (tmp_path / "chat.js").write_bytes(b"x")
+    return tmp_path
+
+
+def test_pagina_aponta_para_os_nomes_com_hash(diretorio):
+    pagina, assets = construir_assets(str(diretorio))
+    nomes = {asset.nome: nome_publico for nome_publico, asset in assets.items()}
+
+    assert set(nomes) == {"chat.css", "chat.js"}
+    assert nomes["chat.css"].startswith("chat.") and nomes["chat.css"].endswith(".css")
+    html = pagina.variantes["identity"].decode("utf-8")
+    assert f'"/assets/{nomes["chat.css"]}"' in html and f'"/assets/{nomes["chat.js"]}"' in html
+
+    # Outro conteúdo, outro nome: o navegador pode guardar cada um para sempre
+    (diretorio / "chat.css").write_bytes(CSS + b"a { }\n")
+    _, novos = construir_assets(str(diretorio))
+    assert nomes["chat.css"] not in novos and nomes["chat.js"] in novos
+
+
+def test_variantes_comprimidas_so_quando_menores(diretorio):
+    _, assets = construir_assets(str(diretorio))
+    css = next(asset for asset in assets.values() if asset.nome == "chat.css")
+    js = next(asset for asset in assets.values() if asset.nome == "chat.js")
+
+    assert gzip.decompress(css.variantes["gzip"]) == CSS
+    assert list(js.variantes) == ["identity"]  # Um byte não fica menor comprimido
+    codificacao, corpo, etag = css.escolher(lambda aceita: aceita == "gzip")
+    assert (codificacao, corpo, etag) == ("gzip", css.variantes["gzip"], f"{css.hash}-gzip")
+    assert css.escolher(lambda aceita: False) == ("identity", CSS, css.hash)
+
+
+def test_sem_a_pagina_falha_na_subida(diretorio):
+    with pytest.raises(FileNotFoundError):
+        construir_assets(str(diretorio), pagina="outra.html")
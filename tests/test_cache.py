@@ -0,0 +1,92 @@
+from app.utils import cache as modulo_cache
+from app.utils.cache import CacheLRU
+from app.utils.historico_cache import HistoricoCache
+
+
+def test_despeja_o_menos_usado_recentemente():
+    cache = CacheLRU(max_itens=2, ttl=None)
+    cache.definir("a", 1)
+    cache.definir("b", 2)
+    assert cache.obter("a") == 1  # "a" passa a ser o mais recente
+    cache.definir("c", 3)
+
+    assert "b" not in cache
+    assert cache.obter("a") == 1
+    assert cache.obter("c") == 3
+    assert cache.estatisticas()["despejos"] == 1
+
+
+def test_despeja_pelo_total_de_bytes():
+    cache = CacheLRU(max_itens=100, ttl=None, max_bytes=10, tamanho_fn=len)
+    cache.definir("a", "xxxx")
+    cache.definir("b", "xxxx")
+    cache.definir("c", "xxxx")
+
+    assert "a" not in cache
+    assert cache.estatisticas()["bytes"] == 8
+    cache.definir("grande", "x" * 11)  # Maior que o cache inteiro: não é guardado
+    assert "grande" not in cache
+    assert len(cache) == 2
+
+
+def test_expira_pelo_ttl(monkeypatch, relogio):
+    monkeypatch.setattr(modulo_cache.time, "monotonic", relogio)
+    cache = CacheLRU(max_itens=10, ttl=5)
+    cache.definir("a", 1)
+    cache.definir("b", 2, ttl=60)
+
+    relogio.agora += 6
+    assert cache.obter("a") is None
+    assert cache.obter("b") == 2
+    assert not cache.atualizar("a", lambda valor: valor + 1)
+    estatisticas = cache.estatisticas()
+    assert (estatisticas["hits"], estatisticas["misses"], estatisticas["itens"]) == (1, 1, 1)
+
+
+def test_atualizar_mantem_o_ttl_e_recalcula_o_tamanho(monkeypatch, relogio):
+    monkeypatch.setattr(modulo_cache.time, "monotonic", relogio)
+    cache = CacheLRU(max_itens=10, ttl=5, tamanho_fn=len)
+    cache.definir("a", "xx")
+    relogio.agora += 3
+    assert cache.atualizar("a", lambda valor: valor + "yyy")
+    assert cache.estatisticas()["bytes"] == 5
+
+    relogio.agora += 3  # O TTL conta desde o definir, não desde o atualizar
+    assert cache.obter("a") is None
+
+
+def test_historico_cache_anexa_em_ordem_e_respeita_o_limite():
+    historico = HistoricoCache(limite=3, ttl=None)
+    historico.carregar("u", lambda: [(1, "user", "a"), (2, "assistant", "b")])
+    historico.anexar("u", (4, "assistant", "d"))
+    historico.anexar("u", (3, "user", "c"))
+    historico.anexar("u", (4, "assistant", "d"))  # Repetido: ignorado
+
+    assert [r[0] for r in historico.obter("u")] == [2, 3, 4]
+
+
+def test_historico_cache_descarta_carga_concorrente_com_escrita():
+    historico = HistoricoCache(limite=10, ttl=None)
+
+    def ler_do_banco():
+        # Outra thread grava uma mensagem enquanto a janela está sendo lida
+        historico.anexar("u", (2, "user", "nova"))
+        return [(1, "user", "antiga")]
+
+    assert historico.carregar("u", ler_do_banco) == [(1, "user", "antiga")]
+    assert not historico.contem("u")
+
+
+def test_historico_cache_nao_guarda_carga_que_falhou():
+    historico = HistoricoCache(limite=10, ttl=None)
+
+    def ler_do_banco():
+        raise RuntimeError("banco fora")
+
+    try:
+        historico.carregar("u", ler_do_banco)
+    except RuntimeError:
+        pass
+    assert historico.obter("u") is None
+    historico.carregar("u", lambda: [(1, "user", "a")])
+    assert historico.contem("u")
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from psycopg2 import extensions
+
+from app.utils import db_pool as modulo_pool
+from app.utils.db_pool import PoolDeConexoes, PoolEsgotado
+
+
+class ConexaoFalsa:
+    """O mínimo da interface de uma conexão psycopg2 que o pool usa."""
+
+    def __init__(self, viva=True):
+        self.closed = 0
+        self.viva = viva
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        conexao = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *excecao):
+                return False
+
+            def execute(self, sql):
+                if not conexao.viva:
+                    raise OSError("server closed the connection unexpectedly")
+
+        return Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = 1
+
+
+class PoolDeTeste(PoolDeConexoes):
+    def __init__(self, **kwargs):
+        self.criadas = []
+        super().__init__(dsn="", **kwargs)
+
+    def _conectar(self):
+        conn = ConexaoFalsa()
+        self.criadas.append(conn)
+        return conn
+
+
+def test_reaproveita_a_conexao_devolvida():
+    pool = PoolDeTeste(minconn=1, maxconn=2)
+    conn = pool.obter()
+    pool.devolver(conn)
+
+    assert pool.obter() is conn
+    assert len(pool.criadas) == 1
+    assert pool.estatisticas()["checkouts"] == 2
+
+
+def test_esgota_no_maximo_e_respeita_o_timeout():
+    pool = PoolDeTeste(minconn=0, maxconn=2)
+    pool.obter()
+    pool.obter()
+
+    inicio = time.monotonic()
+    with pytest.raises(PoolEsgotado):
+        pool.obter(timeout=0.1)
+    assert time.monotonic() - inicio >= 0.1
+    estatisticas = pool.estatisticas()
+    assert (estatisticas["em_uso"], estatisticas["total"], estatisticas["timeouts"]) == (2, 2, 1)
+
+
+def test_espera_ate_uma_conexao_ser_devolvida():
+    pool = PoolDeTeste(minconn=0, maxconn=1)
+    conn = pool.obter()
+    obtida = []
+    espera = threading.Thread(target=lambda: obtida.append(pool.obter(timeout=5)))
+    espera.start()
+    time.sleep(0.05)
+    pool.devolver(conn)
+    espera.join(5)
+
+    assert obtida == [conn]
+    assert pool.estatisticas()["esperas"] == 1
+
+
+def test_recicla_conexao_mais_velha_que_a_idade_maxima(monkeypatch, relogio):
+    monkeypatch.setattr(modulo_pool.time, "monotonic", relogio)
+    pool = PoolDeTeste(minconn=1, maxconn=2, idade_maxima=60, ping_apos_ocioso=None)
+    velha = pool.criadas[0]
+
+    relogio.agora += 61
+    conn = pool.obter()
+
+    assert conn is not velha
+    assert velha.closed
+    estatisticas = pool.estatisticas()
+    assert (estatisticas["recicladas"], estatisticas["total"]) == (1, 1)
+
+
+def test_descarta_conexao_ociosa_que_nao_responde_ao_ping(monkeypatch, relogio):
+    monkeypatch.setattr(modulo_pool.time, "monotonic", relogio)
+    pool = PoolDeTeste(minconn=1, maxconn=2, idade_maxima=None, ping_apos_ocioso=30)
+    pool.criadas[0].viva = False
+
+    relogio.agora += 31
+    conn = pool.obter()
+
+    assert conn is pool.criadas[1]
+    assert pool.estatisticas()["pings_falhos"] == 1
+
+
+def test_devolver_desfaz_transacao_aberta_e_descarta_fechadas():
+    pool = PoolDeTeste(minconn=0, maxconn=2)
+    aberta = pool.obter()
+    aberta.status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.devolver(aberta)
+    assert aberta.rollbacks == 1
+    assert pool.estatisticas()["ociosas"] == 1
+
+    fechada = pool.obter()
+    fechada.close()
+    pool.devolver(fechada)
+    estatisticas = pool.estatisticas()
+    assert (estatisticas["ociosas"], estatisticas["total"]) == (0, 0)
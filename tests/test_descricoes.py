@@ -0,0 +1,55 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def descricoes(monkeypatch):
+    # midia_cache abre o pool do banco ao ser importado; as descrições gravadas ficam num dict
+    gravadas = {}
+    falso = types.ModuleType("app.utils.midia_cache")
+    falso.registrar_descricoes = gravadas.update
+    falso.buscar_descricoes = lambda urls: {url: gravadas[url] for url in urls if url in gravadas}
+    monkeypatch.setitem(sys.modules, "app.utils.midia_cache", falso)
+    monkeypatch.delitem(sys.modules, "app.utils.descricoes", raising=False)
+    modulo = importlib.import_module("app.utils.descricoes")
+    modulo.gravadas = gravadas
+    yield modulo
+    sys.modules.pop("app.utils.descricoes", None)
+
+
+def test_descricoes_saem_do_texto_mesmo_com_o_marcador_partido(descricoes):
+    separador = descricoes.SeparadorDescricoes(["https://x/a.jpg", "https://x/b.jpg"])
+    pedacos = ["Que bela massa!", "\n\n[[DESC", "RICOES]]\n1: Massa fresca", " crua.\n2) Tomates maduros.\n"]
+
+    texto = "".join(separador.filtrar(p) for p in pedacos) + separador.concluir()
+
+    assert texto == "Que bela massa!\n\n"
+    assert descricoes.gravadas == {"https://x/a.jpg": "Massa fresca crua.", "https://x/b.jpg": "Tomates maduros."}
+
+
+def test_texto_parecido_com_o_marcador_nao_se_perde(descricoes):
+    separador = descricoes.SeparadorDescricoes(["https://x/a.jpg"])
+
+    texto = separador.filtrar("Use [[") + separador.filtrar("colchetes]]") + separador.concluir()
+
+    assert texto == "Use [[colchetes]]"
+    assert descricoes.gravadas == {}
+
+
+def test_foto_de_turno_anterior_vai_como_descricao(descricoes):
+    descricoes.gravadas["https://x/a.jpg"] = "Massa fresca crua."
+    historico = [
+        {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "https://x/a.jpg"}}]},
+        {"role": "assistant", "content": "Que bela massa!"},
+        {"role": "user", "content": [{"type": "text", "text": "Quanto tempo cozinho?"},
+                                     {"type": "image_url", "image_url": {"url": "https://x/b.jpg"}}]},
+    ]
+
+    resultado = descricoes.trocar_imagens_por_descricoes(historico)
+
+    assert resultado[0]["content"] == [{"type": "text", "text": "[Foto enviada antes pelo usuário: Massa fresca crua.]"}]
+    assert resultado[2] is historico[2]
+    assert descricoes.fotos_a_descrever(historico) == ["https://x/b.jpg"]
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.coalescedor import Coalescedor
+from app.utils.dispatcher import DespachantePorChat, FilaCheia
+
+
+def test_jobs_do_mesmo_chat_rodam_em_ordem_e_um_de_cada_vez():
+    despachante = DespachantePorChat(max_workers=4, max_pendentes=100, nome="teste-ordem")
+    executados = {"a": [], "b": []}
+    em_execucao = {"a": 0, "b": 0}
+    sobreposicoes = []
+    lock = threading.Lock()
+
+    def job(chat, n):
+        with lock:
+            em_execucao[chat] += 1
+            if em_execucao[chat] > 1:
+                sobreposicoes.append((chat, n))
+        time.sleep(0.002)
+        with lock:
+            executados[chat].append(n)
+            em_execucao[chat] -= 1
+
+    for n in range(20):
+        despachante.submeter("a", job, "a", n)
+        despachante.submeter("b", job, "b", n)
+    despachante.desligar(timeout=10)
+
+    assert executados == {"a": list(range(20)), "b": list(range(20))}
+    assert sobreposicoes == []
+    assert despachante.estatisticas()["processados"] == 40
+
+
+def test_chats_diferentes_rodam_em_paralelo():
+    despachante = DespachantePorChat(max_workers=2, max_pendentes=10, nome="teste-paralelo")
+    juntos = threading.Barrier(2, timeout=5)
+
+    # Se os dois chats não rodassem ao mesmo tempo, a barreira estouraria o timeout
+    despachante.submeter("a", juntos.wait)
+    despachante.submeter("b", juntos.wait)
+    despachante.desligar(timeout=10)
+
+    assert despachante.estatisticas()["erros"] == 0
+
+
+def test_erro_num_job_nao_para_a_fila_do_chat():
+    despachante = DespachantePorChat(max_workers=1, max_pendentes=10, nome="teste-erro")
+    executados = []
+
+    def falha():
+        raise RuntimeError("falhou")
+
+    despachante.submeter("a", falha)
+    despachante.submeter("a", executados.append, "depois")
+    despachante.desligar(timeout=10)
+
+    assert executados == ["depois"]
+    assert despachante.estatisticas()["erros"] == 1
+
+
+def test_recusa_jobs_acima_do_limite_e_depois_de_desligar():
+    despachante = DespachantePorChat(max_workers=1, max_pendentes=1, nome="teste-limite")
+    liberar = threading.Event()
+    despachante.submeter("a", liberar.wait, 5)
+    time.sleep(0.05)  # O primeiro job sai da fila e fica em execução
+    despachante.submeter("a", lambda: None)
+
+    with pytest.raises(FilaCheia):
+        despachante.submeter("b", lambda: None)
+    liberar.set()
+    despachante.desligar(timeout=10)
+    with pytest.raises(RuntimeError):
+        despachante.submeter("a", lambda: None)
+
+
+def test_coalescedor_dispara_uma_vez_por_rajada():
+    disparos = []
+    disparou = threading.Event()
+
+    def executar(chave, geracao):
+        disparos.append((chave, geracao))
+        disparou.set()
+
+    coalescedor = Coalescedor(0.05, executar, nome="teste-coalescedor")
+    coalescedor.sinalizar("a")
+    coalescedor.sinalizar("a")
+    ultima = coalescedor.sinalizar("a")
+    assert disparou.wait(5)
+    time.sleep(0.1)
+
+    assert disparos == [("a", ultima)]
+    assert coalescedor.atual("a", ultima)
+    coalescedor.concluir("a", ultima)
+    assert coalescedor.estatisticas()["chaves"] == 0
+
+
+def test_coalescedor_geracao_antiga_deixa_de_ser_atual():
+    coalescedor = Coalescedor(60, lambda chave, geracao: None, nome="teste-geracao")
+    primeira = coalescedor.sinalizar("a")
+    segunda = coalescedor.sinalizar("a")
+
+    assert not coalescedor.atual("a", primeira)
+    coalescedor.concluir("a", primeira)  # Não esquece a rajada mais nova
+    assert coalescedor.atual("a", segunda)
@@ -0,0 +1,56 @@
+import importlib
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+
+@pytest.fixture
+def envio(monkeypatch):
+    # envio_telegram importa de helpers só a função de envio; helpers abre o pool do Supabase ao ser importado.
+    helpers = types.ModuleType("app.utils.helpers")
+    helpers.enviar_mensagem_telegram = lambda chat_id, texto: None
+    monkeypatch.setitem(sys.modules, "app.utils.helpers", helpers)
+    monkeypatch.delitem(sys.modules, "app.utils.envio_telegram", raising=False)
+    yield importlib.import_module("app.utils.envio_telegram")
+    sys.modules.pop("app.utils.envio_telegram", None)
+
+
+def test_balde_libera_a_rajada_e_depois_repoe_pela_taxa(envio, monkeypatch, relogio):
+    monkeypatch.setattr(envio.time, "monotonic", relogio)
+    balde = envio._Balde(taxa=2.0, capacidade=2)
+    for _ in range(2):
+        assert balde.espera(relogio()) == 0.0
+        balde.consumir()
+    assert balde.espera(relogio()) == pytest.approx(0.5)
+
+    relogio.agora += 0.25
+    assert balde.espera(relogio()) == pytest.approx(0.25)
+    relogio.agora += 10  # Não acumula além da capacidade
+    assert balde.cheio(relogio())
+    assert balde.tokens == 2
+
+
+def test_chats_intercalados_em_ordem_e_com_intervalo_por_chat(envio):
+    enviados = []
+    liberar = threading.Event()
+
+    def enviar(chat_id, texto):
+        liberar.wait(5)  # Segura o primeiro envio até tudo estar agendado
+        enviados.append((chat_id, texto, time.monotonic()))
+
+    agendador = envio.AgendadorEnvios(enviar, taxa_por_chat=20.0, rajada_por_chat=1, taxa_global=1000.0,
+                                      max_workers=1, nome="teste-envios")
+    futuros = [agendador.agendar("a", f"a{n}") for n in (1, 2, 3)]
+    futuros += [agendador.agendar("b", f"b{n}") for n in (1, 2)]
+    liberar.set()
+    for futuro in futuros:
+        futuro.result(5)
+    agendador.desligar(timeout=5)
+
+    assert [texto for _, texto, _ in enviados] == ["a1", "b1", "a2", "b2", "a3"]
+    momentos_a = [momento for chat_id, _, momento in enviados if chat_id == "a"]
+    assert all(depois - antes >= 0.045 for antes, depois in zip(momentos_a, momentos_a[1:]))
+    assert agendador.estatisticas()["enviados"] == 5
@@ -0,0 +1,111 @@
+import importlib
+import sys
+import types
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("requests")
+
+
+class Banco:
+    """db_connection falso: guarda as consultas e devolve os resultados preparados, em ordem."""
+
+    def __init__(self):
+        self.consultas = []
+        self.resultados = []
+
+    @contextmanager
+    def conexao(self):
+        banco = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *excecao):
+                return False
+
+            def execute(self, sql, params=None):
+                banco.consultas.append((" ".join(sql.split()), params))
+
+            def fetchone(self):
+                return banco.resultados.pop(0)
+
+            def fetchall(self):
+                return banco.resultados.pop(0)
+
+        class Conexao:
+            def cursor(self):
+                return Cursor()
+
+        yield Conexao()
+
+
+def _modulo(nome, **atributos):
+    modulo = types.ModuleType(nome)
+    modulo.__dict__.update(atributos)
+    return modulo
+
+
+@pytest.fixture
+def helpers(monkeypatch):
+    # Os módulos que helpers usa para abrir conexões ao ser importado (pool do Supabase, OpenAI, Telegram)
+    # são trocados por módulos só com os nomes usados; o db_connection passa a ser o do Banco.
+    monkeypatch.setenv("SUPABASE_PASSWORD", "teste")
+    monkeypatch.setenv("TELEGRAM_TOKEN", "teste")
+
+    class Pool:
+        def __init__(self, **kwargs):
+            pass
+
+    falsos = [
+        _modulo("app.utils.db_pool", PoolDeConexoes=Pool),
+        _modulo("app.utils.clientes_http", openai_client=None),
+        _modulo("app.utils.telegram_client", TelegramClient=lambda *args, **kwargs: None, TelegramErro=Exception),
+    ]
+    for modulo in falsos:
+        monkeypatch.setitem(sys.modules, modulo.__name__, modulo)
+    monkeypatch.delitem(sys.modules, "app.utils.helpers", raising=False)
+    modulo = importlib.import_module("app.utils.helpers")
+    banco = Banco()
+    monkeypatch.setattr(modulo, "db_connection", banco.conexao)
+    monkeypatch.setattr(modulo, "historico_cache", modulo.HistoricoCache(limite=20))
+    modulo.banco = banco
+    yield modulo
+    sys.modules.pop("app.utils.helpers", None)
+
+
+def _registros(*ids):
+    return [(mensagem_id, "user", f"mensagem {mensagem_id}") for mensagem_id in ids]
+
+
+def test_etag_muda_com_a_versao_e_com_os_parametros(helpers):
+    helpers.banco.resultados = [(42, 7), (42, 7), (43, 8)]
+    etag, ultimo_id, quantidade = helpers.etag_historico(1, 20, None)
+    assert (ultimo_id, quantidade) == (42, 7)
+    assert helpers.etag_historico(1, 50, None)[0] != etag
+    assert helpers.etag_historico(1, 20, None)[0] != etag
+
+
+def test_pagina_sai_da_janela_em_cache_ate_a_versao_do_etag(helpers):
+    helpers.historico_cache.carregar(1, lambda: _registros(1, 2, 3, 4, 5))
+
+    # Uma mensagem gravada depois do ETag (id 5) fica de fora, sem ir ao banco
+    assert helpers.buscar_pagina_historico(1, limite=2, ate=4) == (_registros(3, 4), True)
+    assert helpers.buscar_pagina_historico(1, depois_de=2, limite=10, ate=4) == (_registros(3, 4), False)
+    assert helpers.banco.consultas == []
+
+
+def test_janela_atrasada_ou_pagina_anterior_vao_ao_banco(helpers):
+    helpers.historico_cache.carregar(1, lambda: _registros(1, 2, 3))
+    helpers.banco.resultados = [[(4, "user", {"content": "mensagem 4"}), (3, "user", "mensagem 3")]]
+    assert helpers.buscar_pagina_historico(1, limite=5, ate=4) == (_registros(3, 4), False)
+
+    helpers.banco.resultados = [_registros(9, 8, 7)]
+    assert helpers.buscar_pagina_historico(1, antes_de=10, limite=2) == (_registros(8, 9), True)
+
+    sql, params = helpers.banco.consultas[-1]
+    assert "id < %s" in sql and sql.endswith("ORDER BY id DESC LIMIT %s")
+    assert params == [1, 10, 3]
@@ -0,0 +1,45 @@
+from app.utils.idempotencia import SingleFlight, EM_ANDAMENTO
+
+
+def test_resultado_guardado_e_devolvido_na_repeticao():
+    voos = SingleFlight(max_itens=10, ttl=60)
+    chamadas = []
+
+    def executar():
+        chamadas.append(1)
+        return "resposta"
+
+    assert voos.executar("k", executar) == "resposta"
+    assert voos.executar("k", executar) == "resposta"
+    assert len(chamadas) == 1
+
+
+def test_resultado_de_falha_nao_fica_guardado():
+    voos = SingleFlight(max_itens=10, ttl=60)
+    respostas = iter(["desculpe", "resposta"])
+
+    def guardar(resposta):
+        return resposta != "desculpe"
+
+    assert voos.executar("k", lambda: next(respostas), guardar) == "desculpe"
+    # A repetição executa de novo em vez de receber o pedido de desculpas guardado
+    assert voos.executar("k", lambda: next(respostas), guardar) == "resposta"
+    assert voos.executar("k", lambda: "outra", guardar) == "resposta"
+
+
+def test_reserva_de_stream_recusa_repeticao_em_andamento_e_repete_o_resultado():
+    voos = SingleFlight(max_itens=10, ttl=60)
+
+    assert voos.reservar("k") is None
+    assert voos.reservar("k") is EM_ANDAMENTO
+    voos.liberar("k", {"response": "resposta"})
+    voos.liberar("k")  # Repetido (fim do gerador e fechamento da resposta): não apaga o que foi guardado
+    assert voos.reservar("k") == {"response": "resposta"}
+
+
+def test_reserva_liberada_sem_resultado_executa_de_novo():
+    voos = SingleFlight(max_itens=10, ttl=60)
+
+    assert voos.reservar("k") is None
+    voos.liberar("k")
+    assert voos.reservar("k") is None
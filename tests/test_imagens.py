@@ -0,0 +1,28 @@
+import pytest
+
+from app.utils.imagens import escolher_tamanho_foto, tokens_visao
+
+# message['photo'] de uma foto 4:3, como o Telegram manda (fora de ordem de propósito)
+TAMANHOS = [
+    {"file_id": "m", "width": 320, "height": 240, "file_size": 15_000},
+    {"file_id": "g", "width": 1280, "height": 960, "file_size": 180_000},
+    {"file_id": "p", "width": 90, "height": 67, "file_size": 1_200},
+    {"file_id": "x", "width": 2560, "height": 1920, "file_size": 600_000},
+]
+
+
+@pytest.mark.parametrize("lado_alvo, escolhido", [(60, "p"), (240, "m"), (768, "g"), (1920, "x"), (4000, "x")])
+def test_escolhe_o_menor_tamanho_que_atende_ao_lado_alvo(lado_alvo, escolhido):
+    assert escolher_tamanho_foto(TAMANHOS, lado_alvo)["file_id"] == escolhido
+
+
+@pytest.mark.parametrize("largura, altura, detalhe, tokens", [
+    (512, 512, "high", 255),      # Um bloco
+    (1024, 1024, "high", 765),    # Reduzida para 768x768: 2x2 blocos
+    (4000, 3000, "auto", 765),    # 2048x1536 e depois 1024x768
+    (2048, 4096, "high", 1105),   # 768x1536: 2x3 blocos
+    (4000, 3000, "low", 85),
+    (None, None, "high", 85),     # Tamanho desconhecido
+])
+def test_tokens_visao(largura, altura, detalhe, tokens):
+    assert tokens_visao(largura, altura, detalhe) == tokens
@@ -0,0 +1,168 @@
+import importlib
+import os
+import sys
+import types
+from contextlib import contextmanager
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+# Testes da fila durável contra um Postgres de verdade (ordem por chat depende do SQL).
+# Rodam só com TESTE_DATABASE_URL apontando para um banco descartável: a tabela jobs_webhook é esvaziada.
+DSN = os.environ.get("TESTE_DATABASE_URL")
+if not DSN:
+    pytest.skip("TESTE_DATABASE_URL não definido", allow_module_level=True)
+
+
+@contextmanager
+def _conexao_teste():
+    conn = psycopg2.connect(DSN)
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="module")
+def fila():
+    # app.utils.helpers abre o pool do Supabase ao ser importado; a fila recebe no lugar dele
+    # só o db_connection, ligado ao banco de teste.
+    helpers = types.ModuleType("app.utils.helpers")
+    helpers.db_connection = _conexao_teste
+    anterior = sys.modules.get("app.utils.helpers")
+    sys.modules["app.utils.helpers"] = helpers
+    sys.modules.pop("app.utils.job_queue", None)
+    try:
+        modulo = importlib.import_module("app.utils.job_queue")
+        modulo.garantir_tabela_jobs()
+        yield modulo
+    finally:
+        sys.modules.pop("app.utils.job_queue", None)
+        if anterior is None:
+            sys.modules.pop("app.utils.helpers", None)
+        else:
+            sys.modules["app.utils.helpers"] = anterior
+
+
+@pytest.fixture(autouse=True)
+def tabela_vazia(fila):
+    with _conexao_teste() as conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE jobs_webhook")
+        conn.commit()
+
+
+def _status(job_id):
+    with _conexao_teste() as conn, conn.cursor() as cur:
+        cur.execute("SELECT status, tentativas, disponivel_em > now() FROM jobs_webhook WHERE id=%s", (job_id,))
+        return cur.fetchone()
+
+
+def test_reserva_respeita_a_ordem_de_cada_chat(fila):
+    a1 = fila.enfileirar_job("text", 1, {"n": 1})
+    a2 = fila.enfileirar_job("text", 1, {"n": 2})
+    b1 = fila.enfileirar_job("text", 2, {"n": 1})
+
+    assert fila.reservar_job("w1", 60)["id"] == a1
+    # a2 espera a1 terminar; o outro chat segue em paralelo
+    assert fila.reservar_job("w2", 60)["id"] == b1
+    assert fila.reservar_job("w3", 60) is None
+
+    fila.concluir_job(a1)
+    assert fila.reservar_job("w1", 60)["id"] == a2
+
+
+def test_falha_reagenda_com_backoff_e_segura_o_chat(fila):
+    a1 = fila.enfileirar_job("text", 1, {"n": 1}, max_tentativas=3)
+    a2 = fila.enfileirar_job("text", 1, {"n": 2})
+
+    job = fila.reservar_job("w1", 60)
+    assert job["tentativas"] == 1
+    assert fila.falhar_job(job, RuntimeError("OpenAI fora"), backoff_base=30, backoff_max=600) is False
+
+    assert _status(a1) == ("pendente", 1, True)
+    assert fila.reservar_job("w1", 60) is None  # a2 não passa na frente de a1 durante o backoff
+    assert _status(a2)[0] == "pendente"
+
+
+def test_dead_letter_libera_o_chat(fila):
+    a1 = fila.enfileirar_job("text", 1, {"n": 1}, max_tentativas=1)
+    a2 = fila.enfileirar_job("text", 1, {"n": 2})
+
+    job = fila.reservar_job("w1", 60)
+    assert fila.falhar_job(job, RuntimeError("sem conserto"), backoff_base=0, backoff_max=0) is True
+
+    assert _status(a1)[0] == "morto"
+    assert fila.reservar_job("w1", 60)["id"] == a2
+    assert fila.reenfileirar_mortos() == 1
+
+
+def test_visibilidade_expirada_devolve_o_job(fila):
+    a1 = fila.enfileirar_job("text", 1, {"n": 1})
+    fila.reservar_job("w1", 0)  # O worker "morre" com o job reservado
+
+    job = fila.reservar_job("w2", 60)
+    assert (job["id"], job["tentativas"]) == (a1, 2)
+
+
+def test_update_repetido_nao_vira_outro_job(fila):
+    assert fila.enfileirar_job("text", 1, {"n": 1}, update_id=10) is not None
+    assert fila.enfileirar_job("text", 1, {"n": 1}, update_id=10) is None
+
+
+def _responder_pendente(chat_id):
+    with _conexao_teste() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM jobs_webhook WHERE chat_id=%s AND tipo='responder' AND status='pendente'",
+                    (str(chat_id),))
+        return [row[0] for row in cur.fetchall()]
+
+
+def test_resposta_espera_os_updates_do_chat(fila):
+    a1 = fila.enfileirar_job("text", 1, {"n": 1})
+    assert fila.reservar_job("w1", 60)["id"] == a1
+    fila.agendar_resposta(1, 0)
+    fila.agendar_resposta(1, 0)  # Mensagem seguida: adia a mesma resposta
+    resposta = _responder_pendente(1)
+    assert len(resposta) == 1
+
+    assert fila.reservar_job("w2", 60) is None  # a1 ainda não gravou a mensagem
+    fila.concluir_job(a1)
+    job = fila.reservar_job("w2", 60)
+    assert (job["id"], job["tipo"], job["payload"]) == (resposta[0], "responder", {"chat_id": 1})
+
+
+def test_resposta_pendente_nao_segura_updates_novos(fila):
+    fila.agendar_resposta(1, 60)
+    a2 = fila.enfileirar_job("text", 1, {"n": 2})
+    assert fila.reservar_job("w1", 60)["id"] == a2
+
+
+def test_resposta_nova_espera_a_que_esta_executando(fila):
+    fila.agendar_resposta(1, 0)
+    em_execucao = fila.reservar_job("w1", 60)
+    fila.agendar_resposta(1, 0)  # Mensagem chegou durante a resposta
+    assert fila.reservar_job("w2", 60) is None
+
+    # Se a resposta em execução falha, a agendada depois dela já cobre as mesmas mensagens
+    assert fila.falhar_job(em_execucao, RuntimeError("OpenAI fora"), backoff_base=0, backoff_max=0) is False
+    assert _status(em_execucao["id"]) is None
+    assert fila.reservar_job("w2", 60)["tipo"] == "responder"
+
+
+def test_fotos_do_album_viram_um_job_so(fila):
+    foto1 = {"message_id": 1, "media_group_id": "g1", "photo": []}
+    foto2 = {"message_id": 2, "media_group_id": "g1", "photo": []}
+    fila.enfileirar_foto_de_album(1, foto1, 0)
+    fila.enfileirar_foto_de_album(1, foto2, 0)
+    fila.enfileirar_foto_de_album(1, foto1, 0)  # Reenvio do Telegram
+    texto = fila.enfileirar_job("text", 1, {"n": 1})
+
+    job = fila.reservar_job("w1", 60)
+    assert job["tipo"] == "album"
+    assert job["payload"]["mensagens"] == [foto1, foto2]
+    assert fila.reservar_job("w2", 60) is None  # A mensagem seguinte espera o álbum
+    fila.concluir_job(job["id"])
+    assert fila.reservar_job("w2", 60)["id"] == texto
@@ -0,0 +1,23 @@
+from app.utils.paragrafos import iterar_paragrafos
+
+
+def test_gera_cada_paragrafo_quando_a_quebra_dupla_chega():
+    gerados = []
+
+    def pedacos():
+        yield "Lave o arroz"
+        yield ".\n"
+        assert gerados == []  # Um \n só não fecha o parágrafo
+        yield "\nRefogue o alho."
+        assert gerados == ["Lave o arroz."]
+        yield "\n\n\n\n  Cozinhe por 20 minutos.  "
+
+    for paragrafo in iterar_paragrafos(pedacos()):
+        gerados.append(paragrafo)
+
+    assert gerados == ["Lave o arroz.", "Refogue o alho.", "Cozinhe por 20 minutos."]
+
+
+def test_sem_quebra_dupla_gera_o_texto_inteiro_e_ignora_vazio():
+    assert list(iterar_paragrafos(["Só uma ", "linha.\nOutra."])) == ["Só uma linha.\nOutra."]
+    assert list(iterar_paragrafos(["", "  \n\n", "\n"])) == []
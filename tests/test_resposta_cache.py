@@ -0,0 +1,34 @@
+from app.utils.resposta_cache import RespostaCache, chave_resposta
+
+SISTEMA = {"role": "system", "content": "Você é um chef."}
+
+
+def _pergunta(texto):
+    return [SISTEMA, {"role": "user", "content": texto}]
+
+
+def test_perguntas_iguais_a_menos_de_espacos_e_pontuacao_tem_a_mesma_chave():
+    chave = chave_resposta("gpt-4o-mini", _pergunta("O que faço com  frango e arroz?"), 1)
+    assert chave == chave_resposta("gpt-4o-mini", _pergunta("o que faço com frango e arroz"), 1)
+    assert chave != chave_resposta("gpt-4o", _pergunta("o que faço com frango e arroz"), 1)
+    assert chave != chave_resposta("gpt-4o-mini", _pergunta("o que faço com frango e feijão"), 1)
+
+
+def test_conversa_longa_ou_multimodal_nao_usa_o_cache():
+    conversa = _pergunta("Oi") + [{"role": "assistant", "content": "Olá!"}, {"role": "user", "content": "Tudo bem?"}]
+    assert chave_resposta("gpt-4o-mini", conversa, 1) is None
+    assert chave_resposta("gpt-4o-mini", conversa, 3) is not None
+
+    foto = [SISTEMA, {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "u"}}]}]
+    assert chave_resposta("gpt-4o-mini", foto, 1) is None
+    assert chave_resposta("gpt-4o-mini", [SISTEMA], 1) is None
+
+
+def test_recorte_do_historico_nao_vira_abertura():
+    cache = RespostaCache(max_mensagens=1)
+    # Depois do recorte por orçamento sobrou só a última mensagem, mas a conversa tinha três
+    assert cache.chave("gpt-4o-mini", _pergunta("Oi"), tamanho_historico=3) is None
+    chave = cache.chave("gpt-4o-mini", _pergunta("Oi"), tamanho_historico=1)
+    cache.definir(chave, "Olá!")
+    assert cache.obter(chave) == "Olá!"
+    assert cache.estatisticas()["ignoradas"] == 1
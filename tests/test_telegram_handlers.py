@@ -0,0 +1,128 @@
+import importlib
+import sys
+import types
+from concurrent.futures import Future
+
+import pytest
+
+
+
+class Conversa:
+    """Histórico e envios de um chat, no lugar do banco e do Telegram."""
+
+    def __init__(self):
+        self.historico = []
+        self.enviados = []
+        self.respostas = []  # Cada item é a lista de pedaços de uma chamada à OpenAI; uma Exception falha ali
+        self.agendada = False  # Se há outro job 'responder' pendente para o chat
+        self.respondida_ate = None
+
+    def registrar(self, role, content):
+        self.historico.append({"id": len(self.historico) + 1, "role": role, "content": content})
+
+    def gerar_resposta_stream(self, historico, resumo=None, relancar=False):
+        for pedaco in self.respostas.pop(0):
+            if isinstance(pedaco, Exception):
+                raise pedaco
+            if callable(pedaco):  # Algo que acontece enquanto a resposta é gerada
+                pedaco()
+                continue
+            yield pedaco
+
+    def marcar_resposta_seguinte(self, chat_id):
+        if self.agendada:
+            self.respondida_ate = self.historico[-1]["id"]
+
+    def agendar_mensagem_telegram(self, chat_id, texto):
+        self.enviados.append(texto)
+        futuro = Future()
+        futuro.set_result(None)
+        return futuro
+
+
+def _modulo(nome, **atributos):
+    modulo = types.ModuleType(nome)
+    modulo.__dict__.update(atributos)
+    return modulo
+
+
+@pytest.fixture
+def conversa(monkeypatch):
+    # Os módulos que telegram_handlers importa e que abrem conexões (Supabase, OpenAI, Telegram) ao serem
+    # importados são trocados por módulos só com os nomes usados, ligados ao estado da Conversa.
+    conversa = Conversa()
+    nada = lambda *args, **kwargs: None
+    falsos = [
+        _modulo("app.utils.supabase_client", upload_bytes_to_supabase=nada, SUPABASE_LIBRARY_URL=""),
+        _modulo("app.agent_logic", gerar_resposta_stream=conversa.gerar_resposta_stream,
+                janela_do_prompt=lambda historico, resumo: historico),
+        _modulo("app.utils.resumo", buscar_resumo=nada, registrar_turno=nada),
+        _modulo("app.utils.helpers", registrar_e_buscar_historico=nada, registrar_mensagens=nada,
+                registrar_resposta=lambda user_id, resposta: conversa.registrar("assistant", resposta),
+                buscar_historico=lambda user_id: list(conversa.historico), get_file_url_telegram=nada,
+                baixar_arquivo=nada, substituir_imagem_no_historico=nada),
+        _modulo("app.utils.envio_telegram", agendar_mensagem_telegram=conversa.agendar_mensagem_telegram),
+        _modulo("app.utils.job_queue", agendar_resposta=nada, enfileirar_foto_de_album=nada,
+                resposta_agendada=lambda chat_id: conversa.agendada,
+                marcar_resposta_seguinte=conversa.marcar_resposta_seguinte),
+        _modulo("app.utils.midia_cache", buscar_midia=nada, registrar_midia=nada, sha256_do_buffer=nada),
+        _modulo("app.utils.midia_pendente", marcar_pendente=nada, concluir_pendente=nada),
+        _modulo("app.utils.descricoes", obter_descricao=nada),
+        _modulo("app.utils.transcricao", transcrever=nada, verificar_tamanho=nada, AudioGrandeDemais=Exception),
+        _modulo("app.utils.imagens", escolher_tamanho_foto=nada, reduzir_imagem=nada, tokens_visao=nada,
+                registrar_economia=nada),
+    ]
+    for modulo in falsos:
+        monkeypatch.setitem(sys.modules, modulo.__name__, modulo)
+    monkeypatch.delitem(sys.modules, "app.telegram_handlers", raising=False)
+    conversa.handlers = importlib.import_module("app.telegram_handlers")
+    yield conversa
+    sys.modules.pop("app.telegram_handlers", None)
+
+
+def test_resposta_da_fila_que_falha_no_meio_e_refeita_inteira(conversa):
+    conversa.registrar("user", "Como faço arroz?")
+    conversa.respostas = [
+        ["Lave o arroz.", "\n\n", "Refogue", RuntimeError("stream interrompido")],
+        ["Lave o arroz.", "\n\n", "Refogue o alho e cozinhe."],
+    ]
+
+    with pytest.raises(RuntimeError):
+        conversa.handlers.responder_da_fila(1)
+    # Nada de resposta cortada no histórico: a nova tentativa do job ainda tem o que responder
+    assert [m["role"] for m in conversa.historico] == ["user"]
+
+    conversa.handlers.responder_da_fila(1)
+    assert conversa.historico[-1]["content"] == "Lave o arroz.\n\nRefogue o alho e cozinhe."
+
+    # Com a resposta gravada, o mesmo job devolvido pela visibilidade não responde de novo
+    conversa.handlers.responder_da_fila(1)
+    assert len(conversa.historico) == 2
+
+
+def test_mensagem_nova_no_meio_da_resposta_da_fila(conversa, monkeypatch):
+    monkeypatch.setattr(conversa.handlers, "FILA_CONFERIR_MENSAGEM_NOVA", 0)
+    conversa.registrar("user", "Como faço arroz?")
+
+    def chegar_mensagem():
+        conversa.registrar("user", "E o feijão?")
+        conversa.agendada = True
+
+    conversa.respostas = [
+        ["Lave o arroz.", "\n\n", chegar_mensagem, "Refogue o alho.", "\n\n", "Cozinhe."],
+        ["Deixe o feijão de molho."],
+    ]
+
+    conversa.handlers.responder_da_fila(1)
+    # Para no meio e guarda só o que foi enviado, depois da mensagem nova
+    assert conversa.enviados == ["Lave o arroz."]
+    assert [m["content"] for m in conversa.historico[1:]] == ["E o feijão?", "Lave o arroz."]
+
+    # A resposta agendada pela mensagem nova responde mesmo com o histórico terminando numa resposta
+    conversa.agendada = False
+    conversa.handlers.responder_da_fila(1, conversa.respondida_ate)
+    assert conversa.historico[-1]["content"] == "Deixe o feijão de molho."
+
+    # Devolvida pela visibilidade depois de responder, não responde de novo
+    conversa.handlers.responder_da_fila(1, conversa.respondida_ate)
+    assert len(conversa.historico) == 4
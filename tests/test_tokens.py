@@ -0,0 +1,25 @@
+from app.utils.tokens import TOKENS_IMAGEM, TOKENS_POR_MENSAGEM, estimar_tokens_mensagem, recortar_por_orcamento
+
+
+def _mensagem(role, texto):
+    return {"role": role, "content": texto}
+
+
+def test_mantem_as_mensagens_mais_recentes_que_cabem_no_orcamento():
+    historico = [_mensagem("user", "x" * 400), _mensagem("assistant", "y" * 40), _mensagem("user", "z" * 40)]
+    custo_curta = estimar_tokens_mensagem(historico[-1])
+
+    assert recortar_por_orcamento(historico, 2 * custo_curta) == historico[1:]
+    assert recortar_por_orcamento(historico, 2 * custo_curta - 1) == historico[2:]
+    assert recortar_por_orcamento(historico, 10_000) == historico
+
+
+def test_a_ultima_mensagem_fica_mesmo_acima_do_orcamento():
+    historico = [_mensagem("assistant", "Oi!"), _mensagem("user", "x" * 4000)]
+    assert recortar_por_orcamento(historico, 10) == historico[1:]
+    assert recortar_por_orcamento([], 10) == []
+
+
+def test_imagem_conta_pelo_detalhe():
+    foto = {"role": "user", "content": [{"type": "image_url", "image_url": {"url": "u", "detail": "low"}}]}
+    assert estimar_tokens_mensagem(foto) == TOKENS_POR_MENSAGEM + TOKENS_IMAGEM["low"]
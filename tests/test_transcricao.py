@@ -0,0 +1,33 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def transcricao(monkeypatch):
+    # transcricao importa de helpers só a chamada à API; helpers abre o pool do Supabase ao ser importado.
+    helpers = types.ModuleType("app.utils.helpers")
+    helpers.transcrever_audio = lambda arquivo: ""
+    monkeypatch.setitem(sys.modules, "app.utils.helpers", helpers)
+    monkeypatch.delitem(sys.modules, "app.utils.transcricao", raising=False)
+    yield importlib.import_module("app.utils.transcricao")
+    sys.modules.pop("app.utils.transcricao", None)
+
+
+def test_corta_no_silencio_mais_perto_de_cada_trecho(transcricao):
+    assert transcricao.pontos_de_corte(100, [40, 58, 85], 60) == [58]
+    # O próximo trecho conta a partir do corte anterior, não do múltiplo de 60
+    assert transcricao.pontos_de_corte(200, [55, 110, 125, 170], 60) == [55, 110, 170]
+
+
+def test_sem_silencio_perto_corta_seco(transcricao):
+    assert transcricao.pontos_de_corte(200, [], 60) == [60, 120, 180]
+    assert transcricao.pontos_de_corte(200, [10, 25], 60) == [60, 120, 180]
+
+
+def test_audio_curto_nao_e_dividido(transcricao):
+    # Até um trecho e um quarto vai inteiro, em vez de sobrar um pedaço muito curto no final
+    assert transcricao.pontos_de_corte(75, [30], 60) == []
+    assert transcricao.pontos_de_corte(0, [], 60) == []